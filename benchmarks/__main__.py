@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import sqlalchemy
+
+from comptabilite.db import get_engine
+
+from .data import generate
+from .suite import run_suite, slowest_statements
+
+# أحجام البيانات: عدد الزبائن، الموردين، السلع والفواتير
+SIZES = {
+    'petit': {'customers': 200, 'suppliers': 20, 'products': 500, 'invoices': 2000},
+    'moyen': {'customers': 2000, 'suppliers': 100, 'products': 5000, 'invoices': 20000},
+    'grand': {'customers': 10000, 'suppliers': 300, 'products': 20000, 'invoices': 100000},
+}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# تشغيل القياسات لكل حجم على قاعدة SQLite مؤقتة جديدة
+def run(sizes, only=None, seed=0, directory=None):
+    results = {
+        'commit': _commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'platform': platform.platform(),
+        'sizes': {},
+    }
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for size in sizes:
+            engine = get_engine(f"sqlite:///{os.path.join(tmp, f'bench_{size}.db')}")
+            print(f"[{size}] génération des données…", file=sys.stderr, flush=True)
+            start = time.perf_counter()
+            counts = generate(engine, seed=seed, **SIZES[size])
+            generation = time.perf_counter() - start
+            slowest_statements()  # لا تحسب استعلامات التوليد
+            print(f"[{size}] mesures…", file=sys.stderr, flush=True)
+            results['sizes'][size] = {
+                'data': counts,
+                'generation_s': round(generation, 2),
+                'operations': run_suite(engine, only, seed),
+                'slowest_statements': slowest_statements(),
+            }
+            engine.dispose()
+    return results
+
+
+# مقارنة الوسيط (median) لكل عملية مع نتائج سابقة
+def compare(current, baseline):
+    print(f"{'taille':<8}{'opération':<28}{'avant (ms)':>12}{'après (ms)':>12}{'ratio':>8}")
+    for size, data in current['sizes'].items():
+        before = baseline.get('sizes', {}).get(size, {}).get('operations', {})
+        for name, stats in data['operations'].items():
+            if name in before:
+                ratio = stats['median_ms'] / before[name]['median_ms'] if before[name]['median_ms'] else float('nan')
+                print(f"{size:<8}{name:<28}{before[name]['median_ms']:>12.2f}{stats['median_ms']:>12.2f}{ratio:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesurer les performances des opérations comptables (sans Streamlit).")
+    parser.add_argument('--tailles', default='petit', help=f"Tailles séparées par des virgules: {', '.join(SIZES)}")
+    parser.add_argument('--seulement', help="Ne mesurer que les opérations contenant ces mots (séparés par des virgules)")
+    parser.add_argument('--sortie', help="Fichier JSON des résultats (défaut: benchmark-<commit>.json)")
+    parser.add_argument('--comparer', help="Fichier JSON d'une exécution précédente à comparer")
+    parser.add_argument('--graine', type=int, default=0, help="Graine du générateur aléatoire")
+    args = parser.parse_args(argv)
+
+    sizes = [size.strip() for size in args.tailles.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"Taille inconnue: {', '.join(unknown)}")
+    only = [word.strip() for word in args.seulement.split(',')] if args.seulement else None
+
+    results = run(sizes, only, args.graine)
+    output = args.sortie or f"benchmark-{results['commit'] or 'local'}.json"
+    with open(output, 'w', encoding='utf-8') as result_file:
+        json.dump(results, result_file, indent=2, ensure_ascii=False)
+    print(f"Résultats enregistrés dans {output}", file=sys.stderr)
+
+    if args.comparer:
+        with open(args.comparer, encoding='utf-8') as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == '__main__':
+    main()
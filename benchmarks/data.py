@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+
+from comptabilite.db import bootstrap
+from comptabilite.models import (Customer, Invoice, InvoiceCounter, InvoiceItem, Product, PurchaseInvoice, PurchaseLot,
+                                 StockMovement, Supplier, TraderInfo)
+from comptabilite.money import from_cents
+from comptabilite.numbering import DEFAULT_SERIES, format_number
+from comptabilite.stock import PURCHASE, SALE
+from comptabilite.taxes import CASH, compute_invoice, stamp_tax_on
+
+PAYMENT_METHODS = np.array([CASH, "Chèque", "Virement bancaire"])
+TAX_RATES = np.array([0, 9, 19])
+BATCH = 10000
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), BATCH):
+        yield rows[start:start + BATCH]
+
+
+def _insert(conn, model, rows):
+    for chunk in _chunks(rows):
+        conn.execute(insert(model), chunk)
+
+
+# توليد قاعدة بيانات اصطناعية واقعية: شعبية السلع غير متساوية (Zipf) وعدد السطور في الفاتورة منحرف
+# (أغلب الفواتير من 1 إلى 3 سطور وبعضها يصل إلى 40)، والمبالغ محسوبة بنفس محرك الضرائب
+def generate(engine, customers=1000, suppliers=50, products=2000, invoices=10000, days=365, seed=0):
+    rng = np.random.default_rng(seed)
+    bootstrap(engine)
+    start = datetime.now() - timedelta(days=days)
+
+    # السلع: سعر شراء لوغاريتمي طبيعي وهامش بين 10% و 60%
+    purchase = np.round(rng.lognormal(mean=6.0, sigma=1.0, size=products) * 100).astype(np.int64)
+    selling = np.round(purchase * rng.uniform(1.1, 1.6, size=products)).astype(np.int64)
+    rates = rng.choice(TAX_RATES, size=products, p=[0.2, 0.3, 0.5])
+
+    # الفواتير والسطور
+    line_counts = np.minimum(rng.geometric(0.4, size=invoices), 40)
+    invoice_of_line = np.repeat(np.arange(invoices), line_counts)
+    popularity = 1 / np.arange(1, products + 1) ** 1.1
+    popularity = rng.permutation(popularity / popularity.sum())
+    lines = pd.DataFrame({
+        'invoice': invoice_of_line,
+        'product': rng.choice(products, size=len(invoice_of_line), p=popularity),
+        'quantity': rng.geometric(0.5, size=len(invoice_of_line)),
+    }).drop_duplicates(['invoice', 'product'], ignore_index=True)
+    totals = compute_invoice(
+        [from_cents(price) for price in selling[lines['product']]], lines['quantity'], rates[lines['product']],
+    )
+    lines['ht'], lines['tax'], lines['ttc'] = totals.line_ht, totals.line_tax, totals.line_ttc
+    per_invoice = lines.groupby('invoice')[['ht', 'tax', 'ttc']].sum().reindex(range(invoices), fill_value=0)
+    methods = rng.choice(PAYMENT_METHODS, size=invoices, p=[0.5, 0.3, 0.2])
+    stamp = np.where(methods == CASH, stamp_tax_on(per_invoice['ttc'].to_numpy()), 0)
+    dates = np.sort(rng.uniform(0, days * 86400, size=invoices))
+    invoice_dates = [start + timedelta(seconds=float(seconds)) for seconds in dates]
+    # الترقيم القانوني المتسلسل داخل كل سنة، كما يفعله issue_invoice
+    years = pd.Series([when.year for when in invoice_dates])
+    sequences = years.groupby(years).cumcount() + 1
+    invoice_customers = rng.integers(1, customers + 1, size=invoices)
+
+    sold = np.bincount(lines['product'], weights=lines['quantity'], minlength=products).astype(np.int64)
+    opening = sold + rng.integers(50, 500, size=products)
+    # كل سلعة تدخل بدفعة واحدة من فاتورة شراء لمورد، فتكلفة المبيعات هي ثمن الشراء (FIFO و CMUP متساويان)
+    product_suppliers = rng.integers(1, suppliers + 1, size=products)
+
+    with engine.begin() as conn:
+        _insert(conn, TraderInfo, [{'name': "Commerce de démonstration", 'commercial_register': "16/00-1234567B21",
+                                    'tax_number': "000016123456789", 'statistical_number': "1234567890",
+                                    'material_number': "16012345678"}])
+        _insert(conn, Customer, [
+            {'name': f"Client {i}", 'address': f"{i} rue de la Liberté, Alger", 'phone': f"05{i:08d}",
+             'commercial_register': f"16/00-{i:07d}B21", 'tax_number': f"{i:015d}", 'statistical_number': None,
+             'material_number': None}
+            for i in range(1, customers + 1)
+        ])
+        _insert(conn, Supplier, [
+            {'name': f"Fournisseur {i}", 'address': "Oran", 'commercial_register': f"31/00-{i:07d}B20",
+             'tax_number': f"31{i:013d}", 'statistical_number': None, 'material_number': None}
+            for i in range(1, suppliers + 1)
+        ])
+        _insert(conn, Product, [
+            {'id': i + 1, 'code': f"P{i:06d}", 'name': f"Produit {i} {['standard', 'premium', 'lot'][i % 3]}",
+             'purchase_price': from_cents(purchase[i]), 'selling_price': from_cents(selling[i]),
+             'tax_rate': float(rates[i]), 'quantity': int(opening[i] - sold[i]), 'entry_date': start,
+             'purchase_invoice_number': f"FA-{product_suppliers[i]:05d}", 'purchase_invoice_date': start,
+             'stock_value': from_cents(purchase[i] * (opening[i] - sold[i]))}
+            for i in range(products)
+        ])
+        _insert(conn, PurchaseInvoice, [
+            {'id': i, 'supplier_id': i, 'number': f"FA-{i:05d}", 'date': start, 'entry_date': start}
+            for i in range(1, suppliers + 1)
+        ])
+        _insert(conn, PurchaseLot, [
+            {'purchase_invoice_id': int(product_suppliers[i]), 'product_id': i + 1, 'quantity': int(opening[i]),
+             'remaining': int(opening[i] - sold[i]), 'unit_cost': from_cents(purchase[i]), 'date': start}
+            for i in range(products)
+        ])
+        _insert(conn, StockMovement, [
+            {'product_id': i + 1, 'quantity': int(opening[i]), 'kind': PURCHASE, 'reference': f"FA-{product_suppliers[i]:05d}",
+             'invoice_id': None, 'date': start}
+            for i in range(products)
+        ])
+        _insert(conn, Invoice, [
+            {'id': i + 1, 'customer_id': int(invoice_customers[i]), 'date': invoice_dates[i],
+             'number': format_number(int(years[i]), int(sequences[i])), 'payment_method': str(methods[i]),
+             'total_ht': from_cents(per_invoice['ht'].iat[i]), 'total_tax': from_cents(per_invoice['tax'].iat[i]),
+             'stamp_tax': from_cents(stamp[i]), 'total_amount': from_cents(per_invoice['ttc'].iat[i] + stamp[i])}
+            for i in range(invoices)
+        ])
+        _insert(conn, InvoiceItem, [
+            {'invoice_id': int(line.invoice) + 1, 'product_id': int(line.product) + 1, 'quantity': int(line.quantity),
+             'price': from_cents(selling[line.product]), 'tax_rate': float(rates[line.product]),
+             'total_ht': from_cents(line.ht), 'tax_amount': from_cents(line.tax), 'total_ttc': from_cents(line.ttc),
+             'cost': from_cents(purchase[line.product] * line.quantity)}
+            for line in lines.itertuples()
+        ])
+        _insert(conn, StockMovement, [
+            {'product_id': int(line.product) + 1, 'quantity': -int(line.quantity), 'kind': SALE,
+             'reference': format_number(int(years[line.invoice]), int(sequences[line.invoice])), 'invoice_id': int(line.invoice) + 1,
+             'date': invoice_dates[line.invoice]}
+            for line in lines.itertuples()
+        ])
+        _insert(conn, InvoiceCounter, [
+            {'year': int(year), 'series': DEFAULT_SERIES, 'last_number': int(count)}
+            for year, count in years.value_counts().items()
+        ])
+    return {'customers': customers, 'suppliers': suppliers, 'products': products, 'invoices': invoices,
+            'invoice_items': len(lines)}
@@ -0,0 +1,116 @@
+import random
+import statistics
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from comptabilite.customers import search_customers
+from comptabilite.db import session_scope
+from comptabilite.instrumentation import recorder
+from comptabilite.invoices import PAYMENT_METHODS, get_invoice, issue_invoice, list_invoices
+from comptabilite.models import Invoice, Product, TraderInfo
+from comptabilite.products import search_products
+from comptabilite.renderer import InvoiceView, PartyView, draw_invoice
+from comptabilite.reports import GROUPINGS, sales_report, stamp_tax_report
+from comptabilite.stock import list_stock, stock_as_of, stock_totals
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+# قياس عملية: كل تمريرة مجال (span) من instrumentation يعطي المدة وعدد الاستعلامات وزمنها،
+# ثم تمريرة أخيرة تحت tracemalloc لذروة الذاكرة (لأنه يبطئ التنفيذ)
+def measure(name, operation, repeat):
+    operation()  # تسخين: ذاكرة SQLite المؤقتة، الخطوط، الاستعلامات المترجمة
+    spans = []
+    for _ in range(repeat):
+        with recorder.span(f"benchmark.{name}") as span:
+            operation()
+        spans.append(span)
+    timings = [span.ms for span in spans]
+
+    tracemalloc.start()
+    operation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'runs': repeat,
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': spans[-1].queries,
+        'sql_ms': round(statistics.median(span.sql_ms for span in spans), 3),
+        'peak_memory_kib': round(peak / 1024, 1),
+    }
+
+
+# العمليات الأساسية كما تستدعيها الواجهة، كل واحدة في جلسة قصيرة خاصة بها
+def operations(engine, seed=0):
+    rng = random.Random(seed)
+    with session_scope(engine) as session:
+        invoice_count = session.execute(select(func.max(Invoice.id))).scalar()
+        products = session.execute(select(Product.id).where(Product.quantity > 10)).scalars().all()
+        customer = 1
+        trader = PartyView.from_record(session.query(TraderInfo).first())
+        sample_view = InvoiceView.from_invoice(get_invoice(session, invoice_count // 2), trader)
+        middle = session.execute(select(Invoice.date).where(Invoice.id == invoice_count // 2)).scalar()
+
+    def run(function):
+        def wrapper():
+            with session_scope(engine) as session:
+                return function(session)
+        return wrapper
+
+    def issue(session):
+        lines = [(product_id, 1) for product_id in rng.sample(products, 3)]
+        issue_invoice(session, customer, lines, rng.choice(PAYMENT_METHODS))
+
+    def detail(session):
+        invoice = get_invoice(session, rng.randint(1, invoice_count))
+        return InvoiceView.from_invoice(invoice, trader)
+
+    def pages(session, count=10):
+        cursor = None
+        for _ in range(count):
+            rows, cursor = list_invoices(session, after=cursor)
+            if cursor is None:
+                break
+
+    ops = {
+        'emission_facture': (run(issue), 30),
+        'liste_factures': (run(lambda s: list_invoices(s)), 30),
+        'liste_factures_10_pages': (run(pages), 10),
+        'liste_factures_client': (run(lambda s: list_invoices(s, customer="Client 1")), 10),
+        'detail_facture': (run(detail), 30),
+        'stock_totaux': (run(stock_totals), 10),
+        'stock_a_date': (run(lambda s: stock_as_of(s, middle)), 5),
+        'stock_page': (run(lambda s: list_stock(s)), 30),
+        'recherche_produit': (run(lambda s: search_products(s, "Produit 12")), 30),
+        'recherche_client': (run(lambda s: search_customers(s, "client 12")), 30),
+        'pdf_facture': (lambda: draw_invoice(sample_view), 10),
+        'rapport_timbre': (lambda: stamp_tax_report(engine), 5),
+    }
+    date_from = (datetime.now() - timedelta(days=90)).date()
+    for grouping in GROUPINGS:
+        ops[f"rapport_{grouping.lower().replace(' ', '_')}"] = (lambda grouping=grouping: sales_report(engine, grouping, date_from), 5)
+    return ops
+
+
+def run_suite(engine, only=None, seed=0):
+    results = {}
+    for name, (operation, repeat) in operations(engine, seed).items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        results[name] = measure(name, operation, repeat)
+    return results
+
+
+# أبطأ الاستعلامات أثناء القياسات، لكل حجم
+def slowest_statements():
+    statements = recorder.slowest()
+    recorder.reset()
+    return statements
@@ -0,0 +1,310 @@
+from dataclasses import asdict
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Response
+from pydantic import BaseModel, Field, model_validator
+
+from .archive import browse_invoices, get_invoice_view
+from .customers import FIELDS as CUSTOMER_FIELDS, create_customer, customer_search, get_customer, update_customer
+from .db import init_db, session_scope
+from .export import pdf_filename
+from .invoices import InsufficientStock, InvoiceError, InvoiceNotIssued, issue_invoice, issue_invoices
+from .products import enter_product, get_products_by_codes, search_products
+from .purchases import PurchaseError, get_purchase_invoice, list_purchase_invoices, record_purchase
+from .renderer import InvoiceRenderer
+from .stock import list_stock, stock_totals
+
+# واجهة HTTP للصناديق وقارئات الباركود: نفس طبقة الخدمات التي تستعملها واجهة Streamlit
+# التشغيل: uvicorn comptabilite.api:app --workers 4
+# كل نقاط النهاية دوال عادية (def) فينفذها FastAPI في مجمع الخيوط دون حجب حلقة asyncio
+app = FastAPI(title="BDcomptabilite", version="1.0")
+
+renderer = InvoiceRenderer()
+
+
+@lru_cache(maxsize=None)
+def _engine():
+    return init_db()
+
+
+# جلسة قصيرة لكل طلب
+def get_session():
+    with session_scope(_engine()) as session:
+        yield session
+
+
+# المبالغ كنصوص عشرية ("1189.99") حتى لا تمر بالأعداد العشرية الثنائية
+def _plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _row(row):
+    return _plain(dict(row._mapping))
+
+
+def _product(product):
+    return _plain({'id': product.id, 'code': product.code, 'name': product.name, 'selling_price': product.selling_price,
+                   'tax_rate': product.tax_rate, 'quantity': product.quantity})
+
+
+def _customer(customer):
+    return {'id': customer.id, **{field: getattr(customer, field) for field in CUSTOMER_FIELDS}}
+
+
+def _invoice_summary(invoice):
+    return _plain({'id': invoice.id, 'number': invoice.number, 'date': invoice.date, 'payment_method': invoice.payment_method,
+                   'total_ht': invoice.total_ht, 'total_tax': invoice.total_tax, 'stamp_tax': invoice.stamp_tax,
+                   'total_amount': invoice.total_amount})
+
+
+def _invoice_view(session, invoice_id):
+    view = get_invoice_view(session, invoice_id)
+    if view is None:
+        raise HTTPException(404, f"Facture introuvable: {invoice_id}")
+    return view
+
+
+def _purchase(purchase):
+    return _plain({
+        'id': purchase.id, 'number': purchase.number, 'date': purchase.date, 'supplier_id': purchase.supplier_id,
+        'supplier': purchase.supplier.name if purchase.supplier else None,
+        'lots': [{'product_id': lot.product_id, 'code': lot.product.code, 'quantity': lot.quantity,
+                  'remaining': lot.remaining, 'unit_cost': lot.unit_cost} for lot in purchase.lots],
+    })
+
+
+# نقص المخزون أو تعارض في القاعدة تعارض مع حالتها (409)، وخطأ القاعدة الآخر داخلي (500)،
+# وباقي أخطاء الفاتورة طلب غير صالح (400)
+def _invoice_error(error):
+    if isinstance(error, InvoiceNotIssued):
+        return HTTPException(409 if error.conflict else 500, str(error))
+    return HTTPException(409 if isinstance(error, InsufficientStock) else 400, str(error))
+
+
+class CustomerIn(BaseModel):
+    name: str
+    address: str | None = None
+    phone: str | None = None
+    commercial_register: str | None = None
+    tax_number: str | None = None
+    statistical_number: str | None = None
+    material_number: str | None = None
+
+
+class ProductEntry(BaseModel):
+    code: str
+    name: str
+    purchase_price: Decimal = Field(ge=0)
+    selling_price: Decimal = Field(ge=0)
+    tax_rate: float = 0
+    quantity: int = Field(ge=0)
+    purchase_invoice_number: str | None = None
+    purchase_invoice_date: date | None = None
+    supplier_id: int | None = None
+
+
+# سطر يشير إلى سلعة بمعرفها أو برمزها، وأحدهما إلزامي (وإلا 422)
+class ProductReference(BaseModel):
+    product_id: int | None = None
+    code: str | None = None
+
+    @model_validator(mode='after')
+    def _product_or_code(self):
+        if self.product_id is None and not self.code:
+            raise ValueError("product_id ou code est obligatoire")
+        return self
+
+
+class InvoiceLine(ProductReference):
+    quantity: int = Field(gt=0)
+
+
+class InvoiceIn(BaseModel):
+    customer_id: int
+    payment_method: str
+    series: str = Field('', pattern=r'^[A-Z0-9]*$', max_length=5)
+    lines: list[InvoiceLine]
+
+
+class InvoiceBatch(BaseModel):
+    invoices: list[InvoiceIn] = Field(max_length=500)
+
+
+class PurchaseLine(ProductReference):
+    quantity: int = Field(gt=0)
+    unit_cost: Decimal = Field(ge=0)
+
+
+class PurchaseIn(BaseModel):
+    supplier_id: int | None = None
+    number: str | None = None
+    date: datetime | None = None
+    lines: list[PurchaseLine]
+
+
+# السطور بالمعرف أو بالرمز (قارئ الباركود): كل الرموز تحول إلى معرفات باستعلام IN واحد
+def _products_by_code(session, lines):
+    return get_products_by_codes(session, {line.code for line in lines if line.product_id is None})
+
+
+def _product_ids(lines, products):
+    product_ids = []
+    for line in lines:
+        product_id = line.product_id
+        if product_id is None:
+            product = products.get(line.code)
+            if product is None:
+                raise HTTPException(404, f"Produit introuvable: {line.code}")
+            product_id = product.id
+        product_ids.append(product_id)
+    return product_ids
+
+
+def _order(order, products):
+    lines = [(product_id, line.quantity) for product_id, line in zip(_product_ids(order.lines, products), order.lines)]
+    return order.customer_id, lines, order.payment_method, order.series
+
+
+@app.get("/clients")
+def customers_search(q: str = "", limit: int = Query(20, ge=1, le=100), session=Depends(get_session)):
+    return [_row(row) for row in customer_search.search(session, q, limit)]
+
+
+@app.get("/clients/{customer_id}")
+def customer_detail(customer_id: int, session=Depends(get_session)):
+    customer = get_customer(session, customer_id)
+    if customer is None:
+        raise HTTPException(404, f"Client introuvable: {customer_id}")
+    return _customer(customer)
+
+
+@app.post("/clients", status_code=201)
+def customer_create(values: CustomerIn, session=Depends(get_session)):
+    return _customer(create_customer(session, **values.model_dump()))
+
+
+@app.put("/clients/{customer_id}")
+def customer_update(customer_id: int, values: CustomerIn, session=Depends(get_session)):
+    customer = get_customer(session, customer_id)
+    if customer is None:
+        raise HTTPException(404, f"Client introuvable: {customer_id}")
+    return _customer(update_customer(session, customer, **values.model_dump()))
+
+
+@app.get("/produits")
+def products_search(q: str, limit: int = Query(20, ge=1, le=100), session=Depends(get_session)):
+    return [_product(product) for product in search_products(session, q, limit)]
+
+
+@app.get("/produits/{code}")
+def product_detail(code: str, session=Depends(get_session)):
+    product = get_products_by_codes(session, [code]).get(code)
+    if product is None:
+        raise HTTPException(404, f"Produit introuvable: {code}")
+    return _product(product)
+
+
+@app.post("/produits", status_code=201)
+def product_entry(entry: ProductEntry, session=Depends(get_session)):
+    return _product(enter_product(session, **entry.model_dump()))
+
+
+@app.get("/achats")
+def purchases_list(supplier_id: int | None = None, limit: int = Query(50, ge=1, le=200), session=Depends(get_session)):
+    return [_row(row) for row in list_purchase_invoices(session, supplier_id, limit)]
+
+
+@app.get("/achats/{purchase_id}")
+def purchase_detail(purchase_id: int, session=Depends(get_session)):
+    purchase = get_purchase_invoice(session, purchase_id)
+    if purchase is None:
+        raise HTTPException(404, f"Facture d'achat introuvable: {purchase_id}")
+    return _purchase(purchase)
+
+
+# فاتورة مورد كاملة: دفعة لكل سطر بتكلفته، ونفس الرقم لنفس المورد يكمل الفاتورة الموجودة
+@app.post("/achats", status_code=201)
+def purchase_create(purchase: PurchaseIn, session=Depends(get_session)):
+    product_ids = _product_ids(purchase.lines, _products_by_code(session, purchase.lines))
+    lines = [(product_id, line.quantity, line.unit_cost) for product_id, line in zip(product_ids, purchase.lines)]
+    try:
+        invoice = record_purchase(session, purchase.supplier_id, purchase.number, lines, purchase.date)
+    except PurchaseError as error:
+        raise HTTPException(400, str(error))
+    return _purchase(get_purchase_invoice(session, invoice.id))
+
+
+@app.get("/stock")
+def stock_page(search: str | None = None, after: str | None = None, limit: int = Query(50, ge=1, le=500),
+               session=Depends(get_session)):
+    rows, next_cursor = list_stock(session, search=search, after=after, limit=limit)
+    return {'products': [_row(row) for row in rows], 'next': next_cursor}
+
+
+@app.get("/stock/totaux")
+def stock_summary(session=Depends(get_session)):
+    return _row(stock_totals(session))
+
+
+@app.get("/factures")
+def invoices_page(date_from: date | None = None, date_to: date | None = None, customer: str | None = None,
+                  payment_method: str | None = None, number: str | None = None, after_date: datetime | None = None, after_id: int | None = None,
+                  limit: int = Query(20, ge=1, le=100), session=Depends(get_session)):
+    after = (after_date, after_id) if after_date and after_id else None
+    rows, next_cursor = browse_invoices(session, date_from, date_to, customer, payment_method, number=number,
+                                        after=after, limit=limit)
+    return {
+        'invoices': [_row(row) for row in rows],
+        'next': _plain({'after_date': next_cursor[0], 'after_id': next_cursor[1]}) if next_cursor else None,
+    }
+
+
+@app.post("/factures", status_code=201)
+def invoice_create(order: InvoiceIn, session=Depends(get_session)):
+    customer_id, lines, payment_method, series = _order(order, _products_by_code(session, order.lines))
+    try:
+        invoice = issue_invoice(session, customer_id, lines, payment_method, series)
+    except InvoiceError as error:
+        raise _invoice_error(error)
+    return _invoice_summary(invoice)
+
+
+# إصدار دفعة من الفواتير: كل فاتورة مستقلة، والنتيجة بنفس ترتيب الطلب مع الخطأ عند الرفض
+# رموز كل الدفعة في استعلام واحد، والفاتورة ذات الرمز المجهول وحدها ترفض (404)
+@app.post("/factures/lot")
+def invoice_batch(batch: InvoiceBatch, session=Depends(get_session)):
+    products = _products_by_code(session, [line for order in batch.invoices for line in order.lines])
+    results, orders = {}, {}
+    for index, order in enumerate(batch.invoices):
+        try:
+            orders[index] = _order(order, products)
+        except HTTPException as error:
+            results[index] = {'index': index, 'status': error.status_code, 'error': error.detail}
+    for index, result in zip(orders, issue_invoices(session, list(orders.values()))):
+        if isinstance(result, InvoiceError):
+            results[index] = {'index': index, 'status': _invoice_error(result).status_code, 'error': str(result)}
+        else:
+            results[index] = {'index': index, 'status': 201, **_invoice_summary(result)}
+    return [results[index] for index in range(len(batch.invoices))]
+
+
+@app.get("/factures/{invoice_id}")
+def invoice_detail(invoice_id: int, session=Depends(get_session)):
+    return _plain(asdict(_invoice_view(session, invoice_id)))
+
+
+@app.get("/factures/{invoice_id}/pdf")
+def invoice_pdf(invoice_id: int, session=Depends(get_session)):
+    view = _invoice_view(session, invoice_id)
+    return Response(renderer.render(view), media_type="application/pdf",
+                    headers={'Content-Disposition': f'attachment; filename="{pdf_filename(view.number)}"'})
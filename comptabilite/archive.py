@@ -0,0 +1,281 @@
+import argparse
+import os
+import sys
+from datetime import date, datetime
+from functools import lru_cache
+
+from sqlalchemy import create_engine, delete, func, insert, inspect, select, text, type_coerce, update
+
+from .config import ARCHIVE_DIR, DATABASE_URL
+from .db import init_db, session_scope, upgrade_schema
+from .instrumentation import instrument_engine
+from .invoices import get_invoice, list_invoices
+from .models import Base, Customer, FiscalYear, Invoice, InvoiceItem, Product, StockMovement, TraderInfo
+from .money import Money, cents
+from .numbering import number_year
+from .renderer import InvoiceView
+
+BATCH = 5000
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_name(year):
+    return f"compta_{year}.db"
+
+
+def _archive_path(name):
+    return os.path.abspath(os.path.join(ARCHIVE_DIR, name))
+
+
+def _read_only_engine(path):
+    return create_engine(f"sqlite:///file:{path}?mode=ro&uri=true", connect_args={'check_same_thread': False})
+
+
+def _outdated(engine):
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            return True
+        if {column.name for column in table.columns} - {c['name'] for c in inspector.get_columns(table.name)}:
+            return True
+    return False
+
+
+# محرك للقراءة فقط لكل ملف أرشيف، ينشأ عند أول حاجة إليه
+# أرشيف أنشئ قبل إضافة جداول أو أعمدة جديدة تضاف إليه البنية الناقصة وحدها مرة واحدة ثم يعاد للقراءة فقط:
+# دون تعبئة bootstrap (أرصدة ودفعات افتتاحية، ترقيم، تكلفة) حتى لا تكتب سطور في سنة مغلقة
+@lru_cache(maxsize=None)
+def archive_engine(name):
+    path = _archive_path(name)
+    if not os.path.exists(path):
+        raise ArchiveError(f"Archive introuvable: {path}")
+    engine = _read_only_engine(path)
+    if _outdated(engine):
+        engine.dispose()
+        os.chmod(path, 0o644)
+        writable = create_engine(f"sqlite:///{path}")
+        try:
+            Base.metadata.create_all(writable)
+            with writable.begin() as conn:
+                upgrade_schema(conn, inspect(writable))
+        finally:
+            writable.dispose()
+            os.chmod(path, 0o444)
+        engine = _read_only_engine(path)
+    return instrument_engine(engine)
+
+
+# السنوات المغلقة المعنية بفترة، الأحدث أولاً (جدول صغير في القاعدة الحية)
+def archived_years(connection, date_from=None, date_to=None):
+    query = select(FiscalYear.year, FiscalYear.archive).order_by(FiscalYear.year.desc())
+    if date_from:
+        query = query.where(FiscalYear.year >= date_from.year)
+    if date_to:
+        query = query.where(FiscalYear.year <= date_to.year)
+    return connection.execute(query).all()
+
+
+# محركات الأرشيفات التي تغطي الفترة، لتضاف إلى القاعدة الحية في التقارير والتصدير
+def archive_engines(connectable, date_from=None, date_to=None):
+    with connectable.connect() as conn:
+        return [archive_engine(year.archive) for year in archived_years(conn, date_from, date_to)]
+
+
+# قائمة الفواتير عبر القاعدة الحية ثم الأرشيفات من الأحدث إلى الأقدم، بنفس ترقيم الصفحات (keyset):
+# السنوات المغلقة أقدم من كل الفواتير الحية، فلا يفتح أرشيف إلا إذا لم تكف الصفحة من القاعدة الحية
+def browse_invoices(session, date_from=None, date_to=None, customer=None, payment_method=None,
+                    min_amount=None, max_amount=None, number=None, after=None, limit=20):
+    filters = dict(date_from=date_from, date_to=date_to, customer=customer, payment_method=payment_method,
+                   min_amount=min_amount, max_amount=max_amount, number=number)
+    rows, next_cursor = list_invoices(session, after=after, limit=limit, **filters)
+    if next_cursor is not None:
+        return rows, next_cursor
+    rows = list(rows)
+    for year in archived_years(session, date_from, date_to):
+        # البحث برقم الفاتورة لا يفتح إلا أرشيف سنته
+        if (after and after[0] < datetime(year.year, 1, 1)) or (number and number_year(number) != year.year):
+            continue
+        with session_scope(archive_engine(year.archive)) as archive:
+            page, _ = list_invoices(archive, after=after, limit=limit + 1 - len(rows), **filters)
+        rows += page
+        if len(rows) > limit:
+            break
+    next_cursor = (rows[limit - 1].date, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+# الفاتورة كنموذج عرض من القاعدة الحية، أو من أرشيف سنتها حسب مجال المعرفات
+def get_invoice_view(session, invoice_id):
+    invoice = get_invoice(session, invoice_id)
+    if invoice is not None:
+        return InvoiceView.from_invoice(invoice, session.query(TraderInfo).first())
+    name = session.execute(
+        select(FiscalYear.archive)
+        .where(FiscalYear.first_invoice_id <= invoice_id, FiscalYear.last_invoice_id >= invoice_id)
+    ).scalar()
+    if name is None:
+        return None
+    with session_scope(archive_engine(name)) as archive:
+        invoice = get_invoice(archive, invoice_id)
+        return InvoiceView.from_invoice(invoice, archive.query(TraderInfo).first()) if invoice else None
+
+
+# أقدم سنة ما زالت فواتيرها في القاعدة الحية، إذا انتهت (السنوات تغلق بالترتيب)
+def closable_year(session, today=None):
+    oldest = session.execute(select(func.min(Invoice.date))).scalar()
+    if oldest is None or oldest.year >= (today or date.today()).year:
+        return None
+    return oldest.year
+
+
+def closed_years(session):
+    return session.execute(select(FiscalYear).order_by(FiscalYear.year.desc())).scalars().all()
+
+
+def _year_summary(conn, start, end):
+    return conn.execute(
+        select(
+            func.count(Invoice.id).label('invoices'),
+            func.min(Invoice.id).label('first_invoice_id'),
+            func.max(Invoice.id).label('last_invoice_id'),
+            type_coerce(func.coalesce(func.sum(cents(Invoice.total_ht)), 0), Money).label('total_ht'),
+            type_coerce(func.coalesce(func.sum(cents(Invoice.total_tax)), 0), Money).label('total_tax'),
+            type_coerce(func.coalesce(func.sum(cents(Invoice.stamp_tax)), 0), Money).label('stamp_tax'),
+            type_coerce(func.coalesce(func.sum(cents(Invoice.total_amount)), 0), Money).label('total_amount'),
+        ).where(Invoice.date >= start, Invoice.date < end)
+    ).one()
+
+
+def _item_count(conn, start, end):
+    return conn.execute(
+        select(func.count(InvoiceItem.id)).join(Invoice, InvoiceItem.invoice_id == Invoice.id)
+        .where(Invoice.date >= start, Invoice.date < end)
+    ).scalar()
+
+
+# نسخ أسطر جدول على دفعات من القاعدة الحية إلى الأرشيف
+def _copy(source, target, table, condition=None):
+    columns = list(table.c)
+    query = select(*columns)
+    if condition is not None:
+        query = query.where(condition)
+    result = source.execution_options(stream_results=True).execute(query)
+    while True:
+        rows = result.fetchmany(BATCH)
+        if not rows:
+            return
+        target.execute(insert(table), [{column.key: value for column, value in zip(columns, row)} for row in rows])
+
+
+# كتابة قاعدة الأرشيف بنفس البنية (metadata): فواتير السنة وسطورها، والزبائن والسلع المستعملة فيها
+# ومعلومات التاجر حتى تعاد طباعة الفواتير كما هي، ثم التحقق من المجاميع وضغط الملف
+def _write_archive(engine, path, start, end, summary, items):
+    invoice_ids = select(Invoice.id).where(Invoice.date >= start, Invoice.date < end)
+    target_engine = create_engine(f"sqlite:///{path}")
+    try:
+        Base.metadata.create_all(target_engine)
+        with engine.connect() as source, target_engine.begin() as target:
+            _copy(source, target, TraderInfo.__table__)
+            _copy(source, target, Customer.__table__, Customer.id.in_(
+                select(Invoice.customer_id).where(Invoice.id.in_(invoice_ids))))
+            _copy(source, target, Product.__table__, Product.id.in_(
+                select(InvoiceItem.product_id).where(InvoiceItem.invoice_id.in_(invoice_ids))))
+            _copy(source, target, Invoice.__table__, Invoice.id.in_(invoice_ids))
+            _copy(source, target, InvoiceItem.__table__, InvoiceItem.invoice_id.in_(invoice_ids))
+        with target_engine.connect() as target:
+            if tuple(_year_summary(target, start, end)) != tuple(summary) or _item_count(target, start, end) != items:
+                raise ArchiveError("Les totaux de l'archive ne correspondent pas à la base.")
+            if target.execute(text("PRAGMA integrity_check")).scalar() != 'ok':
+                raise ArchiveError("Archive corrompue.")
+            target.execute(text("VACUUM"))
+    finally:
+        target_engine.dispose()
+
+
+# إغلاق سنة مالية: نقل فواتيرها وسطورها إلى أرشيف للقراءة فقط، وإبقاء ملخصها في القاعدة الحية
+# الأرشيف يكتب ويتحقق منه أولاً، ثم يضاف الملخص وتحذف الفواتير في معاملة واحدة
+def close_fiscal_year(engine, year, today=None):
+    start, end = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    if year >= (today or date.today()).year:
+        raise ArchiveError(f"L'exercice {year} n'est pas terminé.")
+    with engine.connect() as conn:
+        if conn.execute(select(FiscalYear.year).where(FiscalYear.year == year)).first():
+            raise ArchiveError(f"L'exercice {year} est déjà clôturé.")
+        if conn.execute(select(Invoice.id).where(Invoice.date < start).limit(1)).first():
+            raise ArchiveError("Clôturez d'abord les exercices précédents.")
+        summary = _year_summary(conn, start, end)
+        if not summary.invoices:
+            raise ArchiveError(f"Aucune facture en {year}.")
+        # مجال المعرفات يحدد أرشيف كل فاتورة، فيجب ألا يحتوي فواتير من سنة أخرى
+        in_range = conn.execute(
+            select(func.count(Invoice.id))
+            .where(Invoice.id.between(summary.first_invoice_id, summary.last_invoice_id))
+        ).scalar()
+        if in_range != summary.invoices:
+            raise ArchiveError("Les numéros de factures ne suivent pas l'ordre des dates.")
+        # SQLite يعيد استعمال المعرفات إذا حذفت آخر الفواتير: يلزم وجود فاتورة لاحقة
+        if engine.dialect.name == 'sqlite' and not conn.execute(
+                select(Invoice.id).where(Invoice.id > summary.last_invoice_id).limit(1)).first():
+            raise ArchiveError(f"Émettez au moins une facture après {year} avant la clôture.")
+        items = _item_count(conn, start, end)
+
+    name = archive_name(year)
+    path = _archive_path(name)
+    if os.path.exists(path):
+        raise ArchiveError(f"L'archive existe déjà: {path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    try:
+        _write_archive(engine, partial, start, end, summary, items)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.chmod(path, 0o444)
+
+    invoice_ids = select(Invoice.id).where(Invoice.date >= start, Invoice.date < end)
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert(FiscalYear), [{
+                'year': year, 'closed_at': datetime.now(), 'archive': name, 'invoice_items': items,
+                **summary._asdict(),
+            }])
+            # حركات المخزون تبقى (رصيد تاريخي)، مع رقم الفاتورة في reference بدل الرابط
+            # (الحركات المسجلة قبل الترقيم تحمل معرف الفاتورة)
+            conn.execute(
+                update(StockMovement).where(StockMovement.invoice_id.in_(invoice_ids))
+                .values(invoice_id=None, reference=select(Invoice.number).where(Invoice.id == StockMovement.invoice_id)
+                        .scalar_subquery())
+            )
+            conn.execute(delete(InvoiceItem).where(InvoiceItem.invoice_id.in_(invoice_ids)))
+            conn.execute(delete(Invoice).where(Invoice.date >= start, Invoice.date < end))
+    except BaseException:
+        os.chmod(path, 0o644)
+        os.remove(path)
+        raise
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clôturer un exercice: archiver ses factures en lecture seule.")
+    parser.add_argument('annee', type=int, help="Exercice à clôturer (AAAA)")
+    parser.add_argument('--base', default=DATABASE_URL, help="URL de la base de données")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = close_fiscal_year(init_db(args.base), args.annee)
+    except ArchiveError as error:
+        parser.exit(1, f"{error}\n")
+    print(f"{summary.invoices} factures de {args.annee} archivées dans {_archive_path(archive_name(args.annee))}",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
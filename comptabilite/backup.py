@@ -0,0 +1,308 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy.engine import make_url
+
+from .config import BACKUP_DAYS, BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP, DATABASE_URL
+from .instrumentation import recorder
+
+try:
+    import fcntl
+except ImportError:  # Windows: القفل داخل العملية فقط
+    fcntl = None
+
+BLOCK_SIZE = 64 * 1024  # حجم الكتلة: 16 صفحة SQLite من 4 كيلوبايت
+BACKUP_PAGES = 256  # صفحات لكل خطوة من النسخ عندما لا تكون القاعدة في وضع WAL
+BACKUP_SLEEP = 0.01  # ثوانٍ بين الخطوات لترك الكتابة للصناديق
+MANIFEST_FORMAT = '%Y%m%d-%H%M%S-%f'
+
+
+# نسخة واحدة أو تنظيف واحد في نفس الوقت داخل العملية (مخزن الكتل مشترك بين النسخ)
+_lock = threading.Lock()
+
+
+class BackupError(Exception):
+    pass
+
+
+# وصف نسخة احتياطية: قائمة بصمات الكتل بالترتيب وبصمة الملف كاملًا
+@dataclass(frozen=True)
+class Backup:
+    name: str
+    created: datetime
+    size: int
+    sha256: str
+    blocks: tuple
+
+    @classmethod
+    def load(cls, directory, name):
+        with open(os.path.join(directory, name), encoding='utf-8') as manifest_file:
+            data = json.load(manifest_file)
+        return cls(name, datetime.fromisoformat(data['created']), data['size'], data['sha256'], tuple(data['blocks']))
+
+
+def database_path(url=DATABASE_URL):
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise BackupError("Sauvegarde disponible pour une base SQLite (fichier) uniquement; utilisez pg_dump pour PostgreSQL.")
+    return os.path.abspath(url.database)
+
+
+def _block_path(directory, digest):
+    return os.path.join(directory, 'blocks', digest[:2], f"{digest}.z")
+
+
+def _write_atomic(path, data):
+    partial = path + '.partial'
+    with open(partial, 'wb') as output:
+        output.write(data)
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(partial, path)
+
+
+# لقطة متسقة عبر واجهة النسخ الحي في SQLite: في وضع WAL خطوة واحدة داخل معاملة قراءة لا تمنع الكتابة،
+# وفي غيره نسخ على دفعات من الصفحات مع توقف قصير بين الخطوات حتى لا تتعطل الصناديق
+def _snapshot(source_path, target_path):
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        wal = source.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        source.backup(target, pages=-1 if wal else BACKUP_PAGES, sleep=BACKUP_SLEEP)
+    finally:
+        target.close()
+        source.close()
+
+
+# قفل على مستوى النظام (flock على <dossier>/.lock) فوق قفل الخيوط: سطر الأوامر وجدولة Streamlit
+# قد يعملان معًا، وتنظيف أحدهما يجب ألا يحذف كتلًا تخطتها نسخة الآخر قبل كتابة وصفها
+@contextmanager
+def _locked(directory):
+    os.makedirs(directory, exist_ok=True)
+    with _lock, open(os.path.join(directory, '.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def list_backups(directory=BACKUP_DIR):
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    return [Backup.load(directory, name) for name in reversed(names)]
+
+
+# نسخة احتياطية تزايدية: اللقطة تقسم إلى كتل، ولا تكتب (مضغوطة) إلا الكتل التي لا توجد في المخزن
+# الوصف (manifest) يكتب في الأخير، فالنسخة غير المكتملة لا تظهر أبدًا
+def backup(url=DATABASE_URL, directory=BACKUP_DIR):
+    source_path = database_path(url)
+    os.makedirs(os.path.join(directory, 'blocks'), exist_ok=True)
+    created = datetime.now()
+    snapshot_path = os.path.join(directory, '.snapshot')
+    with _locked(directory), recorder.timer('backup'):
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        _snapshot(source_path, snapshot_path)
+        try:
+            digests, written, whole = [], 0, hashlib.sha256()
+            with open(snapshot_path, 'rb') as snapshot:
+                while block := snapshot.read(BLOCK_SIZE):
+                    whole.update(block)
+                    digest = hashlib.sha256(block).hexdigest()
+                    path = _block_path(directory, digest)
+                    if not os.path.exists(path):
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        _write_atomic(path, zlib.compress(block, 6))
+                        written += 1
+                    digests.append(digest)
+            size = os.path.getsize(snapshot_path)
+        finally:
+            os.remove(snapshot_path)
+
+        name = f"{created.strftime(MANIFEST_FORMAT)}.json"
+        manifest = {'created': created.isoformat(), 'database': os.path.basename(source_path), 'size': size,
+                    'sha256': whole.hexdigest(), 'block_size': BLOCK_SIZE, 'blocks': digests}
+        _write_atomic(os.path.join(directory, name), json.dumps(manifest).encode('utf-8'))
+    return Backup(name, created, size, manifest['sha256'], tuple(digests)), written
+
+
+# سياسة الاحتفاظ: آخر keep نسخة، وآخر نسخة من كل يوم خلال days يومًا، ثم حذف الكتل غير المستعملة
+def prune(directory=BACKUP_DIR, keep=BACKUP_KEEP, days=BACKUP_DAYS, now=None):
+    with _locked(directory):
+        return _prune(directory, keep, days, now)
+
+
+def _prune(directory, keep, days, now):
+    backups = list_backups(directory)
+    limit = (now or datetime.now()) - timedelta(days=days)
+    kept, seen_days = {item.name for item in backups[:keep]}, set()
+    for item in backups:
+        if item.created >= limit and item.created.date() not in seen_days:
+            seen_days.add(item.created.date())
+            kept.add(item.name)
+    removed = [item for item in backups if item.name not in kept]
+    for item in removed:
+        os.remove(os.path.join(directory, item.name))
+
+    used = {digest for item in backups if item.name in kept for digest in item.blocks}
+    blocks_dir = os.path.join(directory, 'blocks')
+    for root, _, files in os.walk(blocks_dir):
+        for file_name in files:
+            if file_name.removesuffix('.z') not in used:
+                os.remove(os.path.join(root, file_name))
+    return removed
+
+
+# إعادة بناء ملف من نسخة مع التحقق من بصمة كل كتلة ومن بصمة الملف كاملًا
+def _rebuild(directory, item, target_path):
+    whole = hashlib.sha256()
+    with open(target_path, 'wb') as output:
+        for digest in item.blocks:
+            try:
+                with open(_block_path(directory, digest), 'rb') as block_file:
+                    block = zlib.decompress(block_file.read())
+            except (OSError, zlib.error) as error:
+                raise BackupError(f"Bloc illisible {digest}: {error}")
+            if hashlib.sha256(block).hexdigest() != digest:
+                raise BackupError(f"Bloc corrompu: {digest}")
+            whole.update(block)
+            output.write(block)
+        output.flush()
+        os.fsync(output.fileno())
+    if whole.hexdigest() != item.sha256 or os.path.getsize(target_path) != item.size:
+        raise BackupError(f"Somme de contrôle incorrecte pour {item.name}")
+
+
+def _integrity_check(path):
+    connection = sqlite3.connect(path)
+    try:
+        result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        connection.close()
+    if result != 'ok':
+        raise BackupError(f"Vérification d'intégrité échouée: {result}")
+
+
+def find_backup(name=None, directory=BACKUP_DIR):
+    backups = list_backups(directory)
+    if not backups:
+        raise BackupError(f"Aucune sauvegarde dans {directory}")
+    if name is None:
+        return backups[0]
+    for item in backups:
+        if item.name in (name, f"{name}.json"):
+            return item
+    raise BackupError(f"Sauvegarde introuvable: {name}")
+
+
+def verify(name=None, directory=BACKUP_DIR):
+    item = find_backup(name, directory)
+    check_path = os.path.join(directory, '.verify')
+    try:
+        _rebuild(directory, item, check_path)
+        _integrity_check(check_path)
+    finally:
+        if os.path.exists(check_path):
+            os.remove(check_path)
+    return item
+
+
+# الاسترجاع: إعادة بناء الملف بجانب القاعدة، التحقق منه، ثم استبداله دفعة واحدة (os.replace)
+# ملفات -wal و -shm القديمة تحذف حتى لا تطبق على الملف المسترجع؛ يجب إيقاف التطبيق قبل ذلك
+def restore(name=None, url=DATABASE_URL, directory=BACKUP_DIR):
+    item = find_backup(name, directory)
+    target_path = database_path(url)
+    partial = target_path + '.restore'
+    try:
+        _rebuild(directory, item, partial)
+        _integrity_check(partial)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(target_path + suffix):
+            os.remove(target_path + suffix)
+    os.replace(partial, target_path)
+    return item
+
+
+# نسخ دورية في خيط خلفي: لا يمر أي نسخ عبر خيط الواجهة
+class BackupScheduler:
+    def __init__(self, url=DATABASE_URL, directory=BACKUP_DIR, interval=BACKUP_INTERVAL * 60,
+                 keep=BACKUP_KEEP, days=BACKUP_DAYS):
+        self.url = url
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.days = days
+        self.last = None
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='backup', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def run_once(self):
+        try:
+            self.last, _ = backup(self.url, self.directory)
+            prune(self.directory, self.keep, self.days)
+            self.error = None
+        # أي خطأ يسجل ويبقى الخيط حيًا للمحاولة التالية، بدل أن يموت الخيط الخلفي دون أثر
+        except Exception as error:
+            self.error = f"{datetime.now():%Y-%m-%d %H:%M} {error}"
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sauvegardes incrémentales de la base SQLite.")
+    parser.add_argument('--base', default=DATABASE_URL, help="URL de la base de données")
+    parser.add_argument('--dossier', default=BACKUP_DIR, help="Dossier des sauvegardes")
+    commands = parser.add_subparsers(dest='commande', required=True)
+    commands.add_parser('sauvegarder', help="Créer une sauvegarde puis appliquer la rétention")
+    commands.add_parser('liste', help="Lister les sauvegardes")
+    for command, help_text in (('verifier', "Vérifier une sauvegarde"), ('restaurer', "Restaurer une sauvegarde")):
+        subparser = commands.add_parser(command, help=help_text)
+        subparser.add_argument('nom', nargs='?', help="Nom de la sauvegarde (défaut: la plus récente)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.commande == 'sauvegarder':
+            item, written = backup(args.base, args.dossier)
+            removed = prune(args.dossier)
+            print(f"{item.name}: {len(item.blocks)} blocs dont {written} nouveaux, {len(removed)} anciennes supprimées")
+        elif args.commande == 'liste':
+            for item in list_backups(args.dossier):
+                print(f"{item.name}\t{item.created:%Y-%m-%d %H:%M:%S}\t{item.size / 1024 / 1024:.1f} Mo")
+        elif args.commande == 'verifier':
+            print(f"{verify(args.nom, args.dossier).name}: intègre")
+        else:
+            item = restore(args.nom, args.base, args.dossier)
+            print(f"{database_path(args.base)} restaurée depuis {item.name}")
+    except (OSError, sqlite3.Error, BackupError) as error:
+        parser.exit(1, f"{error}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from .models import Product
+from .money import from_cents
+from .taxes import compute_invoice
+
+
+# نسخة ثابتة من السلعة لحظة إضافتها إلى السلة، حتى لا تعاد قراءتها عند كل تفاعل
+@dataclass(frozen=True, slots=True)
+class ProductSnapshot:
+    id: int
+    code: str
+    name: str
+    unit_price: Decimal
+    tax_rate: float
+    stock: int
+
+    @classmethod
+    def from_product(cls, product):
+        return cls(product.id, product.code, product.name, product.selling_price or 0, product.tax_rate or 0,
+                   product.quantity or 0)
+
+
+@dataclass(slots=True)
+class CartLine:
+    product: ProductSnapshot
+    quantity: int
+    ht: int = 0  # بالسنتيمات
+    tax: int = 0
+    ttc: int = 0
+
+
+# مسودة فاتورة تحفظ في st.session_state: السطور ونسخ السلع والمجاميع الجارية (بالسنتيمات)
+# المجاميع تحدث بالفرق عند كل تعديل، ولا يتم التحقق من المخزون إلا عند refresh قبل الإصدار
+class Cart:
+    def __init__(self):
+        self.lines = OrderedDict()
+        self.total_ht = 0
+        self.total_tax = 0
+        self.total_ttc = 0
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __contains__(self, product_id):
+        return product_id in self.lines
+
+    def add(self, product, quantity=1):
+        line = self.lines.get(product.id)
+        if line:
+            self._update(line, line.product, line.quantity + quantity)
+        else:
+            line = self.lines[product.id] = CartLine(product, 0)
+            self._update(line, product, quantity)
+
+    def set_quantity(self, product_id, quantity):
+        line = self.lines[product_id]
+        if line.quantity != quantity:
+            self._update(line, line.product, quantity)
+
+    def remove(self, product_id):
+        line = self.lines.pop(product_id, None)
+        if line:
+            self._account(line, -1)
+
+    def clear(self):
+        self.__init__()
+
+    # إعادة حساب سطر واحد وتطبيق الفرق على المجاميع
+    def _update(self, line, product, quantity):
+        self._account(line, -1)
+        totals = compute_invoice([product.unit_price], [quantity], [product.tax_rate])
+        line.product, line.quantity = product, quantity
+        line.ht, line.tax = totals.total_ht, totals.total_tax
+        line.ttc = line.ht + line.tax
+        self._account(line, 1)
+
+    def _account(self, line, sign):
+        self.total_ht += sign * line.ht
+        self.total_tax += sign * line.tax
+        self.total_ttc += sign * line.ttc
+
+    # المجاميع النهائية مع ضريبة الطابع حسب طريقة الدفع (نفس المحرك المستعمل عند الإصدار)
+    def totals(self, payment_method=None):
+        return compute_invoice(
+            [line.product.unit_price for line in self.lines.values()],
+            [line.quantity for line in self.lines.values()],
+            [line.product.tax_rate for line in self.lines.values()],
+            payment_method,
+        )
+
+    # السطور بالشكل الذي يستقبله issue_invoice
+    def items(self):
+        return [(product_id, line.quantity) for product_id, line in self.lines.items()]
+
+    def rows(self):
+        return [
+            {
+                'Code du produit': line.product.code,
+                'Nom du produit': line.product.name,
+                'Quantité': line.quantity,
+                'Prix unitaire': line.product.unit_price,
+                'Prix total': from_cents(line.ht),
+                'TVA': from_cents(line.tax),
+                'Total': from_cents(line.ttc),
+            }
+            for line in self.lines.values()
+        ]
+
+    # تحديث كل نسخ السلع باستعلام واحد قبل الإصدار: المخزون المتاح والأسعار الحالية
+    # تعيد قائمة رسائل للسطور التي تتجاوز المخزون، وتحذف السلع المحذوفة من القاعدة
+    def refresh(self, session):
+        if not self.lines:
+            return []
+        current = {
+            row.id: row for row in session.execute(
+                select(Product.id, Product.code, Product.name, Product.selling_price, Product.tax_rate, Product.quantity)
+                .where(Product.id.in_(list(self.lines)))
+            )
+        }
+        problems = []
+        for product_id, line in list(self.lines.items()):
+            row = current.get(product_id)
+            if row is None:
+                self.remove(product_id)
+                problems.append(f"Le produit {line.product.code} n'existe plus.")
+                continue
+            snapshot = ProductSnapshot.from_product(row)
+            if snapshot != line.product:
+                self._update(line, snapshot, line.quantity)
+            if line.quantity > snapshot.stock:
+                problems.append(
+                    f"La quantité demandée de {snapshot.name} (Code: {snapshot.code}) n'est pas disponible "
+                    f"(stock: {snapshot.stock})."
+                )
+        return problems
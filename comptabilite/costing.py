@@ -0,0 +1,147 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, bindparam, func, literal, select, update
+
+from .config import COSTING_METHOD
+from .models import InvoiceItem, Product, PurchaseLot
+from .money import cents, from_cents, to_cents
+from .stock import PURCHASE, record_movements
+
+FIFO = 'fifo'
+WEIGHTED_AVERAGE = 'cmup'  # coût moyen unitaire pondéré
+COSTING_METHODS = (FIFO, WEIGHTED_AVERAGE)
+
+
+# قسمة صحيحة مع تقريب نصف السنتيم إلى الأعلى (أعداد موجبة)
+def _round_div(numerator, denominator):
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+# إدخال دفعات إلى المخزن: سطر لكل دفعة في purchase_lots، ثم زيادة الرصيد وقيمة المخزون وتحديث آخر ثمن شراء،
+# وحركات الشراء، كلها دفعة واحدة (executemany) في معاملة المستدعي
+# lots: قواميس تحتوي product_id و quantity و unit_cost، واختياريًا purchase_invoice_id و reference
+def receive_lots(session, lots):
+    lots = [lot for lot in lots if lot['quantity']]
+    if not lots:
+        return
+    now = datetime.now()
+    lots_table = PurchaseLot.__table__
+    session.execute(lots_table.insert(), [
+        {'purchase_invoice_id': lot.get('purchase_invoice_id'), 'product_id': lot['product_id'],
+         'quantity': lot['quantity'], 'remaining': lot['quantity'], 'unit_cost': lot['unit_cost'], 'date': now}
+        for lot in lots
+    ])
+    products = Product.__table__
+    session.execute(
+        update(products)
+        .where(products.c.id == bindparam('lot_product_id'))
+        .values(quantity=func.coalesce(products.c.quantity, 0) + bindparam('lot_quantity'),
+                stock_value=func.coalesce(cents(products.c.stock_value), 0) + bindparam('lot_value', type_=BigInteger),
+                purchase_price=bindparam('lot_unit_cost')),
+        [{'lot_product_id': lot['product_id'], 'lot_quantity': lot['quantity'], 'lot_unit_cost': lot['unit_cost'],
+          'lot_value': lot['quantity'] * to_cents(lot['unit_cost'])}
+         for lot in lots],
+    )
+    record_movements(session, [
+        {'product_id': lot['product_id'], 'quantity': lot['quantity'], 'kind': PURCHASE,
+         'reference': lot.get('reference')}
+        for lot in lots
+    ])
+
+
+# تكلفة الكميات المباعة بالسنتيمات لكل سلعة، وتحديث البنى التي تحفظها تزايديًا:
+# الدفعات تستهلك دائمًا بالأقدم أولاً (remaining)، وقيمة المخزون تنقص بتكلفة الطريقة المختارة
+# - FIFO: مجموع الدفعات المستهلكة
+# - CMUP: الكمية × (قيمة المخزون / الرصيد قبل البيع)، فيبقى المتوسط كما هو ولا تعاد قراءة المشتريات
+# يستدعى بعد خصم الكميات من products: سطر السلعة مقفل حتى نهاية المعاملة، فلا يستهلك صندوقان نفس الدفعة
+# quantities: {product_id: الكمية المباعة}
+def consume_lots(session, quantities, method=COSTING_METHOD):
+    if method not in COSTING_METHODS:
+        raise ValueError(f"Méthode de coût inconnue: {method} ({', '.join(COSTING_METHODS)})")
+    product_ids = sorted(quantities)
+    products = {
+        row.id: row for row in session.execute(
+            select(Product.id, Product.quantity, cents(Product.stock_value).label('stock_value'),
+                   cents(Product.purchase_price).label('purchase_price'))
+            .where(Product.id.in_(product_ids))
+        )
+    }
+    open_lots = defaultdict(list)
+    for lot in session.execute(
+        select(PurchaseLot.id, PurchaseLot.product_id, PurchaseLot.remaining, cents(PurchaseLot.unit_cost).label('unit_cost'))
+        .where(PurchaseLot.product_id.in_(product_ids), PurchaseLot.remaining > 0)
+        .order_by(PurchaseLot.product_id, PurchaseLot.id)
+    ):
+        open_lots[lot.product_id].append(lot)
+
+    costs, taken_from_lots, values = {}, [], []
+    for product_id in product_ids:
+        product, needed = products[product_id], quantities[product_id]
+        fifo_cost = 0
+        for lot in open_lots[product_id]:
+            if not needed:
+                break
+            taken = min(needed, lot.remaining)
+            fifo_cost += taken * (lot.unit_cost or 0)
+            taken_from_lots.append({'lot_id': lot.id, 'taken': taken})
+            needed -= taken
+        # كمية أدخلت دون دفعة (قبل تتبع الدفعات أو تعديل مباشر): تقدر بآخر ثمن شراء
+        fifo_cost += needed * (product.purchase_price or 0)
+
+        stock_value = product.stock_value or 0
+        if method == FIFO:
+            cost = fifo_cost
+        else:
+            on_hand = (product.quantity or 0) + quantities[product_id]  # الرصيد قبل هذا البيع
+            cost = _round_div(stock_value * quantities[product_id], on_hand)
+        costs[product_id] = cost
+        values.append({'value_product_id': product_id,
+                       'value': from_cents(max(stock_value - cost, 0) if product.quantity else 0)})
+
+    if taken_from_lots:
+        lots_table = PurchaseLot.__table__
+        session.execute(
+            update(lots_table)
+            .where(lots_table.c.id == bindparam('lot_id'))
+            .values(remaining=lots_table.c.remaining - bindparam('taken')),
+            taken_from_lots,
+        )
+    products_table = Product.__table__
+    session.execute(
+        update(products_table)
+        .where(products_table.c.id == bindparam('value_product_id'))
+        .values(stock_value=bindparam('value')),
+        values,
+    )
+    return costs
+
+
+# قاعدة أنشئت قبل تتبع الدفعات: دفعة افتتاحية لكل سلعة بكميتها وآخر ثمن شراء، وقيمة مخزونها
+def open_lots(conn):
+    products = Product.__table__
+    lots = PurchaseLot.__table__
+    conn.execute(lots.insert().from_select(
+        [lots.c.product_id, lots.c.quantity, lots.c.remaining, lots.c.unit_cost, lots.c.date],
+        select(products.c.id, products.c.quantity, products.c.quantity, func.coalesce(cents(products.c.purchase_price), 0),
+               func.coalesce(products.c.purchase_invoice_date, products.c.entry_date, literal(datetime.now(), DateTime)))
+        .where(products.c.quantity > 0)
+    ))
+    conn.execute(
+        update(products)
+        .values(stock_value=func.coalesce(cents(products.c.purchase_price), 0) * products.c.quantity)
+        .where(products.c.quantity > 0)
+    )
+    conn.execute(update(products).values(stock_value=0).where(products.c.stock_value.is_(None)))
+
+
+# تكلفة السطور المباعة قبل تتبع الدفعات بآخر ثمن شراء (أفضل تقدير متاح، وهو ما كانت تستعمله التقارير)
+def cost_sold_items(conn):
+    products = Product.__table__
+    items = InvoiceItem.__table__
+    conn.execute(
+        update(items)
+        .values(cost=items.c.quantity * func.coalesce(
+            select(cents(products.c.purchase_price)).where(products.c.id == items.c.product_id).scalar_subquery(), 0))
+        .where(items.c.cost.is_(None))
+    )
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import func, select
+
+from .models import Customer
+
+# الحقول القابلة للتعديل من الواجهة
+FIELDS = ('name', 'address', 'phone', 'commercial_register', 'tax_number', 'statistical_number', 'material_number')
+
+
+def _options():
+    return select(Customer.id, Customer.name, Customer.phone, Customer.tax_number, Customer.commercial_register)
+
+
+def _prefix(expression, value):
+    return (expression >= value) & (expression < value + '\uffff')
+
+
+# نص المستخدم داخل LIKE: \ و % و _ أحرف عادية
+def _contains(expression, value):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return expression.like(f'%{escaped}%', escape='\\')
+
+
+# البحث عن الزبائن على الأعمدة المفهرسة: بداية الهاتف أو الرقم الجبائي أو السجل التجاري،
+# ثم بداية الاسم (فهرس lower(name))، ثم الاسم في أي موضع إذا لم تكف النتائج
+def search_customers(session, query, limit=20):
+    query = query.strip()
+    name = func.lower(Customer.name)
+    if not query:
+        return session.execute(_options().order_by(name, Customer.id).limit(limit)).all()
+
+    lowered = query.lower()
+    candidates = [
+        _options().where(_prefix(Customer.phone, query)).order_by(Customer.phone),
+        _options().where(_prefix(Customer.tax_number, query)).order_by(Customer.tax_number),
+        _options().where(_prefix(Customer.commercial_register, query)).order_by(Customer.commercial_register),
+        _options().where(_prefix(name, lowered)).order_by(name, Customer.id),
+        _options().where(_contains(name, lowered)).order_by(name, Customer.id),
+    ]
+    results, seen = [], set()
+    for statement in candidates:
+        if len(results) >= limit:
+            break
+        for row in session.execute(statement.limit(limit + len(seen))):
+            if row.id not in seen and len(results) < limit:
+                seen.add(row.id)
+                results.append(row)
+    return results
+
+
+# نتائج البحث مخزنة مؤقتًا لكل (نص البحث، الحد)، وتفرغ عند إضافة زبون أو تعديله
+# ttl يحد من قدم النتائج عندما تعدل صناديق أخرى نفس القاعدة
+class CustomerSearch:
+    def __init__(self, max_entries=256, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def search(self, session, query, limit=20):
+        key = (query.strip().lower(), limit)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and now - cached[0] < self.ttl:
+                self._cache.move_to_end(key)
+                return cached[1]
+        rows = tuple(search_customers(session, query, limit))
+        with self._lock:
+            self._cache[key] = (now, rows)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return rows
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+
+customer_search = CustomerSearch()
+
+
+def get_customer(session, customer_id):
+    return session.get(Customer, customer_id)
+
+
+def create_customer(session, **values):
+    customer = Customer(**{field: values.get(field) for field in FIELDS})
+    session.add(customer)
+    session.commit()
+    customer_search.invalidate()
+    return customer
+
+
+def update_customer(session, customer, **values):
+    for field in FIELDS:
+        if field in values:
+            setattr(customer, field, values[field])
+    session.commit()
+    customer_search.invalidate()
+    return customer
@@ -0,0 +1,247 @@
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import DateTime, create_engine, event, inspect, literal, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from .config import DATABASE_URL, MAX_OVERFLOW, POOL_PRE_PING, POOL_RECYCLE, POOL_SIZE, POOL_TIMEOUT
+from .costing import cost_sold_items, open_lots
+from .instrumentation import instrument_engine
+from .models import Base
+from .numbering import number_invoices
+
+# إعدادات SQLite: وضع WAL يسمح بالقراءة أثناء الكتابة من عدة صناديق
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,
+}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+# محرك واحد لكل عملية بدلاً من إنشائه عند كل تفاعل، مع توقيت كل استعلام (instrumentation)
+# العنوان وإعدادات مجمع الاتصالات من config (متغيرات البيئة COMPTA_*)
+@lru_cache(maxsize=None)
+def get_engine(url=DATABASE_URL):
+    return instrument_engine(_create_engine(url))
+
+
+def _create_engine(url):
+    if url.startswith('sqlite'):
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            return _sqlite_engine(url, poolclass=StaticPool)
+        return _sqlite_engine(url, poolclass=QueuePool, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+                              pool_timeout=POOL_TIMEOUT)
+    return create_engine(
+        url,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+    )
+
+
+def _sqlite_engine(url, **pool_options):
+    engine = create_engine(url, connect_args={'check_same_thread': False}, **pool_options)
+    event.listen(engine, 'connect', _set_sqlite_pragmas)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def get_sessionmaker(engine):
+    return sessionmaker(bind=engine)
+
+
+# إنشاء الجداول وإضافة الأعمدة والفهارس الناقصة في الجداول الموجودة، ثم تعبئة الأعمدة الجديدة
+def bootstrap(engine):
+    Base.metadata.create_all(engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        added = upgrade_schema(conn, inspector)
+        # بعد دمج السلع المتكررة، حتى تشير الحركات الافتتاحية إلى السلع الباقية
+        _open_stock_ledger(conn)
+        if added:
+            _convert_money_columns(conn, inspector, added)
+        if ('invoices', 'number') in added:
+            number_invoices(conn)
+        if ('products', 'stock_value_cents') in added:
+            open_lots(conn)
+        if ('invoice_items', 'cost_cents') in added:
+            cost_sold_items(conn)
+        if engine.dialect.name == 'sqlite':
+            _create_product_search_index(conn)
+
+
+# البنية وحدها: الأعمدة والفهارس الناقصة، وتعيد الأعمدة المضافة (الجدول، العمود) لتعبئتها في bootstrap
+# تستعمل وحدها لتحديث الأرشيفات، فلا تكتب أي سطر في سنة مغلقة
+def upgrade_schema(conn, inspector):
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=conn.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    ddl += f" DEFAULT {getattr(default, 'text', repr(default))}"
+                    if not column.nullable:
+                        ddl += ' NOT NULL'
+                conn.execute(text(ddl))
+                added.add((table.name, column.name))
+        existing_indexes = _index_names(conn, inspector, table.name)
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                if index.name == 'ix_products_code':
+                    _merge_duplicate_products(conn)
+                index.create(conn)
+    return added
+
+
+# أسماء الفهارس الموجودة، بما فيها فهارس التعابير (lower(name)) التي لا يعيدها inspector
+def _index_names(conn, inspector, table_name):
+    if conn.dialect.name == 'sqlite':
+        query = "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"
+    elif conn.dialect.name == 'postgresql':
+        query = "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+    else:
+        return {i['name'] for i in inspector.get_indexes(table_name)}
+    return set(conn.execute(text(query), {'table': table_name}).scalars())
+
+
+# دمج السلع المتكررة بنفس الرمز قبل إنشاء الفهرس الفريد على products.code
+# كل الجداول التي تشير إلى products (سطور الفواتير، الحركات، الدفعات) تنقل إلى السلعة الباقية قبل الحذف
+def _merge_duplicate_products(conn):
+    keepers = 'SELECT MIN(id) FROM products WHERE code IS NOT NULL GROUP BY code'
+    conn.execute(text(f"""
+        UPDATE products
+        SET quantity = (SELECT SUM(COALESCE(p.quantity, 0)) FROM products p WHERE p.code = products.code)
+        WHERE id IN ({keepers})
+    """))
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            if any(fk.target_fullname == 'products.id' for fk in column.foreign_keys):
+                conn.execute(text(f"""
+                    UPDATE {table.name}
+                    SET {column.name} = (
+                        SELECT MIN(p2.id) FROM products p1 JOIN products p2 ON p2.code = p1.code
+                        WHERE p1.id = {table.name}.{column.name}
+                    )
+                    WHERE {column.name} IN (SELECT id FROM products WHERE code IS NOT NULL AND id NOT IN ({keepers}))
+                """))
+    conn.execute(text(f"DELETE FROM products WHERE code IS NOT NULL AND id NOT IN ({keepers})"))
+
+
+# الأعمدة النقدية القديمة (Float بالدينار) ومقابلها الجديد بالسنتيمات
+LEGACY_MONEY_COLUMNS = {
+    ('products', 'purchase_price_cents'): 'purchase_price',
+    ('products', 'selling_price_cents'): 'selling_price',
+    ('invoices', 'stamp_tax_cents'): 'stamp_tax',
+    ('invoices', 'total_amount_cents'): 'total_amount',
+    ('invoice_items', 'price_cents'): 'price',
+}
+
+
+# نقل المبالغ القديمة إلى السنتيمات، ثم حساب مجاميع السطور والفواتير القديمة مرة واحدة
+def _convert_money_columns(conn, inspector, added):
+    for (table, column), legacy in LEGACY_MONEY_COLUMNS.items():
+        if (table, column) in added and legacy in {c['name'] for c in inspector.get_columns(table)}:
+            conn.execute(text(
+                f"UPDATE {table} SET {column} = CAST(ROUND({legacy} * 100) AS INTEGER) WHERE {legacy} IS NOT NULL"
+            ))
+    if ('invoice_items', 'total_ht_cents') in added:
+        conn.execute(text("""
+            UPDATE invoice_items
+            SET tax_rate = COALESCE((SELECT tax_rate FROM products WHERE products.id = invoice_items.product_id), 0),
+                total_ht_cents = price_cents * quantity
+        """))
+        conn.execute(text(
+            "UPDATE invoice_items SET tax_amount_cents = CAST(ROUND(total_ht_cents * tax_rate / 100) AS INTEGER)"
+        ))
+        conn.execute(text("UPDATE invoice_items SET total_ttc_cents = total_ht_cents + tax_amount_cents"))
+    if ('invoices', 'total_ht_cents') in added:
+        conn.execute(text("""
+            UPDATE invoices
+            SET total_ht_cents = (SELECT COALESCE(SUM(total_ht_cents), 0) FROM invoice_items WHERE invoice_id = invoices.id),
+                total_tax_cents = (SELECT COALESCE(SUM(tax_amount_cents), 0) FROM invoice_items WHERE invoice_id = invoices.id)
+        """))
+
+
+# رصيد افتتاحي في سجل الحركات لكل سلعة لها كمية وليست لها أي حركة (موجودة قبل إنشاء السجل)
+# القرار لكل سلعة وليس بوجود الجدول: إعادة التشغيل بعد فشل سابق لا تضيع الأرصدة ولا تكررها
+def _open_stock_ledger(conn):
+    products = Base.metadata.tables['products']
+    movements = Base.metadata.tables['stock_movements']
+    conn.execute(movements.insert().from_select(
+        ['product_id', 'quantity', 'kind', 'date'],
+        select(products.c.id, products.c.quantity, literal('ouverture'), literal(datetime.now(), DateTime))
+        .where(products.c.quantity.isnot(None), products.c.quantity != 0,
+               ~select(movements.c.id).where(movements.c.product_id == products.c.id).exists())
+    ))
+
+
+# فهرس FTS5 على أسماء السلع، تحافظ عليه المشغلات (triggers) تلقائيًا
+def _create_product_search_index(conn):
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")).first():
+        return
+    try:
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE products_fts USING fts5(
+                name, content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )
+        """))
+    except OperationalError:
+        # SQLite بدون FTS5: البحث بالاسم يعود إلى LIKE
+        return
+    conn.execute(text("""
+        CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER products_fts_update AFTER UPDATE OF name ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+        END
+    """))
+    conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+
+
+# تهيئة قاعدة البيانات مرة واحدة فقط لكل عملية
+@lru_cache(maxsize=None)
+def init_db(url=DATABASE_URL):
+    engine = get_engine(url)
+    bootstrap(engine)
+    return engine
+
+
+# جلسة قصيرة لكل طلب: تأكيد عند النجاح، تراجع عند الخطأ، وإغلاق دائمًا
+@contextmanager
+def session_scope(engine=None):
+    session = get_sessionmaker(engine or init_db())()
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -0,0 +1,144 @@
+import argparse
+import os
+import shutil
+import sys
+import zipfile
+from datetime import date
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from .archive import archive_engines
+from .db import DATABASE_URL, init_db, session_scope
+from .invoices import date_filters
+from .models import Invoice, InvoiceItem, TraderInfo
+from .pdf import get_pool
+from .renderer import InvoiceView, draw_invoice
+
+
+# اسم الملف من الرقم القانوني (2026/000123 ← Facture_2026-000123.pdf)
+def pdf_filename(number):
+    return f"Facture_{number.replace('/', '-')}.pdf"
+
+
+def _filters(date_from, date_to, customer_id):
+    conditions = date_filters(date_from, date_to)
+    if customer_id:
+        conditions.append(Invoice.customer_id == customer_id)
+    return conditions
+
+
+# قراءة الفواتير على دفعات مرتبة حسب المعرف، دون الاحتفاظ بالدفعات السابقة في الذاكرة
+def iter_invoice_views(session, date_from=None, date_to=None, customer_id=None, chunk_size=200):
+    conditions = _filters(date_from, date_to, customer_id)
+    trader = session.query(TraderInfo).first()
+    last_id = 0
+    while True:
+        invoices = session.execute(
+            select(Invoice)
+            .options(joinedload(Invoice.customer), selectinload(Invoice.items).joinedload(InvoiceItem.product))
+            .where(Invoice.id > last_id, *conditions)
+            .order_by(Invoice.id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not invoices:
+            return
+        last_id = invoices[-1].id
+        yield [InvoiceView.from_invoice(invoice, trader) for invoice in invoices]
+        session.expunge_all()
+
+
+def _render(views, workers):
+    if workers == 1:
+        return map(draw_invoice, views)
+    return get_pool(processes=True, workers=workers).map(draw_invoice, views)
+
+
+# كل دفعة تكتب في أرشيف جزئي خاص بها داخل مجلد الأجزاء، باسم مؤقت ثم os.replace:
+# الجزء الموجود كامل دائمًا، وانقطاع العملية (SIGKILL) لا يضيع إلا الدفعة الجارية
+def _write_part(parts_dir, views, workers):
+    name = os.path.join(parts_dir, f"{len(_parts(parts_dir)):06d}.zip")
+    with zipfile.ZipFile(name + '.tmp', 'w') as part:
+        # ملفات PDF مضغوطة أصلاً فتخزن كما هي
+        for view, data in zip(views, _render(views, workers)):
+            part.writestr(pdf_filename(view.number), data, compress_type=zipfile.ZIP_STORED)
+    os.replace(name + '.tmp', name)
+
+
+def _parts(parts_dir):
+    return sorted(os.path.join(parts_dir, name) for name in os.listdir(parts_dir) if name.endswith('.zip'))
+
+
+# جمع الأجزاء في الأرشيف النهائي ملفًا ملفًا، ثم استبداله في عملية واحدة وحذف الأجزاء
+def _assemble(zip_path, parts_dir):
+    with zipfile.ZipFile(zip_path + '.tmp', 'w') as archive:
+        for part_path in _parts(parts_dir):
+            with zipfile.ZipFile(part_path) as part:
+                for info in part.infolist():
+                    archive.writestr(info, part.read(info))
+    os.replace(zip_path + '.tmp', zip_path)
+    shutil.rmtree(parts_dir)
+
+
+# تصدير الفواتير كملفات PDF داخل أرشيف ZIP يكتب تدريجيًا على القرص
+# الأجزاء تبقى في zip_path.parties حتى نهاية التصدير: إعادة التشغيل بعد انقطاع تتخطى الفواتير المكتوبة فيها
+# أرشيف سابق مكتمل يصبح الجزء الأول، فلا تضاف إليه إلا الفواتير الجديدة
+# progress(done, total) تستدعى بعد كل دفعة
+# workers: عدد عمليات الرسم (None لكل الأنوية)، و 1 للرسم في نفس الخيط (واجهة Streamlit)
+def export_invoices(zip_path, date_from=None, date_to=None, customer_id=None, workers=1,
+                    chunk_size=200, progress=None, engine=None):
+    engine = engine or init_db()
+    # القاعدة الحية ثم أرشيفات السنوات المغلقة التي تغطي الفترة
+    engines = [engine] + archive_engines(engine, date_from, date_to)
+    parts_dir = zip_path + '.parties'
+    os.makedirs(parts_dir, exist_ok=True)
+    for name in os.listdir(parts_dir):
+        if name.endswith('.tmp'):
+            os.remove(os.path.join(parts_dir, name))
+    if not _parts(parts_dir) and os.path.exists(zip_path) and zipfile.is_zipfile(zip_path):
+        os.replace(zip_path, os.path.join(parts_dir, "000000.zip"))
+    done = set()
+    for part_path in _parts(parts_dir):
+        with zipfile.ZipFile(part_path) as part:
+            done.update(part.namelist())
+
+    total = 0
+    for source in engines:
+        with source.connect() as conn:
+            total += conn.execute(
+                select(func.count(Invoice.id)).where(*_filters(date_from, date_to, customer_id))
+            ).scalar_one()
+    count = 0
+    for source in engines:
+        with session_scope(source) as session:
+            for views in iter_invoice_views(session, date_from, date_to, customer_id, chunk_size):
+                missing = [view for view in views if pdf_filename(view.number) not in done]
+                if missing:
+                    _write_part(parts_dir, missing, workers)
+                count += len(views)
+                if progress:
+                    progress(count, total)
+    _assemble(zip_path, parts_dir)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporter les factures en PDF dans une archive ZIP.")
+    parser.add_argument('sortie', help="Chemin de l'archive ZIP (reprise si elle existe déjà ou si un export a été interrompu)")
+    parser.add_argument('--du', type=date.fromisoformat, help="Date de début (AAAA-MM-JJ)")
+    parser.add_argument('--au', type=date.fromisoformat, help="Date de fin incluse (AAAA-MM-JJ)")
+    parser.add_argument('--client', type=int, help="Identifiant du client")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Nombre de processus de rendu")
+    parser.add_argument('--base', default=DATABASE_URL, help="URL de la base de données")
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print(f"\r{done}/{total} factures", end='', file=sys.stderr, flush=True)
+
+    total = export_invoices(args.sortie, args.du, args.au, args.client, workers=args.workers,
+                            progress=progress, engine=init_db(args.base))
+    print(f"\n{total} factures exportées dans {args.sortie}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
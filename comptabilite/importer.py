@@ -0,0 +1,206 @@
+import csv
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .costing import receive_lots
+from .models import Product
+from .purchases import purchase_invoice
+
+TAX_RATES = (0, 9, 19)
+COLUMNS = ('code', 'nom', 'prix_achat', 'prix_vente', 'taux_tva', 'quantite')
+OPTIONAL_COLUMNS = ('numero_facture_achat', 'date_facture_achat')
+CHUNK_SIZE = 5000
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    rows: int = 0
+    errors: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=['Ligne', 'Code', 'Erreur']))
+
+
+# توحيد أسماء الأعمدة: "Prix d'achat" -> prix_d_achat، "Quantité" -> quantite
+def _normalize(name):
+    name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode()
+    return '_'.join(''.join(c if c.isalnum() else ' ' for c in name.lower()).split())
+
+
+ALIASES = {
+    'prix_d_achat': 'prix_achat',
+    'prix_de_vente': 'prix_vente',
+    'tva': 'taux_tva',
+    'taux_de_tva': 'taux_tva',
+    'quantite_achetee': 'quantite',
+    'nom_du_produit': 'nom',
+    'code_du_produit': 'code',
+    'numero_de_la_facture_d_achat': 'numero_facture_achat',
+    'date_de_la_facture_d_achat': 'date_facture_achat',
+}
+
+
+def _rename(df):
+    return df.rename(columns=lambda c: ALIASES.get(_normalize(c), _normalize(c)))
+
+
+# قراءة الملف على دفعات: CSV عبر pandas (مع اكتشاف الفاصل)، و XLSX عبر openpyxl في وضع القراءة فقط
+def read_chunks(file, filename, chunksize=CHUNK_SIZE):
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        yield from _read_excel_chunks(file, chunksize)
+        return
+    sample = file.read(4096)
+    file.seek(0)
+    if isinstance(sample, bytes):
+        sample = sample.decode('utf-8-sig', errors='ignore')
+    try:
+        delimiter = csv.Sniffer().sniff(sample.splitlines()[0], delimiters=',;\t').delimiter
+    except (csv.Error, IndexError):
+        delimiter = ','
+    for chunk in pd.read_csv(file, sep=delimiter, dtype=str, chunksize=chunksize,
+                             keep_default_na=False, encoding='utf-8-sig'):
+        yield _rename(chunk)
+
+
+def _read_excel_chunks(file, chunksize):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        buffer = []
+        for row in rows:
+            buffer.append(['' if value is None else str(value) for value in row])
+            if len(buffer) == chunksize:
+                yield _rename(pd.DataFrame(buffer, columns=header))
+                buffer = []
+        if buffer:
+            yield _rename(pd.DataFrame(buffer, columns=header))
+    finally:
+        workbook.close()
+
+
+def _to_number(series):
+    return pd.to_numeric(series.str.strip().str.replace(' ', '', regex=False).str.replace(',', '.', regex=False),
+                         errors='coerce')
+
+
+# التحقق من دفعة كاملة بعمليات متجهة، وإرجاع السطور الصالحة وجدول الأخطاء
+# first_line: رقم السطر في الملف لأول سطر في الدفعة
+def validate(chunk, first_line):
+    missing = [column for column in COLUMNS if column not in chunk.columns]
+    if missing:
+        raise ValueError(f"Colonnes manquantes: {', '.join(missing)}")
+
+    chunk = chunk.reset_index(drop=True)
+    data = pd.DataFrame({
+        'code': chunk['code'].str.strip(),
+        'name': chunk['nom'].str.strip(),
+        'purchase_price': _to_number(chunk['prix_achat']),
+        'selling_price': _to_number(chunk['prix_vente']),
+        'tax_rate': _to_number(chunk['taux_tva']),
+        'quantity': _to_number(chunk['quantite']),
+    })
+    data['purchase_invoice_number'] = (
+        chunk['numero_facture_achat'].str.strip().replace('', None) if 'numero_facture_achat' in chunk else None
+    )
+    data['purchase_invoice_date'] = (
+        pd.to_datetime(chunk['date_facture_achat'], errors='coerce', dayfirst=True) if 'date_facture_achat' in chunk else pd.NaT
+    )
+
+    errors = pd.Series('', index=data.index)
+    rules = [
+        (data['code'] == '', "Code manquant"),
+        (data['name'] == '', "Nom manquant"),
+        (data['purchase_price'].isna() | (data['purchase_price'] < 0), "Prix d'achat invalide"),
+        (data['selling_price'].isna() | (data['selling_price'] < 0), "Prix de vente invalide"),
+        (~data['tax_rate'].isin(TAX_RATES), "Taux de TVA invalide (0, 9 ou 19)"),
+        (data['quantity'].isna() | (data['quantity'] < 0) | (data['quantity'] % 1 != 0), "Quantité invalide"),
+    ]
+    for mask, message in rules:
+        errors[mask] = errors[mask] + message + '; '
+
+    invalid = errors != ''
+    report = pd.DataFrame({
+        'Ligne': data.index[invalid] + first_line,
+        'Code': data.loc[invalid, 'code'],
+        'Erreur': errors[invalid].str.rstrip('; '),
+    })
+    valid = data[~invalid].astype({'quantity': int})
+    return valid, report
+
+
+# إدراج السلع الجديدة (بكمية صفر) أو تحديث ثمن الشراء وفاتورته دفعة واحدة: INSERT ... ON CONFLICT(code) DO UPDATE
+# ثم الكميات كدفعات بتكلفتها (receive_lots) مرتبطة بفواتير الشراء، حتى لا يضيع ثمن الشراء عند إعادة التزويد
+# الرمز المكرر في الدفعة: سطر واحد للسلعة (الأخير، كما لو قرئت السطور بالترتيب) لأن ON CONFLICT لا يحدث السطر مرتين
+# في PostgreSQL، ودفعة مخزون لكل سطر
+def upsert_products(session, valid):
+    if valid.empty:
+        return
+    now = datetime.now()
+    records = [
+        {**record, 'entry_date': now, 'purchase_invoice_date': None if pd.isna(record['purchase_invoice_date'])
+         else record['purchase_invoice_date'].to_pydatetime()}
+        for record in valid.to_dict('records')
+    ]
+    dialect = session.bind.dialect.name
+    table = Product.__table__
+    if dialect in ('sqlite', 'postgresql'):
+        statement = (sqlite.insert(table) if dialect == 'sqlite' else postgresql.insert(table))
+        statement = statement.on_conflict_do_update(
+            index_elements=['code'],
+            set_={
+                'purchase_price': statement.excluded.purchase_price,
+                'purchase_invoice_number': statement.excluded.purchase_invoice_number,
+                'purchase_invoice_date': statement.excluded.purchase_invoice_date,
+            },
+        )
+        products = {record['code']: {**record, 'quantity': 0, 'stock_value': 0} for record in records}
+        session.execute(statement, list(products.values()))
+    else:
+        raise ValueError(f"Import non pris en charge pour {dialect}")
+
+    # فاتورة شراء لكل رقم مختلف في الدفعة، ثم دفعة مخزون لكل سطر (الرصيد، القيمة، آخر ثمن شراء، الحركة)
+    ids = dict(session.execute(select(Product.code, Product.id).where(Product.code.in_(valid['code'].unique().tolist()))).all())
+    invoices = {}
+    for record in records:
+        number = record['purchase_invoice_number']
+        if number and record['quantity'] and number not in invoices:
+            invoices[number] = purchase_invoice(session, None, number, record['purchase_invoice_date']).id
+    receive_lots(session, [
+        {'product_id': ids[record['code']], 'quantity': record['quantity'], 'unit_cost': record['purchase_price'],
+         'purchase_invoice_id': invoices.get(record['purchase_invoice_number']),
+         'reference': record['purchase_invoice_number']}
+        for record in records
+    ])
+
+
+# استيراد ملف CSV أو XLSX: معاملة واحدة لكل دفعة، والسطور الخاطئة تذكر في التقرير دون إيقاف الاستيراد
+# progress(lines) تستدعى بعد كل دفعة
+def import_products(session, file, filename, chunksize=CHUNK_SIZE, progress=None):
+    result = ImportResult()
+    reports = []
+    first_line = 2  # السطر الأول هو العناوين
+    for chunk in read_chunks(file, filename, chunksize):
+        valid, report = validate(chunk, first_line)
+        try:
+            upsert_products(session, valid)
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        first_line += len(chunk)
+        result.rows += len(chunk)
+        result.imported += len(valid)
+        reports.append(report)
+        if progress:
+            progress(result.rows)
+    if reports:
+        result.errors = pd.concat(reports, ignore_index=True)
+    return result
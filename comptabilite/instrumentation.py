@@ -0,0 +1,169 @@
+import heapq
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import numpy as np
+from sqlalchemy import event
+
+from .config import PERF_LOG, SLOW_QUERY_MS
+
+WINDOW = 1000  # عدد القياسات الأخيرة المحفوظة لكل اسم
+SLOWEST = 20  # عدد أبطأ الاستعلامات المحفوظة
+
+
+# مجال قياس (إعادة تشغيل قسم، عملية...): المدة وعدد الاستعلامات المنفذة داخله في نفس الخيط
+class Span:
+    __slots__ = ('name', 'queries', 'sql_ms', 'ms')
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.ms = None
+
+    def summary(self):
+        return {'name': self.name, 'ms': round(self.ms or 0, 3), 'queries': self.queries, 'sql_ms': round(self.sql_ms, 3)}
+
+
+# مسجل القياسات في الذاكرة: نافذة متحركة لكل اسم (sql، pdf، section...) وأبطأ الاستعلامات،
+# مع سجل JSON-lines اختياري للتحليل لاحقًا
+class Recorder:
+    def __init__(self, window=WINDOW, slowest=SLOWEST, log_path=None, slow_query_ms=SLOW_QUERY_MS):
+        self.window = window
+        self.slowest_size = slowest
+        self.log_path = log_path
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._samples = defaultdict(lambda: deque(maxlen=self.window))
+            self._counts = defaultdict(int)
+            self._slowest = []
+
+    def _spans(self):
+        spans = getattr(self._local, 'spans', None)
+        if spans is None:
+            spans = self._local.spans = []
+        return spans
+
+    def record(self, name, ms, **extra):
+        with self._lock:
+            self._samples[name].append(ms)
+            self._counts[name] += 1
+        if self.log_path:
+            self._write({'name': name, 'ms': round(ms, 3), **extra})
+
+    def record_statement(self, statement, ms):
+        for span in self._spans():
+            span.queries += 1
+            span.sql_ms += ms
+        with self._lock:
+            self._samples['sql'].append(ms)
+            self._counts['sql'] += 1
+            entry = (ms, statement)
+            if len(self._slowest) < self.slowest_size:
+                heapq.heappush(self._slowest, entry)
+            elif ms > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+        if self.log_path and ms >= self.slow_query_ms:
+            self._write({'name': 'sql', 'ms': round(ms, 3), 'statement': statement})
+
+    def _write(self, record):
+        line = json.dumps({'ts': datetime.now().isoformat(timespec='milliseconds'), **record}, ensure_ascii=False)
+        with self._lock, open(self.log_path, 'a', encoding='utf-8') as log_file:
+            log_file.write(line + '\n')
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def timed(self, name):
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def span(self, name):
+        span = Span(name)
+        spans = self._spans()
+        spans.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.ms = (time.perf_counter() - start) * 1000
+            spans.remove(span)
+            self.record(name, span.ms, queries=span.queries, sql_ms=round(span.sql_ms, 3))
+
+    # النسب المئوية لكل اسم على النافذة الحالية
+    def stats(self):
+        with self._lock:
+            samples = {name: np.array(values) for name, values in self._samples.items() if values}
+            counts = dict(self._counts)
+        return [
+            {
+                'name': name,
+                'count': counts[name],
+                'p50_ms': round(float(np.percentile(values, 50)), 3),
+                'p90_ms': round(float(np.percentile(values, 90)), 3),
+                'p99_ms': round(float(np.percentile(values, 99)), 3),
+                'max_ms': round(float(values.max()), 3),
+            }
+            for name, values in sorted(samples.items())
+        ]
+
+    def slowest(self):
+        with self._lock:
+            return [{'ms': round(ms, 3), 'statement': statement} for ms, statement in sorted(self._slowest, reverse=True)]
+
+    # توزيع القياسات على مجالات لوغاريتمية (للرسم البياني)
+    def histogram(self, name, bins=20):
+        with self._lock:
+            values = np.array(self._samples.get(name, ()))
+        if not len(values):
+            return [], []
+        low = max(values.min(), 0.001)
+        edges = np.geomspace(low, max(values.max(), low * 2), bins + 1)
+        counts, edges = np.histogram(values, bins=edges)
+        return counts.tolist(), edges.tolist()
+
+
+recorder = Recorder(log_path=PERF_LOG)
+
+
+# توقيت كل استعلام SQL على المحرك (الاستعلامات المتداخلة تحفظ في مكدس على الاتصال)
+def instrument_engine(engine, target=None):
+    target = target or recorder
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['query_start'].pop()
+        target.record_statement(statement, (time.perf_counter() - start) * 1000)
+
+    def error(exception_context):
+        starts = exception_context.connection.info.get('query_start') if exception_context.connection else None
+        if starts:
+            starts.pop()
+
+    event.listen(engine, 'before_cursor_execute', before)
+    event.listen(engine, 'after_cursor_execute', after)
+    event.listen(engine, 'handle_error', error)
+    return engine
@@ -0,0 +1,185 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import String, and_, cast, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.exc import StaleDataError
+
+from .costing import consume_lots
+from .models import Customer, Invoice, InvoiceItem, Product
+from .money import from_cents
+from .numbering import DEFAULT_SERIES, next_number
+from .stock import SALE, record_movements
+from .taxes import CASH, compute_invoice
+
+PAYMENT_METHODS = [CASH, "Chèque", "Virement bancaire"]
+
+
+class InvoiceError(Exception):
+    pass
+
+
+class InsufficientStock(InvoiceError):
+    def __init__(self, code, name):
+        super().__init__(f"La quantité demandée de {name} (Code: {code}) n'est pas disponible.")
+        self.code = code
+        self.name = name
+
+
+# فاتورة لم تصدر بسبب خطأ في قاعدة البيانات: معاملتها ألغيت، فلا شيء منها محفوظ
+# conflict: تعارض مع صندوق آخر أو قفل (يمكن إعادة المحاولة)، وإلا خطأ داخلي
+class InvoiceNotIssued(InvoiceError):
+    def __init__(self, error):
+        super().__init__(f"Facture non émise, erreur de base de données: {type(error).__name__}")
+        self.conflict = isinstance(error, (IntegrityError, OperationalError, StaleDataError))
+
+
+# شروط فترة على تاريخ الفاتورة: من بداية يوم date_from إلى نهاية يوم date_to (شامل)، مع استعمال الفهرس على التاريخ
+def date_filters(date_from=None, date_to=None):
+    conditions = []
+    if date_from:
+        conditions.append(Invoice.date >= datetime.combine(date_from, time.min))
+    if date_to:
+        conditions.append(Invoice.date < datetime.combine(date_to + timedelta(days=1), time.min))
+    return conditions
+
+
+# قائمة الفواتير صفحة بصفحة (keyset) مع التصفية في قاعدة البيانات
+# after: آخر (date, id) من الصفحة السابقة، والنتيجة مرتبة من الأحدث إلى الأقدم
+def list_invoices(session, date_from=None, date_to=None, customer=None, payment_method=None,
+                  min_amount=None, max_amount=None, number=None, after=None, limit=20):
+    # فواتير الأرشيفات السابقة للترقيم تعرض بمعرفها
+    query = (
+        select(Invoice.id, func.coalesce(Invoice.number, cast(Invoice.id, String)).label('number'), Invoice.date,
+               Customer.name.label('customer_name'), Invoice.payment_method, Invoice.total_amount)
+        .outerjoin(Customer, Invoice.customer_id == Customer.id)
+    )
+    query = query.where(*date_filters(date_from, date_to))
+    if customer:
+        query = query.where(Customer.name.ilike(f"%{customer}%"))
+    if payment_method:
+        query = query.where(Invoice.payment_method == payment_method)
+    if min_amount is not None:
+        query = query.where(Invoice.total_amount >= min_amount)
+    if max_amount is not None:
+        query = query.where(Invoice.total_amount <= max_amount)
+    if number:
+        query = query.where(Invoice.number == number.strip())
+    if after:
+        last_date, last_id = after
+        query = query.where(or_(Invoice.date < last_date, and_(Invoice.date == last_date, Invoice.id < last_id)))
+
+    # جلب عنصر إضافي لمعرفة وجود صفحة تالية دون COUNT(*)
+    rows = session.execute(query.order_by(Invoice.date.desc(), Invoice.id.desc()).limit(limit + 1)).all()
+    next_cursor = (rows[limit - 1].date, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+# تحميل الفاتورة مع الزبون وكل السطور ومنتجاتها في استعلامين فقط
+def get_invoice(session, invoice_id):
+    query = (
+        select(Invoice)
+        .options(joinedload(Invoice.customer), selectinload(Invoice.items).joinedload(InvoiceItem.product))
+        .where(Invoice.id == invoice_id)
+    )
+    return session.execute(query).scalar_one_or_none()
+
+
+# إصدار فاتورة في معاملة واحدة قصيرة: خصم المخزون بتحديث مشروط ثم إدراج الفاتورة وسطورها
+# lines: قائمة (product_id, quantity)
+def issue_invoice(session, customer_id, lines, payment_method, series=DEFAULT_SERIES):
+    quantities = defaultdict(int)
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    if not quantities:
+        raise InvoiceError("Aucun produit sélectionné.")
+    if any(quantity <= 0 for quantity in quantities.values()):
+        raise InvoiceError("Les quantités doivent être positives.")
+    if payment_method not in PAYMENT_METHODS:
+        raise InvoiceError(f"Méthode de paiement inconnue: {payment_method}")
+    if customer_id is None or session.get(Customer, customer_id) is None:
+        raise InvoiceError(f"Client introuvable: {customer_id}")
+
+    # ترتيب ثابت للمنتجات حتى لا تتعارض الأقفال بين صناديق متعددة
+    product_ids = sorted(quantities)
+    products = {
+        p.id: p for p in session.execute(
+            select(Product.id, Product.code, Product.name, Product.selling_price, Product.tax_rate)
+            .where(Product.id.in_(product_ids))
+        )
+    }
+    missing = [product_id for product_id in product_ids if product_id not in products]
+    if missing:
+        raise InvoiceError(f"Produit introuvable: {missing[0]}")
+
+    try:
+        # خصم ذري: لا يتم إلا إذا كانت الكمية كافية لحظة التحديث
+        for product_id in product_ids:
+            quantity = quantities[product_id]
+            result = session.execute(
+                update(Product)
+                .where(Product.id == product_id, Product.quantity >= quantity)
+                .values(quantity=Product.quantity - quantity)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                product = products[product_id]
+                raise InsufficientStock(product.code, product.name)
+
+        # تكلفة البضاعة المباعة (FIFO أو CMUP) تحسب الآن وتحفظ في السطور، فلا تعيد التقارير حسابها
+        costs = consume_lots(session, quantities)
+
+        # حساب HT و TVA و TTC وضريبة الطابع لكل السطور دفعة واحدة بالسنتيمات
+        totals = compute_invoice(
+            [products[product_id].selling_price or 0 for product_id in product_ids],
+            [quantities[product_id] for product_id in product_ids],
+            [products[product_id].tax_rate or 0 for product_id in product_ids],
+            payment_method,
+        )
+
+        # الرقم القانوني يحجز في نفس المعاملة، بعد كل التحققات وقبل الإدراج مباشرة
+        now = datetime.now()
+        invoice = Invoice(customer_id=customer_id, date=now, number=next_number(session, now.year, series),
+                          payment_method=payment_method, total_ht=from_cents(totals.total_ht),
+                          total_tax=from_cents(totals.total_tax),
+                          stamp_tax=from_cents(totals.stamp_tax), total_amount=from_cents(totals.total_amount))
+        session.add(invoice)
+        session.flush()
+
+        # إدراج كل السطور مع مبالغها المحسوبة دفعة واحدة (executemany)
+        session.execute(insert(InvoiceItem), [
+            {'invoice_id': invoice.id, 'product_id': product_id, 'quantity': quantities[product_id],
+             'price': products[product_id].selling_price or 0, 'tax_rate': products[product_id].tax_rate or 0,
+             'cost': from_cents(costs[product_id]), **amounts}
+            for product_id, amounts in zip(product_ids, totals.line_amounts())
+        ])
+
+        # حركات الخروج في سجل المخزون
+        record_movements(session, [
+            {'product_id': product_id, 'quantity': -quantities[product_id], 'kind': SALE,
+             'reference': invoice.number, 'invoice_id': invoice.id}
+            for product_id in product_ids
+        ])
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    return invoice
+
+
+# إصدار عدة فواتير في طلب واحد (صناديق البيع)، كل فاتورة في معاملتها الخاصة:
+# رفض فاتورة لنقص المخزون لا يلغي الفواتير الأخرى
+# orders: قائمة (customer_id, lines, payment_method, series)، والنتيجة لكل طلب فاتورة أو خطأ InvoiceError
+# خطأ القاعدة في طلب يلغي معاملته وحدها ويسجل كـ InvoiceNotIssued، فتعرف الصناديق ما صدر فعلًا
+def issue_invoices(session, orders):
+    results = []
+    for customer_id, lines, payment_method, series in orders:
+        try:
+            results.append(issue_invoice(session, customer_id, lines, payment_method, series))
+        except InvoiceError as error:
+            results.append(error)
+        except SQLAlchemyError as error:
+            session.rollback()
+            results.append(InvoiceNotIssued(error))
+    return results
@@ -0,0 +1,159 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index, func
+from sqlalchemy.orm import declarative_base, relationship
+
+from .money import Money
+
+Base = declarative_base()
+
+# جدول الزبائن (فهارس للبحث بالاسم، الهاتف، الرقم الجبائي والسجل التجاري)
+class Customer(Base):
+    __tablename__ = 'customers'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    address = Column(String)
+    phone = Column(String, index=True)
+    commercial_register = Column(String, index=True)  # السجل التجاري
+    tax_number = Column(String, index=True)  # الرقم الجبائي
+    statistical_number = Column(String)  # الرقم الإحصائي
+    material_number = Column(String)  # رقم المادة
+
+    # البحث بالاسم دون اعتبار حالة الأحرف
+    __table_args__ = (Index('ix_customers_name_lower', func.lower(name)),)
+
+# جدول الموردين (مع إضافة العنوان)
+class Supplier(Base):
+    __tablename__ = 'suppliers'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    address = Column(String)  # العنوان
+    commercial_register = Column(String)  # السجل التجاري
+    tax_number = Column(String)  # الرقم الجبائي
+    statistical_number = Column(String)  # الرقم الإحصائي
+    material_number = Column(String)  # رقم المادة
+
+# جدول معلومات التاجر (التي تظهر في الفاتورة)
+class TraderInfo(Base):
+    __tablename__ = 'trader_info'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    commercial_register = Column(String)  # السجل التجاري
+    tax_number = Column(String)  # الرقم الجبائي
+    statistical_number = Column(String)  # الرقم الإحصائي
+    material_number = Column(String)  # رقم المادة
+
+# جدول السلع (المبالغ بالسنتيمات في قاعدة البيانات)
+class Product(Base):
+    __tablename__ = 'products'
+    id = Column(Integer, primary_key=True)
+    code = Column(String, unique=True, index=True)  # رمز المنتج (فريد)
+    name = Column(String)
+    purchase_price = Column('purchase_price_cents', Money, key='purchase_price')  # آخر ثمن شراء
+    selling_price = Column('selling_price_cents', Money, key='selling_price')  # ثمن البيع
+    tax_rate = Column(Float)  # نسبة الضريبة (0%, 9%, 19%)
+    quantity = Column(Integer)  # الكمية المتاحة
+    entry_date = Column(DateTime, default=datetime.now)  # تاريخ الإدخال
+    purchase_invoice_number = Column(String)  # رقم فاتورة الشراء
+    purchase_invoice_date = Column(DateTime)  # تاريخ فاتورة الشراء
+    # قيمة الكمية المتاحة بالتكلفة (مجموع الدفعات المتبقية في FIFO، أو الكمية × التكلفة المتوسطة في CMUP)
+    stock_value = Column('stock_value_cents', Money, key='stock_value')
+
+# فواتير الشراء من الموردين
+class PurchaseInvoice(Base):
+    __tablename__ = 'purchase_invoices'
+    id = Column(Integer, primary_key=True)
+    supplier_id = Column(Integer, ForeignKey('suppliers.id'), index=True)
+    supplier = relationship("Supplier")
+    number = Column(String)  # رقم فاتورة المورد
+    date = Column(DateTime, default=datetime.now, index=True)
+    entry_date = Column(DateTime, default=datetime.now)  # تاريخ الإدخال
+    lots = relationship("PurchaseLot", back_populates="purchase_invoice", order_by="PurchaseLot.id")
+
+# دفعات الشراء: كل دخول إلى المخزن بتكلفته، وremaining ما بقي منه دون بيع (يستهلك بالأقدم أولاً)
+class PurchaseLot(Base):
+    __tablename__ = 'purchase_lots'
+    id = Column(Integer, primary_key=True)
+    purchase_invoice_id = Column(Integer, ForeignKey('purchase_invoices.id'), index=True)
+    purchase_invoice = relationship("PurchaseInvoice", back_populates="lots")
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    product = relationship("Product")
+    quantity = Column(Integer, nullable=False)
+    remaining = Column(Integer, nullable=False)
+    unit_cost = Column('unit_cost_cents', Money, key='unit_cost')
+    date = Column(DateTime, default=datetime.now, nullable=False)
+
+    # الدفعات المفتوحة لسلعة بترتيب دخولها
+    __table_args__ = (Index('ix_purchase_lots_product_remaining', 'product_id', 'remaining'),)
+
+# جدول الفواتير
+class Invoice(Base):
+    __tablename__ = 'invoices'
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey('customers.id'), index=True)
+    customer = relationship("Customer")
+    date = Column(DateTime, default=datetime.now, index=True)
+    number = Column(String, unique=True, index=True)  # الرقم القانوني المتسلسل لكل سنة: 2026/000123
+    payment_method = Column(String)
+    total_ht = Column('total_ht_cents', Money, key='total_ht')
+    total_tax = Column('total_tax_cents', Money, key='total_tax')
+    stamp_tax = Column('stamp_tax_cents', Money, key='stamp_tax')
+    total_amount = Column('total_amount_cents', Money, key='total_amount')  # TTC مع ضريبة الطابع
+    items = relationship("InvoiceItem", back_populates="invoice", order_by="InvoiceItem.id")
+    version = Column(Integer, nullable=False, server_default='1')  # يزداد مع كل تعديل للفاتورة
+
+    __mapper_args__ = {'version_id_col': version}
+
+# عدادات ترقيم الفواتير: سطر لكل (سنة، سلسلة) يحمل آخر رقم مستعمل
+class InvoiceCounter(Base):
+    __tablename__ = 'invoice_counters'
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    series = Column(String, primary_key=True, default='')
+    last_number = Column(Integer, nullable=False, default=0)
+
+# جدول تفاصيل الفاتورة
+class InvoiceItem(Base):
+    __tablename__ = 'invoice_items'
+    id = Column(Integer, primary_key=True)
+    invoice_id = Column(Integer, ForeignKey('invoices.id'), index=True)
+    invoice = relationship("Invoice", back_populates="items")
+    product_id = Column(Integer, ForeignKey('products.id'))
+    quantity = Column(Integer)
+    product = relationship("Product")
+    price = Column('price_cents', Money, key='price')  # السعر الذي تم فوترة السلعة به
+    # الضريبة والمجاميع المحسوبة عند الإصدار، حتى لا يعاد حسابها عند الطباعة أو في التقارير
+    tax_rate = Column(Float)
+    total_ht = Column('total_ht_cents', Money, key='total_ht')
+    tax_amount = Column('tax_amount_cents', Money, key='tax_amount')
+    total_ttc = Column('total_ttc_cents', Money, key='total_ttc')
+    cost = Column('cost_cents', Money, key='cost')  # تكلفة الكمية المباعة (FIFO أو CMUP) المحسوبة عند الإصدار
+
+# سجل حركات المخزون: كل دخول (شراء) أو خروج (بيع) يضاف كسطر، والكمية في products هي الرصيد الحالي
+class StockMovement(Base):
+    __tablename__ = 'stock_movements'
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    product = relationship("Product")
+    quantity = Column(Integer, nullable=False)  # موجبة عند الدخول وسالبة عند الخروج
+    kind = Column(String, nullable=False)  # ouverture, achat, vente, ajustement
+    reference = Column(String)  # رقم فاتورة الشراء أو البيع
+    invoice_id = Column(Integer, ForeignKey('invoices.id'))
+    date = Column(DateTime, default=datetime.now, nullable=False)
+
+    __table_args__ = (Index('ix_stock_movements_product_date', 'product_id', 'date'),)
+
+# السنوات المالية المغلقة: فواتيرها نقلت إلى قاعدة أرشيف للقراءة فقط، ويبقى هنا ملخصها
+# ومجال معرفاتها لإيجاد الأرشيف الذي يحتوي فاتورة معينة
+class FiscalYear(Base):
+    __tablename__ = 'fiscal_years'
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    closed_at = Column(DateTime, default=datetime.now, nullable=False)
+    archive = Column(String, nullable=False)  # اسم ملف الأرشيف داخل COMPTA_ARCHIVE_DIR
+    invoices = Column(Integer, nullable=False)
+    invoice_items = Column(Integer, nullable=False)
+    first_invoice_id = Column(Integer)
+    last_invoice_id = Column(Integer)
+    total_ht = Column('total_ht_cents', Money, key='total_ht')
+    total_tax = Column('total_tax_cents', Money, key='total_tax')
+    stamp_tax = Column('stamp_tax_cents', Money, key='stamp_tax')
+    total_amount = Column('total_amount_cents', Money, key='total_amount')
@@ -0,0 +1,44 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from sqlalchemy import BigInteger, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+CENT = Decimal('0.01')
+
+
+# تحويل أي مبلغ (Decimal أو نص أو float) إلى Decimal بسنتيمين بالضبط
+def to_decimal(value):
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_cents(value):
+    return int(to_decimal(value) * 100)
+
+
+def from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+# عرض المبلغ بالشكل الفرنسي: 1 189,99
+def format_money(value):
+    return f"{to_decimal(value):,.2f}".replace(',', ' ').replace('.', ',')
+
+
+# مبلغ مخزن كعدد صحيح من السنتيمات في قاعدة البيانات ويقرأ كـ Decimal في الكود
+# BIGINT حتى لا يتجاوز مجموع فاتورة كبيرة حدود INTEGER في PostgreSQL
+class Money(TypeDecorator):
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_cents(value)
+
+
+# العمود بالسنتيمات كعدد صحيح، للحسابات والتجميع في SQL
+def cents(column):
+    return type_coerce(column, BigInteger)
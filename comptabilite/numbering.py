@@ -0,0 +1,81 @@
+import re
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import Invoice, InvoiceCounter
+
+DEFAULT_SERIES = ''
+DIGITS = 6
+NUMBER_PATTERN = re.compile(r'^(?:(?P<series>[A-Z0-9]+)-)?(?P<year>\d{4})/(?P<sequence>\d+)$')
+
+
+# الرقم القانوني للفاتورة: 2026/000123، أو A-2026/000123 لسلسلة أخرى
+def format_number(year, sequence, series=DEFAULT_SERIES):
+    number = f"{year}/{sequence:0{DIGITS}d}"
+    return f"{series}-{number}" if series else number
+
+
+def number_year(number):
+    match = NUMBER_PATTERN.match(number.strip())
+    return int(match['year']) if match else None
+
+
+def _insert_counter(dialect_name, year, series):
+    values = {'year': year, 'series': series, 'last_number': 0}
+    if dialect_name == 'sqlite':
+        return sqlite.insert(InvoiceCounter).values(**values).on_conflict_do_nothing()
+    if dialect_name == 'postgresql':
+        return postgresql.insert(InvoiceCounter).values(**values).on_conflict_do_nothing()
+    return insert(InvoiceCounter).values(**values)
+
+
+# حجز الرقم التالي لسنة وسلسلة داخل معاملة الفاتورة: قراءة العداد ثم تحديث مشروط بقيمته (compare-and-swap)
+# إذا سبقه صندوق آخر لا يتحقق الشرط فيعاد المحاولة بالقيمة الجديدة، والتراجع عن الفاتورة يتراجع عن الرقم
+# فلا تضيع أرقام؛ يستدعى في آخر المعاملة حتى لا يبقى سطر العداد مقفلًا إلا لحظة الإدراج
+def next_number(session, year, series=DEFAULT_SERIES):
+    counter = (InvoiceCounter.year == year) & (InvoiceCounter.series == series)
+    while True:
+        current = session.execute(select(InvoiceCounter.last_number).where(counter)).scalar()
+        if current is None:
+            session.execute(_insert_counter(session.bind.dialect.name, year, series))
+            continue
+        result = session.execute(
+            update(InvoiceCounter)
+            .where(counter, InvoiceCounter.last_number == current)
+            .values(last_number=current + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            return format_number(year, current + 1, series)
+
+
+# ترقيم الفواتير القديمة بترتيب التاريخ داخل كل سنة، ومتابعة العدادات بعدها
+def number_invoices(conn, series=DEFAULT_SERIES):
+    invoices = conn.execute(
+        select(Invoice.id, Invoice.date).where(Invoice.number.is_(None)).order_by(Invoice.date, Invoice.id)
+    ).all()
+    if not invoices:
+        return
+    counters = dict(conn.execute(
+        select(InvoiceCounter.year, InvoiceCounter.last_number).where(InvoiceCounter.series == series)
+    ).all())
+    existing = set(counters)
+    numbers = []
+    for invoice in invoices:
+        year = invoice.date.year
+        counters[year] = counters.get(year, 0) + 1
+        numbers.append({'invoice_id': invoice.id, 'invoice_number': format_number(year, counters[year], series)})
+    invoices_table = Invoice.__table__
+    conn.execute(
+        update(invoices_table)
+        .where(invoices_table.c.id == bindparam('invoice_id'))
+        .values(number=bindparam('invoice_number')),
+        numbers,
+    )
+    for year, last_number in counters.items():
+        if year in existing:
+            conn.execute(update(InvoiceCounter).where(InvoiceCounter.year == year, InvoiceCounter.series == series)
+                         .values(last_number=last_number))
+        else:
+            conn.execute(insert(InvoiceCounter).values(year=year, series=series, last_number=last_number))
@@ -0,0 +1,65 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf.fonts import SubsetMap, TTFFont
+
+FONT_FAMILY = 'DejaVu'
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts', 'DejaVuSansCondensed.ttf')
+
+
+# قراءة ملف الخط وحساب مقاييسه (عرض الحروف، جدول cmap...) مرة واحدة لكل عملية
+@lru_cache(maxsize=None)
+def _font_prototype(path):
+    with open(path, 'rb') as font_file:
+        data = font_file.read()
+    pdf = FPDF()
+    pdf.add_font(FONT_FAMILY, '', path)
+    prototype = pdf.fonts[FONT_FAMILY.lower()]
+    prototype.ttfont.close()
+    return data, prototype
+
+
+# نسخة من الخط المخزن لكل وثيقة: المقاييس مشتركة، أما جدول الخط والـ subset فخاصة بالوثيقة
+# لأن fpdf يقتطع الخط في مكانه عند الإخراج
+def _add_cached_font(pdf, path):
+    data, prototype = _font_prototype(path)
+    font = TTFFont.__new__(TTFFont)
+    for slot in TTFFont.__slots__:
+        if hasattr(prototype, slot):
+            setattr(font, slot, getattr(prototype, slot))
+    font.i = len(pdf.fonts) + 1
+    font.ttfont = ttLib.TTFont(io.BytesIO(data), recalcTimestamp=False, fontNumber=0, lazy=True)
+    font.hbfont = None
+    font.missing_glyphs = []
+    font.subset = SubsetMap(font, [ord(char) for char in "\x00 \r\n"])
+    pdf.fonts[font.fontkey] = font
+
+
+# وثيقة جديدة بصفحة واحدة والخط DejaVuSansCondensed جاهز للاستعمال
+def new_document():
+    pdf = FPDF()
+    pdf.add_page()
+    _add_cached_font(pdf, FONT_PATH)
+    return pdf
+
+
+# إخراج الوثيقة كبايتات في الذاكرة دون المرور بملف على القرص
+def render(pdf):
+    return bytes(pdf.output())
+
+
+# مجمع خيوط (أو عمليات) لإخراج ملفات PDF دون حجب واجهة المستخدم
+@lru_cache(maxsize=None)
+def get_pool(processes=False, workers=None):
+    if processes:
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers or 2, thread_name_prefix='pdf')
+
+
+def render_async(pdf):
+    return get_pool().submit(render, pdf)
+
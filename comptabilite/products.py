@@ -0,0 +1,94 @@
+import re
+from functools import lru_cache
+
+from sqlalchemy import select, text
+
+from .costing import receive_lots
+from .models import Product
+from .purchases import purchase_invoice
+
+
+# جلب عدة منتجات باستعلام IN واحد بدلاً من استعلام لكل رمز
+def get_products_by_codes(session, codes):
+    if not codes:
+        return {}
+    products = session.execute(select(Product).where(Product.code.in_(set(codes)))).scalars()
+    return {product.code: product for product in products}
+
+
+# إدخال سلعة من فاتورة مورد: إنشاؤها إذا كان رمزها جديدًا، ثم دفعة بتكلفتها مرتبطة بفاتورة الشراء
+# (الرصيد، قيمة المخزون، آخر ثمن شراء وحركة الشراء) في نفس المعاملة
+def enter_product(session, code, name, purchase_price, selling_price, tax_rate, quantity,
+                  purchase_invoice_number=None, purchase_invoice_date=None, supplier_id=None):
+    product = session.execute(select(Product).where(Product.code == code)).scalar_one_or_none()
+    if product is None:
+        product = Product(
+            code=code,
+            name=name,
+            purchase_price=purchase_price,
+            selling_price=selling_price,
+            tax_rate=tax_rate,
+            quantity=0,
+            stock_value=0,
+            purchase_invoice_number=purchase_invoice_number,
+            purchase_invoice_date=purchase_invoice_date,
+        )
+        session.add(product)
+        session.flush()
+    elif purchase_invoice_number:
+        product.purchase_invoice_number = purchase_invoice_number
+        product.purchase_invoice_date = purchase_invoice_date
+    invoice_id = None
+    if quantity and (purchase_invoice_number or supplier_id is not None):
+        invoice_id = purchase_invoice(session, supplier_id, purchase_invoice_number, purchase_invoice_date).id
+    receive_lots(session, [{'product_id': product.id, 'quantity': quantity, 'unit_cost': purchase_price,
+                            'purchase_invoice_id': invoice_id, 'reference': purchase_invoice_number or None}])
+    session.commit()
+    return product
+
+
+# البحث عن السلع: الرمز المطابق (قارئ الباركود) أولاً، ثم بداية الرمز، ثم الاسم
+def search_products(session, query, limit=20):
+    query = query.strip()
+    if not query:
+        return []
+
+    # بداية الرمز كمجال على الفهرس الفريد بدلاً من LIKE، والرمز المطابق يأتي أولاً بالترتيب
+    by_code = session.execute(
+        select(Product)
+        .where(Product.code >= query, Product.code < query + '\uffff')
+        .order_by(Product.code)
+        .limit(limit)
+    ).scalars().all()
+    results = list(by_code)
+
+    if len(results) < limit:
+        seen = {p.id for p in results}
+        by_name = [p for p in _search_by_name(session, query, limit + len(seen)) if p.id not in seen]
+        results += by_name[:limit - len(results)]
+    return results
+
+
+def _search_by_name(session, query, limit):
+    tokens = re.findall(r'\w+', query)
+    if session.bind.dialect.name == 'sqlite' and tokens and _has_fts(session.bind):
+        # كل كلمة كبادئة: "لوح" يطابق "لوحة"
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        ids = session.execute(
+            text("SELECT rowid FROM products_fts WHERE products_fts MATCH :match ORDER BY rank LIMIT :limit"),
+            {'match': match, 'limit': limit},
+        ).scalars().all()
+        if not ids:
+            return []
+        products = {p.id: p for p in session.execute(select(Product).where(Product.id.in_(ids))).scalars()}
+        return [products[i] for i in ids if i in products]
+    return session.execute(
+        select(Product).where(Product.name.ilike(f'%{query}%')).order_by(Product.name).limit(limit)
+    ).scalars().all()
+
+
+# وجود فهرس FTS يفحص مرة واحدة لكل محرك (ينشئه bootstrap عند التهيئة) بدلاً من كل بحث
+@lru_cache(maxsize=None)
+def _has_fts(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")).first() is not None
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from sqlalchemy import func, select, type_coerce
+from sqlalchemy.orm import joinedload, selectinload
+
+from .costing import receive_lots
+from .models import Product, PurchaseInvoice, PurchaseLot, Supplier
+from .money import Money, cents
+
+
+class PurchaseError(Exception):
+    pass
+
+
+# فاتورة المورد التي تنتمي إليها الدفعة: تنشأ عند أول سطر منها، وتكمل بالسطور التالية بنفس الرقم
+# دون رقم تنشأ فاتورة جديدة في كل مرة حتى لا تختلط توريدات مختلفة
+def purchase_invoice(session, supplier_id, number, date=None):
+    invoice = None
+    if number:
+        supplier = PurchaseInvoice.supplier_id.is_(None) if supplier_id is None else PurchaseInvoice.supplier_id == supplier_id
+        invoice = session.execute(
+            select(PurchaseInvoice).where(supplier, PurchaseInvoice.number == number).order_by(PurchaseInvoice.id)
+        ).scalars().first()
+    if invoice is None:
+        invoice = PurchaseInvoice(supplier_id=supplier_id, number=number or None, date=date or datetime.now())
+        session.add(invoice)
+        session.flush()
+    return invoice
+
+
+# تسجيل فاتورة مورد كاملة في معاملة واحدة: دفعة لكل سطر بتكلفته، والرصيد وقيمة المخزون يحدثان معها
+# lines: قائمة (product_id, quantity, unit_cost)
+def record_purchase(session, supplier_id, number, lines, date=None):
+    if not lines:
+        raise PurchaseError("Aucun produit sélectionné.")
+    if any(quantity <= 0 for _, quantity, _ in lines):
+        raise PurchaseError("Les quantités doivent être positives.")
+    if any(unit_cost < 0 for _, _, unit_cost in lines):
+        raise PurchaseError("Les coûts d'achat doivent être positifs.")
+    if supplier_id is not None and session.get(Supplier, supplier_id) is None:
+        raise PurchaseError(f"Fournisseur introuvable: {supplier_id}")
+    product_ids = {product_id for product_id, _, _ in lines}
+    found = set(session.execute(select(Product.id).where(Product.id.in_(product_ids))).scalars())
+    missing = sorted(product_ids - found)
+    if missing:
+        raise PurchaseError(f"Produit introuvable: {missing[0]}")
+
+    try:
+        invoice = purchase_invoice(session, supplier_id, number, date)
+        receive_lots(session, [
+            {'product_id': product_id, 'quantity': quantity, 'unit_cost': unit_cost,
+             'purchase_invoice_id': invoice.id, 'reference': number or None}
+            for product_id, quantity, unit_cost in lines
+        ])
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    return invoice
+
+
+# آخر فواتير الشراء مع المورد وعدد السطور ومجموعها، محسوبة من الدفعات في استعلام تجميعي واحد
+def list_purchase_invoices(session, supplier_id=None, limit=50):
+    query = (
+        select(
+            PurchaseInvoice.id, PurchaseInvoice.number, PurchaseInvoice.date, Supplier.name.label('supplier_name'),
+            func.count(PurchaseLot.id).label('lines'),
+            type_coerce(func.coalesce(func.sum(PurchaseLot.quantity * cents(PurchaseLot.unit_cost)), 0), Money).label('total'),
+        )
+        .outerjoin(Supplier, PurchaseInvoice.supplier_id == Supplier.id)
+        .outerjoin(PurchaseLot, PurchaseLot.purchase_invoice_id == PurchaseInvoice.id)
+        .group_by(PurchaseInvoice.id, PurchaseInvoice.number, PurchaseInvoice.date, Supplier.name)
+        .order_by(PurchaseInvoice.date.desc(), PurchaseInvoice.id.desc())
+        .limit(limit)
+    )
+    if supplier_id is not None:
+        query = query.where(PurchaseInvoice.supplier_id == supplier_id)
+    return session.execute(query).all()
+
+
+# فاتورة الشراء مع المورد وكل الدفعات ومنتجاتها
+def get_purchase_invoice(session, purchase_invoice_id):
+    query = (
+        select(PurchaseInvoice)
+        .options(joinedload(PurchaseInvoice.supplier), selectinload(PurchaseInvoice.lots).joinedload(PurchaseLot.product))
+        .where(PurchaseInvoice.id == purchase_invoice_id)
+    )
+    return session.execute(query).scalar_one_or_none()
@@ -0,0 +1,204 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from decimal import Decimal
+
+from num2words import num2words  # لتحويل الأرقام إلى كلمات
+
+from .instrumentation import recorder
+from .money import format_money
+from .pdf import get_pool, new_document, render
+
+# عرض أعمدة جدول السلع (المجموع 190 مم = عرض صفحة A4 دون الهوامش)
+COLUMNS = (
+    ("Code", 22), ("Produit", 48), ("Quantité", 20), ("Prix unitaire", 25),
+    ("Prix total", 25), ("TVA", 25), ("Total", 25),
+)
+
+
+# نموذج عرض ثابت لطرف في الفاتورة (الزبون أو التاجر)
+@dataclass(frozen=True, slots=True)
+class PartyView:
+    name: str = None
+    address: str = None
+    commercial_register: str = None
+    tax_number: str = None
+    statistical_number: str = None
+    material_number: str = None
+
+    @classmethod
+    def from_record(cls, record):
+        if record is None:
+            return None
+        return cls(**{field.name: getattr(record, field.name, None) for field in fields(cls)})
+
+
+@dataclass(frozen=True, slots=True)
+class InvoiceLineView:
+    code: str
+    name: str
+    quantity: int
+    unit_price: Decimal
+    total_ht: Decimal
+    tax: Decimal
+    total: Decimal
+
+
+# نموذج عرض ثابت للفاتورة: كل ما يلزم للطباعة، دون أي ارتباط بجلسة قاعدة البيانات
+@dataclass(frozen=True, slots=True)
+class InvoiceView:
+    id: int
+    number: str
+    version: int
+    date: str
+    payment_method: str
+    customer: PartyView
+    trader: PartyView
+    lines: tuple
+    total_ht: Decimal
+    total_tax: Decimal
+    stamp_tax: Decimal
+    total_amount: Decimal
+
+    @classmethod
+    def from_invoice(cls, invoice, trader_info=None):
+        # المبالغ كما حسبت وخزنت عند الإصدار، دون إعادة حسابها
+        lines = tuple(
+            InvoiceLineView(item.product.code, item.product.name, item.quantity, item.price,
+                            item.total_ht, item.tax_amount, item.total_ttc)
+            for item in invoice.items
+        )
+        return cls(
+            id=invoice.id,
+            number=invoice.number or str(invoice.id),  # فواتير الأرشيفات السابقة للترقيم
+            version=invoice.version,
+            date=invoice.date.strftime('%Y-%m-%d'),
+            payment_method=invoice.payment_method,
+            customer=PartyView.from_record(invoice.customer) or PartyView(),
+            trader=PartyView.from_record(trader_info),
+            lines=lines,
+            total_ht=invoice.total_ht,
+            total_tax=invoice.total_tax,
+            stamp_tax=invoice.stamp_tax,
+            total_amount=invoice.total_amount,
+        )
+
+    # بصمة المحتوى: تتغير مع أي تعديل في الفاتورة أو في معلومات الأطراف
+    @property
+    def digest(self):
+        return hashlib.sha256(repr(self).encode('utf-8')).hexdigest()
+
+    # السطور بالشكل المعروض في الجداول
+    def rows(self):
+        return [
+            {
+                'Code du produit': line.code,
+                'Nom du produit': line.name,
+                'Quantité': line.quantity,
+                'Prix unitaire': line.unit_price,
+                'Prix total': line.total_ht,
+                'TVA': line.tax,
+                'Total': line.total,
+            }
+            for line in self.lines
+        ]
+
+
+# المبلغ بالحروف: الدنانير ثم السنتيمات إن وجدت
+def amount_in_words(amount):
+    dinars, centimes = divmod(int(amount * 100), 100)
+    words = f"{num2words(dinars, lang='fr').capitalize()} dinars"
+    if centimes:
+        words += f" et {num2words(centimes, lang='fr')} centimes"
+    return words
+
+
+# تخطيط الفاتورة: دالة على مستوى الوحدة حتى يمكن تنفيذها في عملية أخرى
+@recorder.timed('pdf.facture')
+def draw_invoice(view):
+    customer, trader = view.customer, view.trader
+
+    # إنشاء ملف PDF للفاتورة مع الخط DejaVuSansCondensed المحمل مسبقًا
+    pdf = new_document()
+
+    # تكبير كلمة FACTURE
+    pdf.set_font('DejaVu', '', 24)
+    pdf.cell(190, 10, txt="FACTURE", ln=True, align='C')
+
+    # تصغير معلومات الزبون
+    pdf.set_font('DejaVu', '', 10)
+    pdf.cell(95, 10, txt=f"Numéro de facture: {view.number}")
+    pdf.cell(95, 10, txt=f"Date: {view.date}", ln=True)
+    pdf.cell(95, 10, txt=f"Nom du client: {customer.name}")
+    pdf.cell(95, 10, txt=f"Adresse: {customer.address}", ln=True)
+    pdf.cell(95, 10, txt=f"Registre de commerce: {customer.commercial_register}")
+    pdf.cell(95, 10, txt=f"Numéro fiscal: {customer.tax_number}", ln=True)
+    pdf.cell(95, 10, txt=f"Numéro statistique: {customer.statistical_number}")
+    pdf.cell(95, 10, txt=f"Numéro de matériel: {customer.material_number}", ln=True)
+
+    # إضافة معلومات التاجر إلى الفاتورة
+    if trader:
+        pdf.cell(95, 10, txt=f"Nom du commerçant: {trader.name}")
+        pdf.cell(95, 10, txt=f"Registre de commerce: {trader.commercial_register}", ln=True)
+        pdf.cell(95, 10, txt=f"Numéro fiscal: {trader.tax_number}")
+        pdf.cell(95, 10, txt=f"Numéro statistique: {trader.statistical_number}", ln=True)
+        pdf.cell(95, 10, txt=f"Numéro de matériel: {trader.material_number}", ln=True)
+
+    # تفاصيل السلع في الفاتورة - باستخدام جدول
+    pdf.ln(10)
+    pdf.set_font('DejaVu', '', 10)
+    for index, (title, width) in enumerate(COLUMNS):
+        pdf.cell(width, 10, txt=title, border=1, ln=index == len(COLUMNS) - 1)
+
+    for line in view.lines:
+        values = (line.code, line.name, line.quantity, format_money(line.unit_price), format_money(line.total_ht),
+                  format_money(line.tax), format_money(line.total))
+        for index, ((_, width), value) in enumerate(zip(COLUMNS, values)):
+            pdf.cell(width, 10, txt=str(value), border=1, ln=index == len(COLUMNS) - 1)
+
+    # المجموع الكلي بالأرقام
+    pdf.set_font('DejaVu', '', 14)
+    pdf.ln(10)
+    pdf.cell(190, 10, txt=f"Total HT: {format_money(view.total_ht)} DZD", ln=True)
+    pdf.cell(190, 10, txt=f"TVA: {format_money(view.total_tax)} DZD", ln=True)
+    if view.stamp_tax:
+        pdf.cell(190, 10, txt=f"Droit de timbre: {format_money(view.stamp_tax)} DZD", ln=True)
+    pdf.cell(190, 10, txt=f"Montant total: {format_money(view.total_amount)} DZD", ln=True)
+
+    # المجموع الكلي بالحروف
+    pdf.ln(10)
+    pdf.cell(190, 10, txt=f"Montant total (en lettres): {amount_in_words(view.total_amount)}", ln=True)
+
+    return render(pdf)
+
+
+# مولد الفواتير مع ذاكرة مؤقتة: نسخة واحدة لكل فاتورة، مفتاحها المعرف وبصمة المحتوى
+# إعادة طباعة فاتورة لم تتغير تعيد البايتات المخزنة فورًا
+class InvoiceRenderer:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, view):
+        digest = view.digest
+        with self._lock:
+            cached = self._cache.get(view.id)
+            if cached and cached[0] == digest:
+                self._cache.move_to_end(view.id)
+                return cached[1]
+        data = draw_invoice(view)
+        with self._lock:
+            self._cache[view.id] = (digest, data)
+            self._cache.move_to_end(view.id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return data
+
+    def render_async(self, view):
+        return get_pool().submit(self.render, view)
+
+    def invalidate(self, invoice_id):
+        with self._lock:
+            self._cache.pop(invoice_id, None)
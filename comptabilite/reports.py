@@ -0,0 +1,131 @@
+import pandas as pd
+from sqlalchemy import distinct, func, select
+
+from .archive import archive_engines
+from .invoices import date_filters
+from .models import Customer, Invoice, InvoiceItem, Product
+from .money import cents, from_cents
+
+GROUPINGS = ("Jour", "Mois", "Client", "Produit", "Taux de TVA")
+
+COLUMN_LABELS = {
+    'period': 'Période',
+    'customer': 'Client',
+    'code': 'Code',
+    'product': 'Produit',
+    'tax_rate': 'Taux de TVA',
+    'payment_method': 'Méthode de paiement',
+    'invoices': 'Factures',
+    'quantity': 'Quantité',
+    'total_ht': 'Total HT',
+    'tva': 'TVA',
+    'total_ttc': 'Total TTC',
+    'cost': "Coût d'achat",
+    'margin': 'Marge',
+    'margin_rate': 'Taux de marge (%)',
+    'stamp_tax': 'Droit de timbre',
+    'total_amount': 'Montant encaissé',
+}
+
+
+# تجميع التاريخ حسب اليوم أو الشهر بحسب نوع قاعدة البيانات
+def _period(dialect_name, grouping):
+    if dialect_name == 'postgresql':
+        return func.to_char(Invoice.date, 'YYYY-MM-DD' if grouping == "Jour" else 'YYYY-MM')
+    return func.strftime('%Y-%m-%d' if grouping == "Jour" else '%Y-%m', Invoice.date)
+
+
+# التحويل من السنتيمات إلى الدينار (Decimal كباقي المبالغ) للعرض، بعد انتهاء الحسابات بالأعداد الصحيحة
+def _to_dinars(df, columns):
+    for column in columns:
+        df[column] = df[column].fillna(0).astype('int64').map(from_cents)
+    return df
+
+
+# علامة تتغير عند كتابة فاتورة جديدة، تستعمل لإبطال التقارير المخزنة
+def data_version(connectable):
+    with connectable.connect() as conn:
+        return conn.execute(select(func.max(Invoice.id))).scalar()
+
+
+def _read_sql(engine, query):
+    with engine.connect() as conn:
+        return pd.read_sql(query, conn)
+
+
+# جمع نتائج القاعدة الحية والأرشيفات المعنية بالفترة (السنوات المغلقة) في جدول واحد
+# المجاميع جمعية، وعدد الفواتير أيضًا لأن كل فاتورة في مصدر واحد فقط
+def _combine(frames, keys):
+    frames = [df for df in frames if not df.empty] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames).groupby(keys, as_index=False, dropna=False).sum().sort_values(keys, ignore_index=True)
+
+
+def _sales_query(dialect_name, grouping, date_from, date_to):
+    if grouping in ("Jour", "Mois"):
+        keys = [_period(dialect_name, grouping).label('period')]
+    elif grouping == "Client":
+        keys = [Customer.name.label('customer')]
+    elif grouping == "Produit":
+        keys = [Product.code.label('code'), Product.name.label('product')]
+    elif grouping == "Taux de TVA":
+        keys = [InvoiceItem.tax_rate.label('tax_rate')]
+    else:
+        raise ValueError(f"Regroupement inconnu: {grouping}")
+
+    # المبالغ والتكلفة المخزنة في السطور عند الإصدار، مجمعة بالسنتيمات
+    query = (
+        select(
+            *keys,
+            func.count(distinct(Invoice.id)).label('invoices'),
+            func.sum(InvoiceItem.quantity).label('quantity'),
+            func.sum(cents(InvoiceItem.total_ht)).label('total_ht'),
+            func.sum(cents(InvoiceItem.tax_amount)).label('tva'),
+            func.sum(cents(InvoiceItem.total_ttc)).label('total_ttc'),
+            func.sum(cents(InvoiceItem.cost)).label('cost'),
+        )
+        .select_from(InvoiceItem)
+        .join(Invoice, InvoiceItem.invoice_id == Invoice.id)
+        .outerjoin(Customer, Invoice.customer_id == Customer.id)
+        .where(*date_filters(date_from, date_to))
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+    # جدول السلع لا يلزم إلا لأسمائها: التكلفة لم تعد تقرأ من ثمن الشراء الحالي
+    if grouping == "Produit":
+        query = query.join(Product, InvoiceItem.product_id == Product.id)
+    return query, [key.name for key in keys]
+
+
+# المبيعات مجمعة في SQL (GROUP BY) حسب اليوم، الشهر، الزبون، المنتج أو نسبة TVA
+# ثم الحسابات المشتقة (TTC، الهامش) بشكل متجه في pandas
+def sales_report(connectable, grouping, date_from=None, date_to=None):
+    frames = []
+    engines = [connectable] + archive_engines(connectable, date_from, date_to)
+    for engine in engines:
+        query, keys = _sales_query(engine.dialect.name, grouping, date_from, date_to)
+        frames.append(_read_sql(engine, query))
+    df = _combine(frames, keys)
+
+    df['margin'] = df['total_ht'] - df['cost']
+    df['margin_rate'] = (df['margin'] / df['total_ht'].where(df['total_ht'] != 0) * 100).round(2)
+    return _to_dinars(df, ['total_ht', 'tva', 'total_ttc', 'cost', 'margin']).rename(columns=COLUMN_LABELS)
+
+
+# ضريبة الطابع والمبالغ المحصلة حسب طريقة الدفع
+def stamp_tax_report(connectable, date_from=None, date_to=None):
+    query = (
+        select(
+            Invoice.payment_method.label('payment_method'),
+            func.count(Invoice.id).label('invoices'),
+            func.coalesce(func.sum(cents(Invoice.stamp_tax)), 0).label('stamp_tax'),
+            func.coalesce(func.sum(cents(Invoice.total_amount)), 0).label('total_amount'),
+        )
+        .where(*date_filters(date_from, date_to))
+        .group_by(Invoice.payment_method)
+        .order_by(Invoice.payment_method)
+    )
+    engines = [connectable] + archive_engines(connectable, date_from, date_to)
+    df = _combine([_read_sql(engine, query) for engine in engines], ['payment_method'])
+    return _to_dinars(df, ['stamp_tax', 'total_amount']).rename(columns=COLUMN_LABELS)
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, type_coerce
+
+from .models import Product, StockMovement
+from .money import Money, cents
+
+OPENING = 'ouverture'
+PURCHASE = 'achat'
+SALE = 'vente'
+ADJUSTMENT = 'ajustement'
+
+
+# إضافة حركات المخزون دفعة واحدة (executemany)
+# movements: قواميس تحتوي product_id و quantity و kind، واختياريًا reference و invoice_id و date
+def record_movements(session, movements):
+    if not movements:
+        return
+    now = datetime.now()
+    session.execute(insert(StockMovement), [
+        {'reference': None, 'invoice_id': None, 'date': now, **movement} for movement in movements
+    ])
+
+
+# صفحة من المخزن الحالي مرتبة حسب الرمز (keyset على الفهرس الفريد)
+def list_stock(session, search=None, after=None, limit=50):
+    query = select(Product.id, Product.code, Product.name, Product.quantity, Product.purchase_price, Product.selling_price,
+                   Product.stock_value)
+    # بداية الرمز كمجال على الفهرس الفريد (كما في search_products)، دون أن تعمل % و _ كأحرف بدل
+    if search:
+        query = query.where(((Product.code >= search) & (Product.code < search + '\uffff'))
+                            | Product.name.ilike(f"%{search}%"))
+    if after is not None:
+        query = query.where(Product.code > after)
+    rows = session.execute(query.order_by(Product.code).limit(limit + 1)).all()
+    next_cursor = rows[limit - 1].code if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+# إجماليات المخزن في استعلام تجميعي واحد، والقيمة بالتكلفة المحفوظة لكل سلعة (FIFO أو CMUP)
+def stock_totals(session):
+    return session.execute(
+        select(
+            func.count(Product.id).label('products'),
+            func.coalesce(func.sum(Product.quantity), 0).label('quantity'),
+            type_coerce(func.coalesce(func.sum(cents(Product.stock_value)), 0), Money).label('purchase_value'),
+        )
+    ).one()
+
+
+# الرصيد في تاريخ معين من سجل الحركات (الفهرس على product_id, date)
+def stock_as_of(session, when, product_ids=None):
+    query = (
+        select(StockMovement.product_id, func.sum(StockMovement.quantity))
+        .where(StockMovement.date <= when)
+        .group_by(StockMovement.product_id)
+    )
+    if product_ids is not None:
+        query = query.where(StockMovement.product_id.in_(product_ids))
+    return dict(session.execute(query).all())
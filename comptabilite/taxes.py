@@ -0,0 +1,51 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .money import from_cents, to_cents
+
+CASH = "Espèces"
+STAMP_TAX_RATE = 1  # ضريبة الطابع على الدفع نقدًا (%)
+
+
+# قسمة صحيحة مع تقريب نصف السنتيم بعيدًا عن الصفر
+def _round_div(numerator, denominator):
+    return np.sign(numerator) * ((np.abs(numerator) + denominator // 2) // denominator)
+
+
+# ضريبة الطابع على مجموع TTC بالسنتيمات (تقبل عددًا أو مصفوفة مجاميع)
+def stamp_tax_on(total_ttc):
+    return _round_div(np.asarray(total_ttc, dtype=np.int64) * STAMP_TAX_RATE, 100)
+
+
+# نتيجة حساب الفاتورة بالسنتيمات: مصفوفات لكل سطر ومجاميع الفاتورة
+@dataclass(frozen=True)
+class InvoiceTotals:
+    line_ht: np.ndarray
+    line_tax: np.ndarray
+    line_ttc: np.ndarray
+    total_ht: int
+    total_tax: int
+    stamp_tax: int
+    total_amount: int
+
+    # السطور كقواميس بمبالغ Decimal، جاهزة للإدراج في invoice_items
+    def line_amounts(self):
+        return [
+            {'total_ht': from_cents(ht), 'tax_amount': from_cents(tax), 'total_ttc': from_cents(ttc)}
+            for ht, tax, ttc in zip(self.line_ht, self.line_tax, self.line_ttc)
+        ]
+
+
+# حساب HT و TVA و TTC لكل السطور دفعة واحدة بأعداد صحيحة (سنتيمات)، ثم ضريبة الطابع
+# TVA تقرب على مستوى كل سطر، وضريبة الطابع على مجموع TTC
+def compute_invoice(unit_prices, quantities, tax_rates, payment_method=None):
+    prices = np.array([to_cents(price) for price in unit_prices], dtype=np.int64)
+    quantities = np.asarray(quantities, dtype=np.int64)
+    rates = np.rint(np.asarray(tax_rates, dtype=float) * 100).astype(np.int64)  # بأجزاء من عشرة آلاف
+    line_ht = prices * quantities
+    line_tax = _round_div(line_ht * rates, 10000)
+    line_ttc = line_ht + line_tax
+    total_ht, total_tax, total_ttc = int(line_ht.sum()), int(line_tax.sum()), int(line_ttc.sum())
+    stamp_tax = int(stamp_tax_on(total_ttc)) if payment_method == CASH else 0
+    return InvoiceTotals(line_ht, line_tax, line_ttc, total_ht, total_tax, stamp_tax, total_ttc + stamp_tax)
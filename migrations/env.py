@@ -0,0 +1,40 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from comptabilite.config import DATABASE_URL
+from comptabilite.models import Base
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# العنوان: -x url=... ثم COMPTA_DATABASE_URL (أو القيمة الافتراضية)
+url = context.get_x_argument(as_dictionary=True).get('url', DATABASE_URL)
+
+
+# توليد سكربت SQL دون الاتصال بالقاعدة: alembic upgrade head --sql
+def run_migrations_offline():
+    context.configure(url=url, target_metadata=target_metadata, literal_binds=True,
+                      dialect_opts={'paramstyle': 'named'}, render_as_batch=url.startswith('sqlite'))
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+# SQLite لا يدعم أغلب أوامر ALTER TABLE، لذا تستعمل عمليات batch (نسخ الجدول)
+def run_migrations_online():
+    engine = create_engine(url, poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata,
+                          render_as_batch=connection.dialect.name == 'sqlite')
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
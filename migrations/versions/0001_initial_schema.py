@@ -0,0 +1,113 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 08:10:29
+
+المخطط الأولي كاملًا. قاعدة SQLite موجودة حدثها bootstrap إلى المخطط الحالي تعلم فقط: alembic stamp head
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _party_columns():
+    return [
+        sa.Column('commercial_register', sa.String()),
+        sa.Column('tax_number', sa.String()),
+        sa.Column('statistical_number', sa.String()),
+        sa.Column('material_number', sa.String()),
+    ]
+
+
+def upgrade():
+    op.create_table(
+        'customers',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String()),
+        sa.Column('address', sa.String()),
+        sa.Column('phone', sa.String()),
+        *_party_columns(),
+    )
+    op.create_table(
+        'suppliers',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String()),
+        sa.Column('address', sa.String()),
+        *_party_columns(),
+    )
+    op.create_table(
+        'trader_info',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String()),
+        *_party_columns(),
+    )
+    op.create_table(
+        'products',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('code', sa.String()),
+        sa.Column('name', sa.String()),
+        sa.Column('purchase_price_cents', sa.BigInteger()),
+        sa.Column('selling_price_cents', sa.BigInteger()),
+        sa.Column('tax_rate', sa.Float()),
+        sa.Column('quantity', sa.Integer()),
+        sa.Column('entry_date', sa.DateTime()),
+        sa.Column('purchase_invoice_number', sa.String()),
+        sa.Column('purchase_invoice_date', sa.DateTime()),
+    )
+    op.create_index('ix_products_code', 'products', ['code'], unique=True)
+
+    op.create_table(
+        'invoices',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('customer_id', sa.Integer(), sa.ForeignKey('customers.id')),
+        sa.Column('date', sa.DateTime()),
+        sa.Column('payment_method', sa.String()),
+        sa.Column('total_ht_cents', sa.BigInteger()),
+        sa.Column('total_tax_cents', sa.BigInteger()),
+        sa.Column('stamp_tax_cents', sa.BigInteger()),
+        sa.Column('total_amount_cents', sa.BigInteger()),
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+    )
+    op.create_index('ix_invoices_customer_id', 'invoices', ['customer_id'])
+    op.create_index('ix_invoices_date', 'invoices', ['date'])
+
+    op.create_table(
+        'invoice_items',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('invoice_id', sa.Integer(), sa.ForeignKey('invoices.id')),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id')),
+        sa.Column('quantity', sa.Integer()),
+        sa.Column('price_cents', sa.BigInteger()),
+        sa.Column('tax_rate', sa.Float()),
+        sa.Column('total_ht_cents', sa.BigInteger()),
+        sa.Column('tax_amount_cents', sa.BigInteger()),
+        sa.Column('total_ttc_cents', sa.BigInteger()),
+    )
+    op.create_index('ix_invoice_items_invoice_id', 'invoice_items', ['invoice_id'])
+
+    op.create_table(
+        'stock_movements',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id'), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('reference', sa.String()),
+        sa.Column('invoice_id', sa.Integer(), sa.ForeignKey('invoices.id')),
+        sa.Column('date', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_stock_movements_product_date', 'stock_movements', ['product_id', 'date'])
+
+
+def downgrade():
+    op.drop_table('stock_movements')
+    op.drop_table('invoice_items')
+    op.drop_table('invoices')
+    op.drop_table('products')
+    op.drop_table('trader_info')
+    op.drop_table('suppliers')
+    op.drop_table('customers')
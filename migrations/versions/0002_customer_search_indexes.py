@@ -0,0 +1,27 @@
+"""customer search indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 08:30:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_customers_phone', 'customers', ['phone'])
+    op.create_index('ix_customers_tax_number', 'customers', ['tax_number'])
+    op.create_index('ix_customers_commercial_register', 'customers', ['commercial_register'])
+    op.create_index('ix_customers_name_lower', 'customers', [sa.text('lower(name)')])
+
+
+def downgrade():
+    op.drop_index('ix_customers_name_lower', table_name='customers')
+    op.drop_index('ix_customers_commercial_register', table_name='customers')
+    op.drop_index('ix_customers_tax_number', table_name='customers')
+    op.drop_index('ix_customers_phone', table_name='customers')
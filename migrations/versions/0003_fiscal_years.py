@@ -0,0 +1,34 @@
+"""fiscal years
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 09:40:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'fiscal_years',
+        sa.Column('year', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('closed_at', sa.DateTime(), nullable=False),
+        sa.Column('archive', sa.String(), nullable=False),
+        sa.Column('invoices', sa.Integer(), nullable=False),
+        sa.Column('invoice_items', sa.Integer(), nullable=False),
+        sa.Column('first_invoice_id', sa.Integer()),
+        sa.Column('last_invoice_id', sa.Integer()),
+        sa.Column('total_ht_cents', sa.BigInteger()),
+        sa.Column('total_tax_cents', sa.BigInteger()),
+        sa.Column('stamp_tax_cents', sa.BigInteger()),
+        sa.Column('total_amount_cents', sa.BigInteger()),
+    )
+
+
+def downgrade():
+    op.drop_table('fiscal_years')
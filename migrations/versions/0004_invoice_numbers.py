@@ -0,0 +1,69 @@
+"""invoice numbers
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 10:30:00
+
+ترقيم قانوني لكل سنة: جدول العدادات وعمود number، مع ترقيم الفواتير الموجودة بترتيب التاريخ
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+# الجداول كما هي في هذه المراجعة، دون نماذج التطبيق التي تتغير في المراجعات اللاحقة
+invoices = sa.table(
+    'invoices',
+    sa.column('id', sa.Integer()),
+    sa.column('date', sa.DateTime()),
+    sa.column('number', sa.String()),
+)
+invoice_counters = sa.table(
+    'invoice_counters',
+    sa.column('year', sa.Integer()),
+    sa.column('series', sa.String()),
+    sa.column('last_number', sa.Integer()),
+)
+
+
+# ترقيم الفواتير الموجودة بترتيب التاريخ داخل كل سنة (2026/000001)، والعدادات تبدأ بعد آخر رقم
+def _number_invoices(conn):
+    counters = {}
+    numbers = []
+    for invoice_id, invoice_date in conn.execute(
+        sa.select(invoices.c.id, invoices.c.date).where(invoices.c.number.is_(None))
+        .order_by(invoices.c.date, invoices.c.id)
+    ):
+        year = invoice_date.year
+        counters[year] = counters.get(year, 0) + 1
+        numbers.append({'invoice_id': invoice_id, 'invoice_number': f"{year}/{counters[year]:06d}"})
+    if not numbers:
+        return
+    conn.execute(
+        invoices.update().where(invoices.c.id == sa.bindparam('invoice_id')).values(number=sa.bindparam('invoice_number')),
+        numbers,
+    )
+    op.bulk_insert(invoice_counters, [{'year': year, 'series': '', 'last_number': last_number}
+                                      for year, last_number in counters.items()])
+
+
+def upgrade():
+    op.create_table(
+        'invoice_counters',
+        sa.Column('year', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('series', sa.String(), primary_key=True),
+        sa.Column('last_number', sa.Integer(), nullable=False),
+    )
+    op.add_column('invoices', sa.Column('number', sa.String()))
+    op.create_index('ix_invoices_number', 'invoices', ['number'], unique=True)
+    _number_invoices(op.get_bind())
+
+
+def downgrade():
+    op.drop_index('ix_invoices_number', table_name='invoices')
+    with op.batch_alter_table('invoices') as batch:
+        batch.drop_column('number')
+    op.drop_table('invoice_counters')
@@ -0,0 +1,106 @@
+"""purchase invoices and lots
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 11:20:00
+
+فواتير الشراء ودفعاتها، قيمة المخزون لكل سلعة وتكلفة كل سطر مباع، مع دفعة افتتاحية للمخزون الموجود
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# الجداول كما هي في هذه المراجعة، دون نماذج التطبيق التي تتغير في المراجعات اللاحقة
+products = sa.table(
+    'products',
+    sa.column('id', sa.Integer()),
+    sa.column('purchase_price_cents', sa.BigInteger()),
+    sa.column('quantity', sa.Integer()),
+    sa.column('entry_date', sa.DateTime()),
+    sa.column('purchase_invoice_date', sa.DateTime()),
+    sa.column('stock_value_cents', sa.BigInteger()),
+)
+purchase_lots = sa.table(
+    'purchase_lots',
+    sa.column('product_id', sa.Integer()),
+    sa.column('quantity', sa.Integer()),
+    sa.column('remaining', sa.Integer()),
+    sa.column('unit_cost_cents', sa.BigInteger()),
+    sa.column('date', sa.DateTime()),
+)
+invoice_items = sa.table(
+    'invoice_items',
+    sa.column('product_id', sa.Integer()),
+    sa.column('quantity', sa.Integer()),
+    sa.column('cost_cents', sa.BigInteger()),
+)
+
+
+# دفعة افتتاحية لكل سلعة بكميتها وآخر ثمن شراء، وقيمة مخزونها
+def _open_lots(conn):
+    purchase_price = sa.func.coalesce(products.c.purchase_price_cents, 0)
+    conn.execute(purchase_lots.insert().from_select(
+        ['product_id', 'quantity', 'remaining', 'unit_cost_cents', 'date'],
+        sa.select(products.c.id, products.c.quantity, products.c.quantity, purchase_price,
+                  sa.func.coalesce(products.c.purchase_invoice_date, products.c.entry_date,
+                                   sa.literal(datetime.now(), sa.DateTime())))
+        .where(products.c.quantity > 0)
+    ))
+    conn.execute(products.update().values(stock_value_cents=purchase_price * products.c.quantity)
+                 .where(products.c.quantity > 0))
+    conn.execute(products.update().values(stock_value_cents=0).where(products.c.stock_value_cents.is_(None)))
+
+
+# تكلفة السطور المباعة قبل تتبع الدفعات بآخر ثمن شراء
+def _cost_sold_items(conn):
+    conn.execute(
+        invoice_items.update()
+        .values(cost_cents=invoice_items.c.quantity * sa.func.coalesce(
+            sa.select(products.c.purchase_price_cents).where(products.c.id == invoice_items.c.product_id)
+            .scalar_subquery(), 0))
+        .where(invoice_items.c.cost_cents.is_(None))
+    )
+
+
+def upgrade():
+    op.create_table(
+        'purchase_invoices',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('supplier_id', sa.Integer(), sa.ForeignKey('suppliers.id')),
+        sa.Column('number', sa.String()),
+        sa.Column('date', sa.DateTime()),
+        sa.Column('entry_date', sa.DateTime()),
+    )
+    op.create_index('ix_purchase_invoices_supplier_id', 'purchase_invoices', ['supplier_id'])
+    op.create_index('ix_purchase_invoices_date', 'purchase_invoices', ['date'])
+    op.create_table(
+        'purchase_lots',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('purchase_invoice_id', sa.Integer(), sa.ForeignKey('purchase_invoices.id')),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id'), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('remaining', sa.Integer(), nullable=False),
+        sa.Column('unit_cost_cents', sa.BigInteger()),
+        sa.Column('date', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_purchase_lots_purchase_invoice_id', 'purchase_lots', ['purchase_invoice_id'])
+    op.create_index('ix_purchase_lots_product_remaining', 'purchase_lots', ['product_id', 'remaining'])
+    op.add_column('products', sa.Column('stock_value_cents', sa.BigInteger()))
+    op.add_column('invoice_items', sa.Column('cost_cents', sa.BigInteger()))
+    _open_lots(op.get_bind())
+    _cost_sold_items(op.get_bind())
+
+
+def downgrade():
+    with op.batch_alter_table('invoice_items') as batch:
+        batch.drop_column('cost_cents')
+    with op.batch_alter_table('products') as batch:
+        batch.drop_column('stock_value_cents')
+    op.drop_table('purchase_lots')
+    op.drop_table('purchase_invoices')
@@ -1,100 +1,69 @@
+import os
+import tempfile
+
 import streamlit as st
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
-from fpdf import FPDF
 import pandas as pd
-from num2words import num2words  # لتحويل الأرقام إلى كلمات
-
-# إعداد قاعدة البيانات
-engine = create_engine('sqlite:///store.db')  # قاعدة بيانات SQLite
-Base = declarative_base()
-
-# جدول الزبائن
-class Customer(Base):
-    __tablename__ = 'customers'
-    id = Column(Integer, primary_key=True)
-    name = Column(String)
-    address = Column(String)
-    phone = Column(String)
-    commercial_register = Column(String)  # السجل التجاري
-    tax_number = Column(String)  # الرقم الجبائي
-    statistical_number = Column(String)  # الرقم الإحصائي
-    material_number = Column(String)  # رقم المادة
-
-# جدول الموردين (مع إضافة العنوان)
-class Supplier(Base):
-    __tablename__ = 'suppliers'
-    id = Column(Integer, primary_key=True)
-    name = Column(String)
-    address = Column(String)  # العنوان
-    commercial_register = Column(String)  # السجل التجاري
-    tax_number = Column(String)  # الرقم الجبائي
-    statistical_number = Column(String)  # الرقم الإحصائي
-    material_number = Column(String)  # رقم المادة
-
-# جدول معلومات التاجر (التي تظهر في الفاتورة)
-class TraderInfo(Base):
-    __tablename__ = 'trader_info'
-    id = Column(Integer, primary_key=True)
-    name = Column(String)
-    commercial_register = Column(String)  # السجل التجاري
-    tax_number = Column(String)  # الرقم الجبائي
-    statistical_number = Column(String)  # الرقم الإحصائي
-    material_number = Column(String)  # رقم المادة
-
-# جدول السلع
-class Product(Base):
-    __tablename__ = 'products'
-    id = Column(Integer, primary_key=True)
-    code = Column(String)  # رمز المنتج
-    name = Column(String)
-    purchase_price = Column(Float)  # ثمن الشراء
-    selling_price = Column(Float)  # ثمن البيع
-    tax_rate = Column(Float)  # نسبة الضريبة (0%, 9%, 19%)
-    quantity = Column(Integer)  # الكمية المتاحة
-    entry_date = Column(DateTime, default=datetime.now)  # تاريخ الإدخال
-    purchase_invoice_number = Column(String)  # رقم فاتورة الشراء
-    purchase_invoice_date = Column(DateTime)  # تاريخ فاتورة الشراء
-
-# جدول الفواتير
-class Invoice(Base):
-    __tablename__ = 'invoices'
-    id = Column(Integer, primary_key=True)
-    customer_id = Column(Integer, ForeignKey('customers.id'))
-    customer = relationship("Customer")
-    date = Column(DateTime, default=datetime.now)
-    payment_method = Column(String)
-    total_amount = Column(Float)
-    stamp_tax = Column(Float)
-
-# جدول تفاصيل الفاتورة
-class InvoiceItem(Base):
-    __tablename__ = 'invoice_items'
-    id = Column(Integer, primary_key=True)
-    invoice_id = Column(Integer, ForeignKey('invoices.id'))
-    product_id = Column(Integer, ForeignKey('products.id'))
-    quantity = Column(Integer)
-    product = relationship("Product")
-    price = Column(Float)  # السعر الذي تم فوترة السلعة به
-
-# إنشاء الجداول (بما في ذلك إضافة الأعمدة الناقصة)
-Base.metadata.create_all(engine)
-
-# إعداد الجلسة للتفاعل مع قاعدة البيانات
-Session = sessionmaker(bind=engine)
-session = Session()
+from sqlalchemy import select
+
+from comptabilite.archive import ArchiveError, browse_invoices, closable_year, close_fiscal_year, closed_years, get_invoice_view
+from comptabilite.backup import BackupScheduler, list_backups
+from comptabilite.cart import Cart, ProductSnapshot
+from comptabilite.config import BACKUP_INTERVAL, COSTING_METHOD, DIAGNOSTICS
+from comptabilite.customers import create_customer, customer_search, get_customer, update_customer
+from comptabilite.db import init_db, session_scope
+from comptabilite.export import export_invoices, pdf_filename
+from comptabilite.importer import COLUMNS as IMPORT_COLUMNS, OPTIONAL_COLUMNS as IMPORT_OPTIONAL_COLUMNS, import_products
+from comptabilite.instrumentation import recorder
+from comptabilite.invoices import PAYMENT_METHODS, InvoiceError, get_invoice, issue_invoice
+from comptabilite.models import Supplier, TraderInfo
+from comptabilite.money import format_money, from_cents
+from comptabilite.products import enter_product, search_products
+from comptabilite.purchases import get_purchase_invoice, list_purchase_invoices
+from comptabilite.renderer import InvoiceRenderer, InvoiceView
+from comptabilite.reports import GROUPINGS, data_version, sales_report, stamp_tax_report
+from comptabilite.stock import list_stock, stock_as_of, stock_totals
+
+
+CUSTOMER_PAGE_SIZE = 20
+
+
+# محرك قاعدة البيانات وتهيئة الجداول مرة واحدة لكل عملية
+@st.cache_resource
+def get_engine():
+    return init_db()
+
+
+# النسخ الاحتياطية الدورية في خيط خلفي واحد لكل عملية (COMPTA_BACKUP_INTERVAL بالدقائق)
+@st.cache_resource
+def get_backup_scheduler():
+    return BackupScheduler().start()
+
+
+def backups_enabled():
+    return BACKUP_INTERVAL > 0 and get_engine().dialect.name == 'sqlite'
+
+
+# مولد الفواتير وذاكرته المؤقتة مشتركة بين كل الجلسات
+@st.cache_resource
+def get_renderer():
+    return InvoiceRenderer()
+
+
+# زر تنزيل PDF يحضر في مجمع الخيوط: الصفحة تعرض دون انتظار، وهذا الجزء وحده (fragment)
+# يعاد كل ثانية حتى يجهز الملف في st.session_state[key]
+@st.fragment(run_every=1)
+def pdf_download(key):
+    pdf_output, file_name = st.session_state[key]
+    if not pdf_output.done():
+        st.caption("Préparation du PDF…")
+        return
+    st.download_button(label="Télécharger la facture PDF", data=pdf_output.result(), file_name=file_name,
+                       mime="application/pdf", key=f"{key}_download")
 
-# التنقل بين الأقسام
-st.sidebar.title("Navigation")
-section = st.sidebar.radio(
-    "Sélectionnez une section",
-    ["Info", "Fournisseurs", "Clients", "Entrée des produits", "Facturation", "Stock", "Afficher les factures"]
-)
 
 # إدارة معلومات التاجر
-if section == "Info":
+def show_info(session):
     st.title("Informations sur le commerçant")
     trader_info = session.query(TraderInfo).first()
 
@@ -123,8 +92,9 @@ if section == "Info":
         session.commit()
         st.success("Informations mises à jour avec succès!")
 
+
 # إدارة الموردين
-elif section == "Fournisseurs":
+def show_suppliers(session):
     st.title("Gestion des fournisseurs")
     supplier_name = st.text_input("Nom du fournisseur")
     supplier_address = st.text_input("Adresse du fournisseur")
@@ -170,8 +140,30 @@ elif section == "Fournisseurs":
                     session.commit()
                     st.success(f"Fournisseur {supplier.name} mis à jour avec succès!")
 
+
+# اختيار زبون بالبحث في قاعدة البيانات بدلاً من تحميل كل الزبائن
+# النتائج تجلب 20 بعد 20 عبر "Afficher plus"، وتعاد مع المعرف المختار
+def pick_customer(session, label, key):
+    query = st.text_input("Rechercher un client (nom, téléphone, numéro fiscal, registre de commerce)", key=f"{key}_query")
+    if st.session_state.get(f"{key}_last_query") != query:
+        st.session_state[f"{key}_last_query"] = query
+        st.session_state[f"{key}_limit"] = CUSTOMER_PAGE_SIZE
+    limit = st.session_state.setdefault(f"{key}_limit", CUSTOMER_PAGE_SIZE)
+
+    customers = customer_search.search(session, query, limit)
+    if not customers:
+        st.info("Aucun client trouvé.")
+        return None, customers
+    options = {c.id: f"{c.id}: {c.name}" + (f" ({c.phone})" if c.phone else "") for c in customers}
+    selected = st.selectbox(label, list(options), format_func=options.get, key=f"{key}_selected")
+    if len(customers) == limit and st.button("Afficher plus", key=f"{key}_more"):
+        st.session_state[f"{key}_limit"] += CUSTOMER_PAGE_SIZE
+        st.rerun()
+    return selected, customers
+
+
 # إدارة الزبائن
-elif section == "Clients":
+def show_customers(session):
     st.title("Gestion des clients")
     customer_name = st.text_input("Nom du client")
     customer_address = st.text_input("Adresse du client")
@@ -182,7 +174,8 @@ elif section == "Clients":
     material_number = st.text_input("Numéro de matériel")
 
     if st.button("Ajouter un client"):
-        new_customer = Customer(
+        create_customer(
+            session,
             name=customer_name, 
             address=customer_address, 
             phone=customer_phone,
@@ -191,19 +184,17 @@ elif section == "Clients":
             statistical_number=statistical_number, 
             material_number=material_number
         )
-        session.add(new_customer)
-        session.commit()
         st.success("Client ajouté avec succès!")
     
-    # عرض الزبائن المدخلين في جدول مع إمكانية التعديل
-    customers = session.query(Customer).all()
+    # البحث عن الزبائن المدخلين مع إمكانية التعديل
+    st.subheader("Liste des clients")
+    selected_customer_id, customers = pick_customer(session, "Sélectionner un client à modifier", key="customers")
     if customers:
-        df_customers = pd.DataFrame([(cust.id, cust.name, cust.address, cust.phone) for cust in customers], 
-                                    columns=['ID', 'Nom', 'Adresse', 'Téléphone'])
-        st.dataframe(df_customers)
+        df_customers = pd.DataFrame([(c.id, c.name, c.phone, c.tax_number, c.commercial_register) for c in customers],
+                                    columns=['ID', 'Nom', 'Téléphone', 'Numéro fiscal', 'Registre de commerce'])
+        st.dataframe(df_customers, hide_index=True)
 
-        selected_customer_id = st.selectbox("Sélectionner un client à modifier", df_customers['ID'])
-        selected_customer = session.query(Customer).get(selected_customer_id)
+        selected_customer = get_customer(session, selected_customer_id)
 
         if selected_customer:
             customer_name = st.text_input("Nom du client", selected_customer.name)
@@ -215,18 +206,22 @@ elif section == "Clients":
             material_number = st.text_input("Numéro de matériel", selected_customer.material_number)
 
             if st.button(f"Enregistrer les modifications pour {selected_customer.name}"):
-                selected_customer.name = customer_name
-                selected_customer.address = customer_address
-                selected_customer.phone = customer_phone
-                selected_customer.commercial_register = commercial_register
-                selected_customer.tax_number = tax_number
-                selected_customer.statistical_number = statistical_number
-                selected_customer.material_number = material_number
-                session.commit()
+                update_customer(
+                    session,
+                    selected_customer,
+                    name=customer_name,
+                    address=customer_address,
+                    phone=customer_phone,
+                    commercial_register=commercial_register,
+                    tax_number=tax_number,
+                    statistical_number=statistical_number,
+                    material_number=material_number,
+                )
                 st.success(f"Client {selected_customer.name} mis à jour avec succès!")
 
+
 # قسم خاص بإدخال السلع
-elif section == "Entrée des produits":
+def show_product_entry(session):
     st.title("Entrée des produits")
 
     product_code = st.text_input("Code du produit")
@@ -235,329 +230,436 @@ elif section == "Entrée des produits":
     selling_price = st.number_input("Prix de vente", min_value=0.0, step=0.01)
     tax_rate = st.selectbox("Taux de TVA", [0, 9, 19])
     product_quantity = st.number_input("Quantité achetée", min_value=0, step=1)
+    suppliers = dict(session.execute(select(Supplier.id, Supplier.name).order_by(Supplier.name)).all())
+    supplier_id = st.selectbox("Fournisseur", [None] + list(suppliers),
+                               format_func=lambda supplier_id: suppliers.get(supplier_id, "—"))
     purchase_invoice_number = st.text_input("Numéro de la facture d'achat")
     purchase_invoice_date = st.date_input("Date de la facture d'achat", value=datetime.now())
 
     if st.button("Ajouter un produit"):
-        # تحقق إذا كان المنتج موجود بالفعل
-        existing_product = session.query(Product).filter_by(code=product_code).first()
-        
-        if existing_product:
-            # إذا كان المنتج موجودًا، دمج الكمية الجديدة مع الكمية القديمة
-            existing_product.quantity += product_quantity
-        else:
-            # إذا كان المنتج غير موجود، أضف منتجًا جديدًا
-            new_product = Product(
-                code=product_code, 
-                name=product_name,
-                purchase_price=purchase_price, 
-                selling_price=selling_price,
-                tax_rate=tax_rate, 
-                quantity=product_quantity,
-                purchase_invoice_number=purchase_invoice_number, 
-                purchase_invoice_date=purchase_invoice_date
-            )
-            session.add(new_product)
-
-        session.commit()
+        # إنشاء السلعة إذا كانت جديدة، ثم إضافة الكمية كدفعة بتكلفتها في فاتورة الشراء (نفس الرقم يجمع السطور)
+        enter_product(session, product_code, product_name, purchase_price, selling_price, tax_rate, product_quantity,
+                      purchase_invoice_number, purchase_invoice_date, supplier_id)
         st.success("Produit ajouté ou mis à jour avec succès!")
 
+    # استيراد قائمة سلع من ملف CSV أو Excel (فاتورة مورد كاملة)
+    with st.expander("Import en masse (CSV / Excel)"):
+        st.caption("Colonnes attendues: " + ", ".join(IMPORT_COLUMNS + IMPORT_OPTIONAL_COLUMNS))
+        uploaded = st.file_uploader("Fichier des produits", type=["csv", "xlsx"])
+        if uploaded is not None and st.button("Importer"):
+            status = st.empty()
+            try:
+                result = import_products(session, uploaded, uploaded.name,
+                                         progress=lambda rows: status.info(f"{rows} lignes traitées…"))
+            except (ValueError, ImportError) as error:
+                st.error(str(error))
+            else:
+                status.empty()
+                st.success(f"{result.imported} produits importés ou mis à jour sur {result.rows} lignes.")
+                if not result.errors.empty:
+                    st.warning(f"{len(result.errors)} lignes rejetées.")
+                    st.dataframe(result.errors, hide_index=True)
+                    st.download_button("Télécharger le rapport d'erreurs", result.errors.to_csv(index=False).encode('utf-8'),
+                                       file_name="erreurs_import.csv", mime="text/csv")
+
+
+# فواتير الشراء من الموردين ودفعاتها (الكمية المتبقية من كل دفعة وتكلفتها)
+def show_purchases(session):
+    st.title("Factures d'achat")
+
+    suppliers = dict(session.execute(select(Supplier.id, Supplier.name).order_by(Supplier.name)).all())
+    supplier_id = st.selectbox("Fournisseur", [None] + list(suppliers),
+                               format_func=lambda supplier_id: suppliers.get(supplier_id, "Tous"))
+    purchases = list_purchase_invoices(session, supplier_id)
+    if not purchases:
+        st.write("Aucune facture d'achat.")
+        return
+    st.dataframe(pd.DataFrame(
+        [(p.number, p.date.strftime('%Y-%m-%d'), p.supplier_name, p.lines, p.total) for p in purchases],
+        columns=['N°', 'Date', 'Fournisseur', 'Lignes', 'Total HT']
+    ), hide_index=True)
+
+    options = {f"{p.number or 'Sans numéro'} - {p.supplier_name or 'Sans fournisseur'} ({p.date.strftime('%Y-%m-%d')})": p.id
+               for p in purchases}
+    purchase = get_purchase_invoice(session, options[st.selectbox("Choisissez une facture d'achat", options)])
+    st.dataframe(pd.DataFrame(
+        [(lot.product.code, lot.product.name, lot.quantity, lot.remaining, lot.unit_cost, lot.quantity * lot.unit_cost)
+         for lot in purchase.lots],
+        columns=['Code', 'Produit', 'Quantité', 'Restant en stock', "Coût unitaire", 'Total HT']
+    ), hide_index=True)
+
 # قسم الفوترة
-elif section == "Facturation":
+def show_invoicing(session):
     st.title("Émission de la facture")
 
-    # اختيار الزبون
-    customers = session.query(Customer).all()
-    customer_options = [f"{c.id}: {c.name}" for c in customers]
-    selected_customer = st.selectbox("Choisir un client", customer_options)
-
-    # اختيار السلع
-    products = session.query(Product).all()
-    product_options = [f"{p.code}: {p.name}" for p in products]  # عرض كود المنتج و اسمه
-    selected_products = st.multiselect("Choisir des produits", product_options)
-
-    # استرجاع كائنات المنتجات بناءً على الكود المختار
-    selected_product_objects = [
-        session.query(Product).filter_by(code=product_option.split(":")[0].strip()).first() 
-        for product_option in selected_products
-    ]
-
-    # إدخال الكميات لكل سلعة
-    product_quantities = {
-        product.code: st.number_input(f"Quantité de {product.name} (Code: {product.code})", min_value=1, max_value=product.quantity)
-        for product in selected_product_objects
-    }
+    # اختيار الزبون بالبحث
+    customer_id, _ = pick_customer(session, "Choisir un client", key="invoice_customer")
+
+    # مسودة الفاتورة محفوظة في الجلسة: لا تعاد قراءة السلع عند تعديل الكميات
+    cart = st.session_state.setdefault("invoice_cart", Cart())
+
+    # اختيار السلع بالبحث (رمز، اسم أو باركود) بدلاً من تحميل كل الكتالوج
+    # نتائج آخر بحث محفوظة أيضًا حتى لا يعاد الاستعلام عند كل تفاعل
+    search = st.text_input("Rechercher un produit (code, nom ou code-barres)")
+    if search:
+        cached = st.session_state.get("invoice_search")
+        if not cached or cached[0] != search:
+            cached = (search, [ProductSnapshot.from_product(p) for p in search_products(session, search)])
+            st.session_state["invoice_search"] = cached
+        matches = cached[1]
+        if matches:
+            product_options = {f"{p.code}: {p.name} (stock: {p.stock})": p for p in matches}  # عرض كود المنتج و اسمه
+            col1, col2 = st.columns([4, 1])
+            chosen = product_options[col1.selectbox("Résultats", product_options)]
+            if col2.button("Ajouter", disabled=not chosen.stock or chosen.id in cart):
+                cart.add(chosen)
+        else:
+            st.info("Aucun produit trouvé.")
+
+    # إدخال الكميات لكل سلعة، والمجاميع تحدث مباشرة دون الرجوع إلى قاعدة البيانات
+    for product_id, line in list(cart.lines.items()):
+        product = line.product
+        col1, col2 = st.columns([4, 1])
+        quantity = col1.number_input(f"Quantité de {product.name} (Code: {product.code})", min_value=1,
+                                     value=line.quantity, key=f"quantity_{product_id}",
+                                     help=f"Stock lors de l'ajout: {product.stock}")
+        cart.set_quantity(product_id, quantity)
+        if col2.button("Retirer", key=f"remove_{product_id}"):
+            cart.remove(product_id)
+            st.rerun()
 
     # اختيار طريقة الدفع
-    payment_method = st.selectbox("Méthode de paiement", ["Espèces", "Chèque", "Virement bancaire"])
+    payment_method = st.selectbox("Méthode de paiement", PAYMENT_METHODS)
 
-    if st.button("Émettre la facture"):
-        # البحث عن الزبون المختار
-        customer_id = int(selected_customer.split(":")[0])
-        customer = session.query(Customer).get(customer_id)
+    if cart:
+        totals = cart.totals(payment_method)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Total HT", format_money(from_cents(cart.total_ht)))
+        col2.metric("TVA", format_money(from_cents(cart.total_tax)))
+        col3.metric("Droit de timbre", format_money(from_cents(totals.stamp_tax)))
+        col4.metric("Total TTC", format_money(from_cents(totals.total_amount)))
 
+    if st.button("Émettre la facture", disabled=customer_id is None or not cart):
         # البحث عن معلومات التاجر لإضافتها إلى الفاتورة
         trader_info = session.query(TraderInfo).first()
 
-        # حساب المجموع الإجمالي وضريبة القيمة المضافة
-        total_amount = 0
-        total_tax = 0
-        invoice = Invoice(customer=customer, payment_method=payment_method)
-        session.add(invoice)
-        session.commit()
-
-        invoice_data = []
-        is_quantity_available = True
-
-        for product in selected_product_objects:
-            quantity = product_quantities[product.code]
-            if quantity > product.quantity:
-                st.warning(f"La quantité demandée de {product.name} (Code: {product.code}) n'est pas disponible.")
+        # تحقق واحد من المخزون والأسعار لكل السطور، ثم إصدار الفاتورة وخصم المخزون في معاملة واحدة
+        problems = cart.refresh(session)
+        is_quantity_available = not problems
+        for problem in problems:
+            st.warning(problem)
+        if is_quantity_available:
+            try:
+                invoice = issue_invoice(session, customer_id, cart.items(), payment_method)
+            except InvoiceError as error:
+                st.warning(str(error))
                 is_quantity_available = False
-                break
-            else:
-                # خصم الكمية من المخزن
-                product.quantity -= quantity
-
-                # المجموع الأولي (prix_total_produit)
-                prix_total_produit = product.selling_price * quantity
-
-                # حساب الضريبة (TVA)
-                tax_amount = prix_total_produit * (product.tax_rate / 100)
-
-                # المجموع النهائي بعد الضريبة
-                total_product = prix_total_produit + tax_amount
-
-                total_tax += tax_amount
-                total_amount += total_product
-
-                # إضافة السلعة إلى الفاتورة
-                invoice_item = InvoiceItem(invoice_id=invoice.id, product_id=product.id, quantity=quantity, price=product.selling_price)
-                session.add(invoice_item)
-
-                # تخزين البيانات في قائمة لعرضها في الجدول
-                invoice_data.append({
-                    'Code du produit': product.code,
-                    'Nom du produit': product.name,
-                    'Quantité': quantity,
-                    'Prix unitaire': product.selling_price,
-                    'Prix total': prix_total_produit,
-                    'TVA': tax_amount,
-                    'Total': total_product
-                })
 
         # إذا كانت الكميات متوفرة
         if is_quantity_available:
-            # حساب ضريبة الطابع الجبائي إذا كانت طريقة الدفع نقدًا
-            stamp_tax = 0
-            if payment_method == "Espèces":
-                stamp_tax = total_amount * 0.01
+            cart.clear()
+            st.session_state.pop("invoice_search", None)
+            invoice = get_invoice(session, invoice.id)
+            customer = invoice.customer
 
-            # تحديث المجموع الإجمالي
-            invoice.total_amount = total_amount + stamp_tax
-            invoice.stamp_tax = stamp_tax
-            session.commit()
+            view = InvoiceView.from_invoice(invoice, trader_info)
 
             # عرض الفاتورة كجدول
             st.subheader(f"Facture pour le client: {customer.name}")
-            df_invoice = pd.DataFrame(invoice_data)
+            df_invoice = pd.DataFrame(view.rows())
             st.dataframe(df_invoice)
+            st.write(f"Montant total: {format_money(view.total_amount)} DZD")
+
+            # إنشاء ملف PDF للفاتورة في الذاكرة عبر مجمع الخيوط، ثم عرض زر التنزيل عندما يجهز
+            st.session_state["invoice_pdf"] = (get_renderer().render_async(view), pdf_filename(invoice.number))
+            pdf_download("invoice_pdf")
 
-            # إنشاء ملف PDF للفاتورة باستخدام FPDF
-            pdf = FPDF()
-            pdf.add_page()
-
-            # تحميل الخط DejaVuSansCondensed
-            pdf.add_font('DejaVu', '', 'fonts/DejaVuSansCondensed.ttf', uni=True)  # تأكد من أن الخط موجود في المجلد الصحيح
-
-            # تكبير كلمة FACTURE
-            pdf.set_font('DejaVu', '', 24)
-            pdf.cell(200, 10, txt="FACTURE", ln=True, align='C')
-
-            # تصغير معلومات الزبون
-            pdf.set_font('DejaVu', '', 10)
-            pdf.cell(100, 10, txt=f"Numéro de facture: {invoice.id}")
-            pdf.cell(100, 10, txt=f"Date: {invoice.date.strftime('%Y-%m-%d')}", ln=True)
-            pdf.cell(100, 10, txt=f"Nom du client: {customer.name}")
-            pdf.cell(100, 10, txt=f"Adresse: {customer.address}", ln=True)
-            pdf.cell(100, 10, txt=f"Registre de commerce: {customer.commercial_register}")
-            pdf.cell(100, 10, txt=f"Numéro fiscal: {customer.tax_number}", ln=True)
-            pdf.cell(100, 10, txt=f"Numéro statistique: {customer.statistical_number}")
-            pdf.cell(100, 10, txt=f"Numéro de matériel: {customer.material_number}", ln=True)
-
-            # إضافة معلومات التاجر إلى الفاتورة
-            if trader_info:
-                pdf.cell(100, 10, txt=f"Nom du commerçant: {trader_info.name}")
-                pdf.cell(100, 10, txt=f"Registre de commerce: {trader_info.commercial_register}", ln=True)
-                pdf.cell(100, 10, txt=f"Numéro fiscal: {trader_info.tax_number}")
-                pdf.cell(100, 10, txt=f"Numéro statistique: {trader_info.statistical_number}")
-                pdf.cell(100, 10, txt=f"Numéro de matériel: {trader_info.material_number}", ln=True)
-
-            # تفاصيل السلع في الفاتورة - باستخدام جدول
-            pdf.ln(10)
-            pdf.set_font('DejaVu', '', 12)
-            pdf.cell(40, 10, txt="Code", border=1)
-            pdf.cell(40, 10, txt="Produit", border=1)
-            pdf.cell(40, 10, txt="Quantité", border=1)
-            pdf.cell(40, 10, txt="Prix unitaire", border=1)
-            pdf.cell(40, 10, txt="Prix total", border=1)
-            pdf.cell(40, 10, txt="TVA", border=1)
-            pdf.cell(40, 10, txt="Total", border=1, ln=True)
-
-            for item in invoice_data:
-                pdf.cell(40, 10, txt=item['Code du produit'], border=1)
-                pdf.cell(40, 10, txt=item['Nom du produit'], border=1)
-                pdf.cell(40, 10, txt=str(item['Quantité']), border=1)
-                pdf.cell(40, 10, txt=str(item['Prix unitaire']), border=1)
-                pdf.cell(40, 10, txt=str(item['Prix total']), border=1)
-                pdf.cell(40, 10, txt=str(item['TVA']), border=1)
-                pdf.cell(40, 10, txt=str(item['Total']), border=1, ln=True)
-
-            # المجموع الكلي بالأرقام
-            pdf.set_font('DejaVu', '', 14)
-            pdf.ln(10)
-            pdf.cell(200, 10, txt=f"Montant total: {invoice.total_amount} DZD", ln=True)
-
-            # المجموع الكلي بالحروف
-            total_in_words = num2words(invoice.total_amount, lang='fr')
-            pdf.ln(10)
-            pdf.cell(200, 10, txt=f"Montant total (en lettres): {total_in_words.capitalize()} dinars", ln=True)
-
-            # حفظ ملف PDF
-            pdf_output = f"Facture_{invoice.id}.pdf"
-            pdf.output(pdf_output)
-
-            # عرض زر تنزيل الفاتورة
-            with open(pdf_output, "rb") as pdf_file:
-                st.download_button(label="Télécharger la facture PDF", data=pdf_file, file_name=pdf_output, mime="application/octet-stream")
 
 # إدارة المخزن
-elif section == "Stock":
+def show_stock(session):
     st.title("Gestion du stock")
-    
-    # عرض السلع المتاحة فقط
-    products = session.query(Product).all()
+
+    # إجماليات المخزن في استعلام واحد
+    totals = stock_totals(session)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Produits", totals.products)
+    col2.metric("Quantité totale", totals.quantity)
+    col3.metric(f"Valeur au coût {COSTING_METHOD.upper()} (DZD)", format_money(totals.purchase_value))
+
+    col1, col2 = st.columns(2)
+    search = col1.text_input("Rechercher (code ou nom)").strip()
+    as_of = col2.date_input("Stock à la date", value=None)
+
+    # صفحات المخزن حسب الرمز، تعاد من البداية عند تغيير البحث
+    if st.session_state.get("stock_search") != search:
+        st.session_state["stock_search"] = search
+        st.session_state["stock_pages"] = [None]
+    pages = st.session_state["stock_pages"]
+    products, next_cursor = list_stock(session, search=search or None, after=pages[-1])
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("◀ Précédent", disabled=len(pages) == 1):
+        pages.pop()
+        st.rerun()
+    col2.write(f"Page {len(pages)}")
+    if col3.button("Suivant ▶", disabled=next_cursor is None):
+        pages.append(next_cursor)
+        st.rerun()
 
     if products:
-        # دمج الكميات المتكررة بناءً على الكود والاسم
-        product_stock = {}
-        for prod in products:
-            if prod.code in product_stock:
-                product_stock[prod.code]['Quantité disponible'] += prod.quantity
-            else:
-                product_stock[prod.code] = {
-                    'Code': prod.code,
-                    'Nom': prod.name,
-                    'Quantité disponible': prod.quantity
-                }
+        df_stock = pd.DataFrame(
+            [(p.code, p.name, p.quantity, p.purchase_price, p.stock_value) for p in products],
+            columns=['Code', 'Nom', 'Quantité disponible', "Dernier prix d'achat", 'Valeur au coût']
+        )
+        if as_of:
+            # الرصيد التاريخي للصفحة المعروضة فقط من سجل الحركات
+            levels = stock_as_of(session, datetime.combine(as_of, datetime.max.time()), [p.id for p in products])
+            df_stock[f"Quantité au {as_of}"] = [levels.get(p.id, 0) for p in products]
+        st.dataframe(df_stock, hide_index=True)
 
-        df_stock = pd.DataFrame(product_stock.values(), columns=['Code', 'Nom', 'Quantité disponible'])
-        st.dataframe(df_stock)
 
 # عرض الفواتير السابقة مع إمكانية إعادة الطباعة
-elif section == "Afficher les factures":
+def show_invoices(session):
     st.title("Afficher les factures précédentes")
 
-    # استرجاع جميع الفواتير من قاعدة البيانات
-    invoices = session.query(Invoice).all()
+    # تصفية الفواتير
+    col1, col2, col3, col4 = st.columns(4)
+    date_range = col1.date_input("Période", value=())
+    number_filter = col2.text_input("N° de facture", placeholder="2026/000123")
+    customer_filter = col3.text_input("Client")
+    payment_filter = col4.selectbox("Méthode de paiement", ["Toutes"] + PAYMENT_METHODS)
+    col1, col2, col3 = st.columns(3)
+    min_amount = col1.number_input("Montant minimum", min_value=0.0, value=None, step=100.0)
+    max_amount = col2.number_input("Montant maximum", min_value=0.0, value=None, step=100.0)
+    page_size = col3.selectbox("Factures par page", [20, 50, 100])
+
+    filters = dict(
+        date_from=date_range[0] if len(date_range) > 0 else None,
+        date_to=date_range[1] if len(date_range) > 1 else None,
+        customer=customer_filter.strip() or None,
+        payment_method=None if payment_filter == "Toutes" else payment_filter,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        number=number_filter.strip() or None,
+    )
+
+    # بداية كل صفحة محفوظة في الجلسة، وتعاد من الصفحة الأولى عند تغيير التصفية
+    filters_key = (tuple(filters.items()), page_size)
+    if st.session_state.get("invoice_filters") != filters_key:
+        st.session_state["invoice_filters"] = filters_key
+        st.session_state["invoice_pages"] = [None]
+    pages = st.session_state["invoice_pages"]
+
+    # استرجاع الصفحة المعروضة فقط من قاعدة البيانات
+    # الأرشيفات (السنوات المغلقة) لا تفتح إلا إذا وصلت الصفحة إلى فترتها
+    invoices, next_cursor = browse_invoices(session, after=pages[-1], limit=page_size, **filters)
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("◀ Précédent", disabled=len(pages) == 1):
+        pages.pop()
+        st.rerun()
+    col2.write(f"Page {len(pages)}")
+    if col3.button("Suivant ▶", disabled=next_cursor is None):
+        pages.append(next_cursor)
+        st.rerun()
 
     # التحقق إذا كانت هناك فواتير في قاعدة البيانات
     if len(invoices) > 0:
+        st.dataframe(pd.DataFrame(
+            [(inv.number, inv.date.strftime('%Y-%m-%d'), inv.customer_name, inv.payment_method, inv.total_amount) for inv in invoices],
+            columns=['N°', 'Date', 'Client', 'Paiement', 'Montant total']
+        ), hide_index=True)
+
         # إنشاء قائمة بالفواتير المتاحة لعرضها
-        invoice_options = [f"Facture N° {inv.id} - {inv.date.strftime('%Y-%m-%d')}" for inv in invoices]
-        
+        invoice_options = {f"Facture N° {inv.number} - {inv.date.strftime('%Y-%m-%d')}": inv.id for inv in invoices}
+
         # اختيار فاتورة لعرضها
         selected_invoice = st.selectbox("Choisissez une facture", invoice_options)
 
-        # الحصول على الفاتورة المختارة
-        invoice_id = int(selected_invoice.split()[2])
-        invoice = session.query(Invoice).get(invoice_id)
+        # الحصول على الفاتورة المختارة (من القاعدة الحية أو من أرشيف سنتها)
+        view = get_invoice_view(session, invoice_options[selected_invoice])
 
         # عرض تفاصيل الفاتورة
-        st.subheader(f"Facture N° {invoice.id}")
-        st.write(f"Date d'émission: {invoice.date.strftime('%Y-%m-%d')}")
-        st.write(f"Nom du client: {invoice.customer.name}")
-        st.write(f"Montant total: {invoice.total_amount} DZD")
-        st.write(f"Méthode de paiement: {invoice.payment_method}")
+        st.subheader(f"Facture N° {view.number}")
+        st.write(f"Date d'émission: {view.date}")
+        st.write(f"Nom du client: {view.customer.name}")
+        st.write(f"Montant total: {format_money(view.total_amount)} DZD")
+        st.write(f"Méthode de paiement: {view.payment_method}")
 
         # استرجاع تفاصيل المنتجات المشتراة في الفاتورة
-        invoice_items = session.query(InvoiceItem).filter_by(invoice_id=invoice.id).all()
-        if invoice_items:
-            invoice_data = []
-            for item in invoice_items:
-                product = session.query(Product).get(item.product_id)
-                invoice_data.append({
-                    'Code du produit': product.code,
-                    'Nom du produit': product.name,
-                    'Quantité': item.quantity,
-                    'Prix unitaire': item.price,  # استخدام السعر من الفاتورة وليس المنتج
-                    'TVA': item.price * (product.tax_rate / 100),
-                    'Total': (item.price + item.price * (product.tax_rate / 100)) * item.quantity
-                })
-
-            df_invoice = pd.DataFrame(invoice_data)
+        if view.lines:
+            df_invoice = pd.DataFrame(view.rows())
             st.dataframe(df_invoice)
 
             # زر لإعادة طباعة الفاتورة كملف PDF
             if st.button("Réimprimer la facture"):
-                # إنشاء ملف PDF للفاتورة باستخدام FPDF
-                pdf = FPDF()
-                pdf.add_page()
-
-                # تحميل الخط DejaVuSansCondensed
-                pdf.add_font('DejaVu', '', 'fonts/DejaVuSansCondensed.ttf', uni=True)  # تأكد من أن الخط موجود في المجلد الصحيح
-
-                # تكبير كلمة FACTURE
-                pdf.set_font('DejaVu', '', 24)
-                pdf.cell(200, 10, txt="FACTURE", ln=True, align='C')
-
-                # تصغير معلومات الزبون
-                pdf.set_font('DejaVu', '', 10)
-                pdf.cell(100, 10, txt=f"Numéro de facture: {invoice.id}")
-                pdf.cell(100, 10, txt=f"Date: {invoice.date.strftime('%Y-%m-%d')}", ln=True)
-                pdf.cell(100, 10, txt=f"Nom du client: {invoice.customer.name}")
-                pdf.cell(100, 10, txt=f"Adresse: {invoice.customer.address}", ln=True)
-                pdf.cell(100, 10, txt=f"Registre de commerce: {invoice.customer.commercial_register}")
-                pdf.cell(100, 10, txt=f"Numéro fiscal: {invoice.customer.tax_number}", ln=True)
-                pdf.cell(100, 10, txt=f"Numéro statistique: {invoice.customer.statistical_number}")
-                pdf.cell(100, 10, txt=f"Numéro de matériel: {invoice.customer.material_number}", ln=True)
-
-                # تفاصيل السلع في الفاتورة - باستخدام جدول
-                pdf.ln(10)
-                pdf.set_font('DejaVu', '', 12)
-                pdf.cell(40, 10, txt="Code", border=1)
-                pdf.cell(40, 10, txt="Produit", border=1)
-                pdf.cell(40, 10, txt="Quantité", border=1)
-                pdf.cell(40, 10, txt="Prix unitaire", border=1)
-                pdf.cell(40, 10, txt="TVA", border=1)
-                pdf.cell(40, 10, txt="Total", border=1, ln=True)
-
-                for item in invoice_data:
-                    pdf.cell(40, 10, txt=item['Code du produit'], border=1)
-                    pdf.cell(40, 10, txt=item['Nom du produit'], border=1)
-                    pdf.cell(40, 10, txt=str(item['Quantité']), border=1)
-                    pdf.cell(40, 10, txt=str(item['Prix unitaire']), border=1)
-                    pdf.cell(40, 10, txt=str(item['TVA']), border=1)
-                    pdf.cell(40, 10, txt=str(item['Total']), border=1, ln=True)
-
-                # المجموع الكلي بالأرقام
-                pdf.set_font('DejaVu', '', 14)
-                pdf.ln(10)
-                pdf.cell(200, 10, txt=f"Montant total: {invoice.total_amount} DZD", ln=True)
-
-                # المجموع الكلي بالحروف
-                total_in_words = num2words(invoice.total_amount, lang='fr')
-                pdf.ln(10)
-                pdf.cell(200, 10, txt=f"Montant total (en lettres): {total_in_words.capitalize()} dinars", ln=True)
-
-                # حفظ ملف PDF
-                pdf_output = f"Facture_{invoice.id}.pdf"
-                pdf.output(pdf_output)
-
-                # عرض زر تنزيل الفاتورة
-                with open(pdf_output, "rb") as pdf_file:
-                    st.download_button(label="Télécharger la facture PDF", data=pdf_file, file_name=pdf_output, mime="application/octet-stream")
+                # إنشاء ملف PDF للفاتورة في الذاكرة عبر مجمع الخيوط، ثم عرض زر التنزيل عندما يجهز
+                st.session_state["reprint_pdf"] = (get_renderer().render_async(view), pdf_filename(view.number))
+                pdf_download("reprint_pdf")
         else:
             st.write("Aucun article trouvé pour cette facture.")
     else:
         st.write("Aucune facture disponible.")
+
+    # تصدير كل فواتير الفترة المختارة في أرشيف ZIP
+    with st.expander("Export groupé (ZIP)"):
+        date_from, date_to = filters['date_from'], filters['date_to']
+        st.write(f"Période: {date_from or 'début'} → {date_to or 'aujourd’hui'}")
+        if st.button("Exporter les factures en PDF"):
+            # نفس المسار لنفس الفترة حتى يستأنف التصدير إذا انقطع
+            zip_path = os.path.join(tempfile.gettempdir(), f"factures_{date_from or 'debut'}_{date_to or 'fin'}.zip")
+            progress_bar = st.progress(0.0)
+            # الرسم في خيط الصفحة: لا مجمع عمليات (fork) داخل خادم Streamlit متعدد الخيوط
+            total = export_invoices(zip_path, date_from, date_to, workers=1, engine=session.get_bind(),
+                                    progress=lambda done, total: progress_bar.progress(done / total, f"{done}/{total} factures"))
+            with open(zip_path, "rb") as zip_file:
+                st.download_button(label=f"Télécharger {total} factures (ZIP)", data=zip_file, file_name=os.path.basename(zip_path), mime="application/zip")
+
+
+# التقارير مخزنة مؤقتًا، وتبطل تلقائيًا عند كتابة فاتورة جديدة (version) أو بعد انتهاء المدة
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_sales_report(grouping, date_from, date_to, version):
+    return sales_report(get_engine(), grouping, date_from, date_to)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_stamp_tax_report(date_from, date_to, version):
+    return stamp_tax_report(get_engine(), date_from, date_to)
+
+
+# تقارير المبيعات، TVA وضريبة الطابع
+def show_reports(session):
+    st.title("Rapports")
+
+    col1, col2 = st.columns(2)
+    date_range = col1.date_input("Période", value=())
+    grouping = col2.selectbox("Regrouper par", GROUPINGS)
+    date_from = date_range[0] if len(date_range) > 0 else None
+    date_to = date_range[1] if len(date_range) > 1 else None
+    version = data_version(get_engine())
+
+    df_sales = cached_sales_report(grouping, date_from, date_to, version)
+    if df_sales.empty:
+        st.write("Aucune vente sur cette période.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total HT", format_money(df_sales['Total HT'].sum()))
+    col2.metric("TVA", format_money(df_sales['TVA'].sum()))
+    col3.metric("Total TTC", format_money(df_sales['Total TTC'].sum()))
+    col4.metric("Marge", format_money(df_sales['Marge'].sum()))
+
+    st.subheader(f"Ventes par {grouping.lower()}")
+    st.dataframe(df_sales, hide_index=True)
+    if grouping in ("Jour", "Mois"):
+        # الرسم يحتاج أعمدة رقمية
+        st.bar_chart(df_sales.astype({'Total HT': float, 'TVA': float}), x='Période', y=['Total HT', 'TVA'])
+    st.download_button("Télécharger (CSV)", df_sales.to_csv(index=False).encode('utf-8'),
+                       file_name=f"ventes_par_{grouping.lower().replace(' ', '_')}.csv", mime="text/csv")
+
+    st.subheader("Droit de timbre par méthode de paiement")
+    st.dataframe(cached_stamp_tax_report(date_from, date_to, version), hide_index=True)
+
+
+# إغلاق السنوات المالية: نقل فواتيرها إلى أرشيف للقراءة فقط وإبقاء ملخصها
+def show_fiscal_years(session):
+    st.title("Clôture des exercices")
+
+    closed = closed_years(session)
+    if closed:
+        st.dataframe(pd.DataFrame(
+            [(y.year, y.closed_at.strftime('%Y-%m-%d'), y.invoices, format_money(y.total_ht), format_money(y.total_tax),
+              format_money(y.stamp_tax), format_money(y.total_amount), y.archive) for y in closed],
+            columns=['Exercice', 'Clôturé le', 'Factures', 'Total HT', 'TVA', 'Droit de timbre', 'Montant total', 'Archive']
+        ), hide_index=True)
+
+    year = closable_year(session)
+    if year is None:
+        st.write("Aucun exercice terminé à clôturer.")
+        return
+    st.caption("Les factures de l'exercice sont déplacées dans une archive en lecture seule. "
+               "Elles restent consultables dans les factures, les rapports et l'export.")
+    if st.button(f"Clôturer l'exercice {year}"):
+        try:
+            with st.spinner("Archivage…"):
+                summary = close_fiscal_year(session.get_bind(), year)
+        except ArchiveError as error:
+            st.error(str(error))
+        else:
+            st.success(f"{summary.invoices} factures de {year} archivées.")
+
+
+# قسم التشخيص (مخفي): الاستعلامات وزمن آخر إعادة تشغيل، أبطأ الاستعلامات والنسب المئوية
+def show_diagnostics(session):
+    st.title("Diagnostics")
+
+    last = st.session_state.get("last_rerun")
+    if last:
+        col1, col2, col3 = st.columns(3)
+        col1.metric(f"Dernière page: {last['name'].removeprefix('section.')}", f"{last['ms']:.1f} ms")
+        col2.metric("Requêtes SQL", last['queries'])
+        col3.metric("Temps SQL", f"{last['sql_ms']:.1f} ms")
+
+    stats = recorder.stats()
+    if not stats:
+        st.write("Aucune mesure pour le moment.")
+        return
+    st.subheader("Latences (fenêtre glissante)")
+    st.dataframe(pd.DataFrame(stats).rename(columns={'name': 'Mesure', 'count': 'Nombre'}), hide_index=True)
+
+    name = st.selectbox("Histogramme", [row['name'] for row in stats])
+    counts, edges = recorder.histogram(name)
+    if counts:
+        st.bar_chart(pd.DataFrame({'Nombre': counts}, index=[f"{edge:.2f}" for edge in edges[:-1]]))
+
+    st.subheader("Requêtes les plus lentes")
+    st.dataframe(pd.DataFrame(recorder.slowest()).rename(columns={'statement': 'Requête'}), hide_index=True)
+
+    # حالة النسخ الاحتياطية الدورية
+    if backups_enabled():
+        st.subheader("Sauvegardes")
+        scheduler = get_backup_scheduler()
+        backups = list_backups(scheduler.directory)
+        st.write(f"{len(backups)} sauvegardes, la plus récente: {backups[0].created:%Y-%m-%d %H:%M}" if backups
+                 else "Aucune sauvegarde pour le moment.")
+        if scheduler.error:
+            st.error(scheduler.error)
+
+    if st.button("Réinitialiser les mesures"):
+        recorder.reset()
+        st.rerun()
+
+
+SECTIONS = {
+    "Info": show_info,
+    "Fournisseurs": show_suppliers,
+    "Clients": show_customers,
+    "Entrée des produits": show_product_entry,
+    "Factures d'achat": show_purchases,
+    "Facturation": show_invoicing,
+    "Stock": show_stock,
+    "Afficher les factures": show_invoices,
+    "Rapports": show_reports,
+    "Exercices": show_fiscal_years,
+}
+
+# بدء النسخ الدورية مع أول تشغيل للتطبيق
+if backups_enabled():
+    get_backup_scheduler()
+
+# قسم التشخيص لا يظهر إلا بـ COMPTA_DIAGNOSTICS=1 أو ?diagnostics=1
+if DIAGNOSTICS or st.query_params.get("diagnostics") == "1":
+    SECTIONS["Diagnostics"] = show_diagnostics
+
+# التنقل بين الأقسام
+st.sidebar.title("Navigation")
+section = st.sidebar.radio(
+    "Sélectionnez une section",
+    list(SECTIONS)
+)
+
+# جلسة خاصة بكل إعادة تشغيل للصفحة، مع قياس مدتها وعدد استعلاماتها
+with recorder.span(f"section.{section}") as span, session_scope(get_engine()) as session:
+    SECTIONS[section](session)
+if section != "Diagnostics":
+    st.session_state["last_rerun"] = span.summary()
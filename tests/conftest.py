@@ -0,0 +1,55 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from comptabilite.db import get_engine, get_sessionmaker, init_db
+
+# PostgreSQL اختياري: COMPTA_TEST_POSTGRES_URL=postgresql+psycopg2://... (كل اختبار في schema مؤقت يحذف بعده)
+POSTGRES_URL = os.environ.get('COMPTA_TEST_POSTGRES_URL')
+
+
+def _postgres_schema(url):
+    try:
+        engine = create_engine(url)
+        with engine.connect():
+            pass
+    except (ImportError, SQLAlchemyError) as error:
+        pytest.skip(f"PostgreSQL injoignable: {error}")
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    return engine, schema
+
+
+# نفس الاختبارات على SQLite (ملف مؤقت) وعلى PostgreSQL إن كان متاحًا
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database_url(request, tmp_path):
+    if request.param == 'sqlite':
+        url = f"sqlite:///{tmp_path / 'store.db'}"
+        yield url
+        get_engine(url).dispose()
+        return
+    if not POSTGRES_URL:
+        pytest.skip("COMPTA_TEST_POSTGRES_URL non défini")
+    admin, schema = _postgres_schema(POSTGRES_URL)
+    url = make_url(POSTGRES_URL).update_query_dict({'options': f"-csearch_path={schema}"})
+    url = url.render_as_string(hide_password=False)
+    try:
+        yield url
+    finally:
+        get_engine(url).dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
+
+
+@pytest.fixture
+def session(database_url):
+    session = get_sessionmaker(init_db(database_url))()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,101 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+pytest.importorskip('fastapi')
+pytest.importorskip('httpx')
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from comptabilite import api, invoices  # noqa: E402
+from comptabilite.db import init_db, session_scope  # noqa: E402
+from comptabilite.invoices import CASH  # noqa: E402
+from comptabilite.models import Customer, Invoice, Product  # noqa: E402
+from comptabilite.products import enter_product  # noqa: E402
+
+
+# التطبيق على قاعدة الاختبار: جلسة لكل طلب كما في get_session
+@pytest.fixture
+def client(database_url, session):
+    engine = init_db(database_url)
+
+    def get_session():
+        with session_scope(engine) as request_session:
+            yield request_session
+
+    session.add(Customer(name='Client'))
+    session.commit()
+    enter_product(session, 'A', 'Produit A', Decimal('100.00'), Decimal('150.00'), 19, 10)
+    enter_product(session, 'B', 'Produit B', Decimal('20.00'), Decimal('30.00'), 0, 2)
+    api.app.dependency_overrides[api.get_session] = get_session
+    try:
+        yield TestClient(api.app)
+    finally:
+        api.app.dependency_overrides.clear()
+
+
+def _order(*lines, payment_method=CASH, series=''):
+    return {'customer_id': 1, 'payment_method': payment_method, 'series': series, 'lines': list(lines)}
+
+
+def test_batch_reports_a_status_per_order(client, session):
+    response = client.post('/factures/lot', json={'invoices': [
+        _order({'code': 'A', 'quantity': 2}),
+        _order({'code': 'INCONNU', 'quantity': 1}),
+        _order({'code': 'B', 'quantity': 5}),
+        _order({'code': 'A', 'quantity': 1}, payment_method='Troc'),
+        _order({'product_id': 2, 'quantity': 1}, {'code': 'A', 'quantity': 1}),
+    ]})
+    assert response.status_code == 200
+    results = response.json()
+    assert [result['status'] for result in results] == [201, 404, 409, 400, 201]
+    assert [result['index'] for result in results] == [0, 1, 2, 3, 4]
+    assert results[1]['error'] == "Produit introuvable: INCONNU"
+    assert results[0]['total_ht'] == '300.00'
+
+    session.expire_all()
+    assert session.query(Invoice).count() == 2
+    assert {product.code: product.quantity for product in session.query(Product)} == {'A': 7, 'B': 1}
+
+
+# خطأ القاعدة في فاتورة من الدفعة: معاملتها وحدها تلغى، والباقي يصدر ويبلغ عنه
+def test_batch_rolls_back_an_order_failing_in_the_database(client, session, monkeypatch):
+    next_number = invoices.next_number
+
+    def failing_next_number(session, year, series=''):
+        if series == 'ERR':
+            raise IntegrityError("INSERT INTO invoice_counters", {}, Exception("conflit"))
+        return next_number(session, year, series)
+
+    monkeypatch.setattr(invoices, 'next_number', failing_next_number)
+    response = client.post('/factures/lot', json={'invoices': [
+        _order({'code': 'A', 'quantity': 1}),
+        _order({'code': 'A', 'quantity': 4}, series='ERR'),
+        _order({'code': 'B', 'quantity': 1}),
+    ]})
+    assert [result['status'] for result in response.json()] == [201, 409, 201]
+    session.expire_all()
+    assert session.query(Invoice).count() == 2
+    assert {product.code: product.quantity for product in session.query(Product)} == {'A': 9, 'B': 1}
+
+
+@pytest.mark.parametrize('path, body', [
+    ('/factures', _order({'quantity': 1})),
+    ('/factures', _order({'code': '', 'quantity': 1})),
+    ('/achats', {'lines': [{'quantity': 1, 'unit_cost': '2.00'}]}),
+])
+def test_line_without_product_or_code_is_rejected(client, path, body):
+    response = client.post(path, json=body)
+    assert response.status_code == 422
+
+
+def test_invoice_pdf(client):
+    invoice = client.post('/factures', json=_order({'code': 'A', 'quantity': 1})).json()
+    response = client.get(f"/factures/{invoice['id']}/pdf")
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/pdf'
+    assert response.content.startswith(b'%PDF')
+    assert response.headers['content-disposition'] == (
+        f'attachment; filename="Facture_{invoice["number"].replace("/", "-")}.pdf"')
+    assert client.get('/factures/999999/pdf').status_code == 404
@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import stat
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, update
+
+from comptabilite import archive
+from comptabilite.archive import (ArchiveError, archive_engine, browse_invoices, close_fiscal_year, closable_year,
+                                  get_invoice_view)
+from comptabilite.db import init_db
+from comptabilite.invoices import CASH, issue_invoice
+from comptabilite.models import Customer, FiscalYear, Invoice, StockMovement
+from comptabilite.products import enter_product
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'ARCHIVE_DIR', str(tmp_path / 'archives'))
+    archive_engine.cache_clear()
+    yield tmp_path / 'archives'
+    archive_engine.cache_clear()
+
+
+# فاتورتان في 2024 وفاتورة بعدها، ثم إغلاق 2024
+def _closed_year(database_url, session):
+    session.add(Customer(name='Client'))
+    session.commit()
+    customer_id = session.execute(select(Customer.id)).scalar_one()
+    product = enter_product(session, 'A', 'Produit A', Decimal('100.00'), Decimal('150.00'), 19, 10)
+    invoices = [issue_invoice(session, customer_id, [(product.id, quantity)], CASH).id for quantity in (1, 2, 3)]
+    for invoice_id, day, number in ((invoices[0], datetime(2024, 3, 1), '2024/000001'),
+                                    (invoices[1], datetime(2024, 6, 1), '2024/000002')):
+        session.execute(update(Invoice).where(Invoice.id == invoice_id).values(date=day, number=number))
+        # حركات مسجلة قبل الترقيم، بمعرف الفاتورة
+        session.execute(update(StockMovement).where(StockMovement.invoice_id == invoice_id)
+                        .values(reference=str(invoice_id)))
+    session.commit()
+    assert closable_year(session) == 2024
+    summary = close_fiscal_year(init_db(database_url), 2024)
+    session.expire_all()
+    return invoices, summary
+
+
+def test_close_fiscal_year(database_url, session, archive_dir):
+    invoices, summary = _closed_year(database_url, session)
+    assert summary.invoices == 2
+    assert summary.total_ht == Decimal('450.00')
+
+    path = archive_dir / 'compta_2024.db'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o444
+    assert session.execute(select(Invoice.id)).scalars().all() == [invoices[2]]
+    assert session.execute(select(FiscalYear.year, FiscalYear.invoices)).one() == (2024, 2)
+    movements = session.execute(
+        select(StockMovement.reference).where(StockMovement.invoice_id.is_(None), StockMovement.quantity < 0)
+        .order_by(StockMovement.id)
+    ).scalars().all()
+    assert movements == ['2024/000001', '2024/000002']
+    assert closable_year(session) is None
+    with pytest.raises(ArchiveError):
+        close_fiscal_year(init_db(database_url), 2024)
+
+
+def test_browse_live_and_archived_invoices(database_url, session, archive_dir):
+    invoices, _ = _closed_year(database_url, session)
+    rows, cursor = browse_invoices(session, limit=2)
+    assert [row.id for row in rows] == [invoices[2], invoices[1]]
+    rows, cursor = browse_invoices(session, after=cursor, limit=2)
+    assert [row.number for row in rows] == ['2024/000001']
+    assert cursor is None
+    rows, _ = browse_invoices(session, number='2024/000002')
+    assert [row.id for row in rows] == [invoices[1]]
+
+    view = get_invoice_view(session, invoices[0])
+    assert view.number == '2024/000001'
+    assert view.total_ht == Decimal('150.00')
+    assert get_invoice_view(session, 999999) is None
+
+
+# أرشيف أقدم من الترقيم والدفعات: يضاف إليه ما نقص من البنية فقط، دون أي سطر جديد
+def test_reopen_outdated_archive_upgrades_schema_only(database_url, session, archive_dir):
+    invoices, _ = _closed_year(database_url, session)
+    path = archive_dir / 'compta_2024.db'
+    os.chmod(path, 0o644)
+    connection = sqlite3.connect(path)
+    with connection:
+        for statement in ("DROP TABLE purchase_lots", "DROP TABLE invoice_counters", "DROP TABLE stock_movements",
+                          "DROP INDEX ix_invoices_number", "ALTER TABLE invoices DROP COLUMN number",
+                          "ALTER TABLE invoice_items DROP COLUMN cost_cents"):
+            connection.execute(statement)
+    connection.close()
+    os.chmod(path, 0o444)
+
+    view = get_invoice_view(session, invoices[0])
+    assert view.number == str(invoices[0])
+    rows, _ = browse_invoices(session, date_to=datetime(2024, 12, 31))
+    assert [row.number for row in rows] == [str(invoices[1]), str(invoices[0])]
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o444
+    connection = sqlite3.connect(path)
+    try:
+        for table in ('purchase_lots', 'invoice_counters', 'stock_movements'):
+            assert connection.execute(f"SELECT count(*) FROM {table}").fetchone() == (0,)
+        assert connection.execute("SELECT cost_cents FROM invoice_items").fetchall() == [(None,), (None,)]
+    finally:
+        connection.close()
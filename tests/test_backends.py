@@ -0,0 +1,147 @@
+import argparse
+import io
+import os
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, select, text
+
+from comptabilite.customers import search_customers
+from comptabilite.importer import import_products
+from comptabilite.invoices import CASH, InsufficientStock, issue_invoice
+from comptabilite.models import Customer, Invoice, Product, PurchaseLot
+from comptabilite.products import enter_product
+from comptabilite.stock import list_stock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _alembic(url):
+    config = Config(os.path.join(ROOT, 'alembic.ini'))
+    config.cmd_opts = argparse.Namespace(x=[f"url={url}"])
+    return config
+
+
+# الترحيلات حتى head على قاعدة فيها فواتير ومخزون قديم: الترقيم والدفعات الافتتاحية وتكلفة السطور
+def test_alembic_upgrade_head(database_url):
+    config = _alembic(database_url)
+    command.upgrade(config, '0003')
+    engine = create_engine(database_url)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO customers (id, name) VALUES (1, 'Client')"))
+        conn.execute(text(
+            "INSERT INTO products (id, code, name, purchase_price_cents, selling_price_cents, tax_rate, quantity, entry_date)"
+            " VALUES (1, 'A', 'Produit A', 1000, 1500, 19, 8, :date)"
+        ), {'date': datetime(2025, 1, 2)})
+        for invoice_id, day in ((1, datetime(2025, 3, 1)), (2, datetime(2025, 2, 1)), (3, datetime(2026, 1, 5))):
+            conn.execute(text(
+                "INSERT INTO invoices (id, customer_id, date, payment_method, total_ht_cents, total_tax_cents,"
+                " stamp_tax_cents, total_amount_cents) VALUES (:id, 1, :date, 'Chèque', 1500, 285, 0, 1785)"
+            ), {'id': invoice_id, 'date': day})
+            conn.execute(text(
+                "INSERT INTO invoice_items (invoice_id, product_id, quantity, price_cents, tax_rate, total_ht_cents,"
+                " tax_amount_cents, total_ttc_cents) VALUES (:id, 1, 1, 1500, 19, 1500, 285, 1785)"
+            ), {'id': invoice_id})
+    engine.dispose()
+
+    command.upgrade(config, 'head')
+    command.check(config)
+
+    engine = create_engine(database_url)
+    with engine.connect() as conn:
+        numbers = conn.execute(text("SELECT id, number FROM invoices ORDER BY id")).all()
+        counters = conn.execute(text("SELECT year, series, last_number FROM invoice_counters ORDER BY year")).all()
+        lots = conn.execute(text("SELECT product_id, quantity, remaining, unit_cost_cents FROM purchase_lots")).all()
+        stock_value = conn.execute(text("SELECT stock_value_cents FROM products")).scalar_one()
+        costs = conn.execute(text("SELECT cost_cents FROM invoice_items")).scalars().all()
+    engine.dispose()
+    assert [tuple(row) for row in numbers] == [(1, '2025/000002'), (2, '2025/000001'), (3, '2026/000001')]
+    assert [tuple(row) for row in counters] == [(2025, '', 2), (2026, '', 1)]
+    assert [tuple(row) for row in lots] == [(1, 8, 8, 1000)]
+    assert stock_value == 8000
+    assert costs == [1000, 1000, 1000]
+
+    command.downgrade(config, 'base')
+
+
+def test_issue_invoice(session):
+    session.add(Customer(name='Client'))
+    session.commit()
+    customer_id = session.execute(select(Customer.id)).scalar_one()
+    product = enter_product(session, 'A', 'Produit A', Decimal('100.00'), Decimal('150.00'), 19, 10)
+
+    invoice = issue_invoice(session, customer_id, [(product.id, 3)], CASH)
+    assert invoice.number == f"{datetime.now().year}/000001"
+    assert invoice.total_ht == Decimal('450.00')
+    assert [item.cost for item in invoice.items] == [Decimal('300.00')]
+
+    with pytest.raises(InsufficientStock):
+        issue_invoice(session, customer_id, [(product.id, 8)], CASH)
+    session.expire_all()
+    assert session.get(Product, product.id).quantity == 7
+    assert session.execute(select(Invoice.number)).scalars().all() == [invoice.number]
+
+
+# الاستيراد الثاني لنفس الرموز يمر بـ ON CONFLICT: تحديث ثمن الشراء وزيادة الرصيد دون تكرار السلع
+def test_import_products_upserts_existing_codes(session):
+    header = "code,nom,prix_achat,prix_vente,taux_tva,quantite,numero_facture_achat\n"
+    first = import_products(session, io.BytesIO((header + "A,Produit A,10,15,19,4,F1\nB,Produit B,20,30,9,2,F1\n").encode()),
+                            'produits.csv')
+    second = import_products(session, io.BytesIO((header + "A,Produit A,12,15,19,6,F2\nC,Produit C,5,8,0,1,F2\n").encode()),
+                             'produits.csv')
+    assert (first.imported, second.imported) == (2, 2)
+    assert first.errors.empty and second.errors.empty
+
+    session.expire_all()
+    products = {product.code: product for product in session.execute(select(Product)).scalars()}
+    assert sorted(products) == ['A', 'B', 'C']
+    assert products['A'].quantity == 10
+    assert products['A'].purchase_price == Decimal('12.00')
+    assert products['A'].stock_value == Decimal('112.00')
+    assert products['A'].purchase_invoice_number == 'F2'
+    lots = session.execute(
+        select(PurchaseLot.quantity, PurchaseLot.unit_cost).where(PurchaseLot.product_id == products['A'].id)
+        .order_by(PurchaseLot.id)
+    ).all()
+    assert [tuple(lot) for lot in lots] == [(4, Decimal('10.00')), (6, Decimal('12.00'))]
+
+
+# رمز مكرر في نفس الدفعة: سلعة واحدة بآخر ثمن شراء، ودفعة مخزون لكل سطر
+def test_import_products_with_repeated_code_in_a_chunk(session):
+    header = "code,nom,prix_achat,prix_vente,taux_tva,quantite,numero_facture_achat\n"
+    result = import_products(session, io.BytesIO((header + "A,Produit A,10,15,19,4,F1\nA,Produit A,12,15,19,6,F2\n").encode()),
+                             'produits.csv')
+    assert result.imported == 2 and result.errors.empty
+
+    session.expire_all()
+    product = session.execute(select(Product)).scalar_one()
+    assert product.quantity == 10
+    assert product.purchase_price == Decimal('12.00')
+    assert product.purchase_invoice_number == 'F2'
+    assert product.stock_value == Decimal('112.00')
+    lots = session.execute(select(PurchaseLot.quantity, PurchaseLot.unit_cost).order_by(PurchaseLot.id)).all()
+    assert [tuple(lot) for lot in lots] == [(4, Decimal('10.00')), (6, Decimal('12.00'))]
+
+
+# بداية الرمز في المخزن: مجال على الفهرس، و % و _ حرفان عاديان
+def test_list_stock_searches_code_prefix(session):
+    for code, name in (('AB-1', 'Vis'), ('A_B', 'Clou'), ('AXB', 'Ecrou'), ('B%1', 'Boulon'), ('BZ1', 'Rondelle')):
+        enter_product(session, code, name, Decimal('1.00'), Decimal('2.00'), 19, 1)
+    assert {row.code for row in list_stock(session, 'A')[0]} == {'A_B', 'AB-1', 'AXB'}
+    assert [row.code for row in list_stock(session, 'A_')[0]] == ['A_B']
+    assert [row.code for row in list_stock(session, 'B%')[0]] == ['B%1']
+    assert [row.code for row in list_stock(session, 'ron')[0]] == ['BZ1']
+
+
+# الاسم في أي موضع: \ و % و _ في البحث حروف عادية
+def test_search_customers_escapes_like_wildcards(session):
+    names = ['Remise 50% Sud', 'Remise 500 Sud', 'Sarl_X', 'SarlAX', 'Dossier C:\\Temp', 'Dossier C:Temp']
+    session.add_all([Customer(name=name) for name in names])
+    session.commit()
+    assert [row.name for row in search_customers(session, '0%')] == ['Remise 50% Sud']
+    assert [row.name for row in search_customers(session, 'l_x')] == ['Sarl_X']
+    assert [row.name for row in search_customers(session, ':\\t')] == ['Dossier C:\\Temp']
+    assert len(search_customers(session, 's')) == len(names)
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from comptabilite import backup as backups
+from comptabilite.backup import BackupError, BackupScheduler, backup, list_backups, prune, restore, verify
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _database(path, rows):
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS lignes (id INTEGER PRIMARY KEY, contenu BLOB)")
+        connection.executemany("INSERT OR REPLACE INTO lignes VALUES (?, ?)", rows)
+    connection.close()
+
+
+def _contents(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT id, contenu FROM lignes ORDER BY id").fetchall()
+    finally:
+        connection.close()
+
+
+def _blocks_on_disk(directory):
+    return {name.removesuffix('.z') for _, _, files in os.walk(os.path.join(directory, 'blocks')) for name in files}
+
+
+# قاعدة من عدة كتل، ثم تعديل سطر واحد: النسختان تتقاسمان أغلب الكتل
+def _two_backups(tmp_path):
+    database = tmp_path / 'store.db'
+    directory = str(tmp_path / 'sauvegardes')
+    url = f"sqlite:///{database}"
+    _database(database, [(index, os.urandom(4000)) for index in range(200)])
+    first, first_written = backup(url, directory)
+    before = _contents(database)
+    _database(database, [(7, b'modifie')])
+    second, second_written = backup(url, directory)
+    return url, directory, before, (first, first_written), (second, second_written)
+
+
+def test_backup_writes_only_new_blocks(tmp_path):
+    _, directory, _, (first, first_written), (second, second_written) = _two_backups(tmp_path)
+    shared = set(first.blocks) & set(second.blocks)
+    assert first_written == len(set(first.blocks))
+    assert shared
+    assert second_written == len(set(second.blocks) - shared)
+    assert [item.name for item in list_backups(directory)] == [second.name, first.name]
+    assert verify(first.name, directory) == first
+    assert verify(None, directory) == second
+
+
+def test_prune_keeps_blocks_shared_with_remaining_backups(tmp_path):
+    _, directory, _, (first, _), (second, _) = _two_backups(tmp_path)
+    removed = prune(directory, keep=1, days=0)
+    assert [item.name for item in removed] == [first.name]
+    assert _blocks_on_disk(directory) == set(second.blocks)
+    verify(second.name, directory)
+
+
+def test_restore_rebuilds_and_replaces_database(tmp_path):
+    url, directory, before, (first, _), _ = _two_backups(tmp_path)
+    restore(first.name, url, directory)
+    assert _contents(url.removeprefix('sqlite:///')) == before
+
+
+def test_verify_detects_corrupted_block(tmp_path):
+    _, directory, _, (first, _), _ = _two_backups(tmp_path)
+    digest = first.blocks[0]
+    with open(os.path.join(directory, 'blocks', digest[:2], f"{digest}.z"), 'wb') as block_file:
+        block_file.write(b'abime')
+    with pytest.raises(BackupError):
+        verify(first.name, directory)
+
+
+# تنظيف من عملية أخرى (سطر الأوامر) ينتظر انتهاء نسخة جارية في هذه العملية
+def test_prune_in_another_process_waits_for_the_lock(tmp_path):
+    _, directory, _, _, _ = _two_backups(tmp_path)
+    code = f"from comptabilite.backup import prune; prune({directory!r}, keep=1, days=0)"
+    with backups._locked(directory):
+        other = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT)
+        time.sleep(1)
+        assert other.poll() is None
+        assert len(list_backups(directory)) == 2
+    assert other.wait(timeout=30) == 0
+    assert len(list_backups(directory)) == 1
+
+
+def test_scheduler_records_unexpected_errors(tmp_path, monkeypatch):
+    def failing_backup(url, directory):
+        raise RuntimeError("panne inattendue")
+
+    monkeypatch.setattr(backups, 'backup', failing_backup)
+    scheduler = BackupScheduler(f"sqlite:///{tmp_path / 'store.db'}", str(tmp_path / 'sauvegardes'), interval=3600)
+    scheduler.run_once()
+    assert "panne inattendue" in scheduler.error
@@ -0,0 +1,120 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, update
+
+from comptabilite.costing import FIFO, WEIGHTED_AVERAGE, consume_lots, cost_sold_items
+from comptabilite.invoices import CASH, issue_invoice
+from comptabilite.models import Customer, InvoiceItem, Product, PurchaseInvoice, PurchaseLot, Supplier
+from comptabilite.products import enter_product
+from comptabilite.purchases import PurchaseError, get_purchase_invoice, list_purchase_invoices, record_purchase
+
+
+# بيع كما في issue_invoice: خصم الرصيد أولاً ثم استهلاك الدفعات بالطريقة المطلوبة
+def _sell(session, product_id, quantity, method):
+    session.execute(update(Product).where(Product.id == product_id).values(quantity=Product.quantity - quantity))
+    cost = consume_lots(session, {product_id: quantity}, method)[product_id]
+    session.commit()
+    return Decimal(cost).scaleb(-2)
+
+
+def _state(session, product_id):
+    session.expire_all()
+    product = session.get(Product, product_id)
+    remaining = session.execute(
+        select(PurchaseLot.remaining).where(PurchaseLot.product_id == product_id).order_by(PurchaseLot.id)
+    ).scalars().all()
+    return product.quantity, product.stock_value, remaining
+
+
+# دفعتان بسعرين، بيع، دفعة ثالثة، ثم بيع ثان: الدفعات تستهلك بالأقدم أولاً في الطريقتين،
+# والتكلفة وقيمة المخزون حسب الطريقة
+@pytest.mark.parametrize('method, first_cost, first_value, second_cost, second_value', [
+    (FIFO, Decimal('165.00'), Decimal('65.00'), Decimal('79.00'), Decimal('56.00')),
+    (WEIGHTED_AVERAGE, Decimal('172.50'), Decimal('57.50'), Decimal('76.50'), Decimal('51.00')),
+])
+def test_consume_lots_after_mixed_receipts_and_sales(session, method, first_cost, first_value, second_cost,
+                                                     second_value):
+    product = enter_product(session, 'A', 'Produit A', Decimal('10.00'), Decimal('20.00'), 19, 10)
+    record_purchase(session, None, 'F-2', [(product.id, 10, Decimal('13.00'))])
+
+    assert _sell(session, product.id, 15, method) == first_cost
+    assert _state(session, product.id) == (5, first_value, [0, 5])
+
+    record_purchase(session, None, 'F-3', [(product.id, 5, Decimal('14.00'))])
+    assert _sell(session, product.id, 6, method) == second_cost
+    assert _state(session, product.id) == (4, second_value, [0, 0, 4])
+
+
+# متوسط غير منته: التقريب إلى السنتيم لا يترك قيمة عند نفاد المخزون
+def test_weighted_average_rounding_empties_stock_value(session):
+    product = enter_product(session, 'A', 'Produit A', Decimal('10.00'), Decimal('20.00'), 19, 1)
+    record_purchase(session, None, 'F-2', [(product.id, 2, Decimal('0.00'))])
+
+    assert _sell(session, product.id, 1, WEIGHTED_AVERAGE) == Decimal('3.33')
+    assert _state(session, product.id) == (2, Decimal('6.67'), [0, 2])
+    assert _sell(session, product.id, 2, WEIGHTED_AVERAGE) == Decimal('6.67')
+    assert _state(session, product.id) == (0, Decimal('0.00'), [0, 0])
+
+
+def test_consume_lots_rejects_unknown_method(session):
+    product = enter_product(session, 'A', 'Produit A', Decimal('10.00'), Decimal('20.00'), 19, 1)
+    with pytest.raises(ValueError):
+        consume_lots(session, {product.id: 1}, 'lifo')
+
+
+# نفس الرقم ونفس المورد يكمل الفاتورة، ومورد آخر أو فاتورة دون رقم تنشئ فاتورة جديدة
+def test_record_purchase_appends_to_supplier_invoice(session):
+    session.add_all([Supplier(name='Fournisseur 1'), Supplier(name='Fournisseur 2')])
+    session.commit()
+    first, second = session.execute(select(Supplier.id).order_by(Supplier.id)).scalars().all()
+    a = enter_product(session, 'A', 'Produit A', Decimal('10.00'), Decimal('20.00'), 19, 0)
+    b = enter_product(session, 'B', 'Produit B', Decimal('5.00'), Decimal('8.00'), 9, 0)
+
+    invoice = record_purchase(session, first, 'F-1', [(a.id, 2, Decimal('5.00'))])
+    assert record_purchase(session, first, 'F-1', [(b.id, 3, Decimal('7.00'))]).id == invoice.id
+    assert record_purchase(session, second, 'F-1', [(a.id, 1, Decimal('6.00'))]).id != invoice.id
+    assert record_purchase(session, first, None, [(a.id, 1, Decimal('6.00'))]).id != invoice.id
+
+    session.expire_all()
+    lots = get_purchase_invoice(session, invoice.id).lots
+    assert [(lot.product.code, lot.quantity, lot.unit_cost) for lot in lots] == [
+        ('A', 2, Decimal('5.00')), ('B', 3, Decimal('7.00'))]
+    summary = {row.id: row for row in list_purchase_invoices(session, supplier_id=first)}
+    assert (summary[invoice.id].lines, summary[invoice.id].total) == (2, Decimal('31.00'))
+    assert session.get(Product, a.id).quantity == 4
+    assert session.get(Product, b.id).stock_value == Decimal('21.00')
+
+
+def test_record_purchase_rejects_invalid_lines(session):
+    product = enter_product(session, 'A', 'Produit A', Decimal('10.00'), Decimal('20.00'), 19, 0)
+    for supplier_id, lines in ((None, []), (None, [(product.id, 0, Decimal('1.00'))]),
+                               (None, [(product.id, 1, Decimal('-1.00'))]), (999, [(product.id, 1, Decimal('1.00'))]),
+                               (None, [(999, 1, Decimal('1.00'))])):
+        with pytest.raises(PurchaseError):
+            record_purchase(session, supplier_id, 'F-1', lines)
+    assert session.execute(select(PurchaseInvoice)).first() is None
+    assert session.execute(select(PurchaseLot)).first() is None
+
+
+# سطور بيعت قبل تتبع الدفعات (تكلفة فارغة): آخر ثمن شراء، والسطور التي لها تكلفة لا تتغير
+def test_cost_sold_items_on_legacy_lines(session):
+    session.add(Customer(name='Client'))
+    session.commit()
+    customer_id = session.execute(select(Customer.id)).scalar_one()
+    a = enter_product(session, 'A', 'Produit A', Decimal('8.00'), Decimal('20.00'), 19, 10)
+    b = enter_product(session, 'B', 'Produit B', Decimal('5.00'), Decimal('8.00'), 9, 10)
+    legacy = issue_invoice(session, customer_id, [(a.id, 3), (b.id, 2)], CASH)
+    costed = issue_invoice(session, customer_id, [(a.id, 1)], CASH)
+    session.execute(update(InvoiceItem).where(InvoiceItem.invoice_id == legacy.id).values(cost=None))
+    session.execute(update(Product).where(Product.id == b.id).values(purchase_price=None))
+    session.execute(update(Product).where(Product.id == a.id).values(purchase_price=Decimal('9.00')))
+    session.commit()
+
+    cost_sold_items(session.connection())
+    session.commit()
+    costs = session.execute(
+        select(InvoiceItem.invoice_id, InvoiceItem.product_id, InvoiceItem.cost).order_by(InvoiceItem.id)
+    ).all()
+    assert [tuple(row) for row in costs] == [
+        (legacy.id, a.id, Decimal('27.00')), (legacy.id, b.id, Decimal('0.00')), (costed.id, a.id, Decimal('8.00'))]
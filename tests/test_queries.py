@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from comptabilite.db import bootstrap, get_sessionmaker
+from comptabilite.instrumentation import instrument_engine, recorder
+from comptabilite.invoices import CASH, get_invoice, issue_invoice
+from comptabilite.models import Customer
+from comptabilite.products import enter_product, get_products_by_codes, search_products
+
+
+# قاعدة في الذاكرة لكل اختبار، مع عد الاستعلامات كما في التطبيق
+@pytest.fixture
+def session():
+    engine = instrument_engine(create_engine('sqlite://', poolclass=StaticPool))
+    bootstrap(engine)
+    session = get_sessionmaker(engine)()
+    customer = Customer(name='Client')
+    session.add(customer)
+    session.commit()
+    for index in range(30):
+        enter_product(session, f"P{index:03d}", f"Produit {index}", 100, 150, 19, 10)
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _issue(session, line_count):
+    products = get_products_by_codes(session, [f"P{index:03d}" for index in range(line_count)])
+    invoice_id = issue_invoice(session, 1, [(product.id, 1) for product in products.values()], CASH).id
+    session.expunge_all()
+    return invoice_id
+
+
+# الفاتورة والزبون في استعلام، والسطور ومنتجاتها في استعلام ثانٍ، مهما كان عدد السطور
+@pytest.mark.parametrize('line_count', [1, 5, 30])
+def test_get_invoice_runs_two_statements(session, line_count):
+    invoice_id = _issue(session, line_count)
+    with recorder.span('test.get_invoice') as span:
+        invoice = get_invoice(session, invoice_id)
+        lines = [(item.product.code, item.quantity) for item in invoice.items]
+        customer = invoice.customer.name
+    assert len(lines) == line_count
+    assert customer == 'Client'
+    assert span.queries == 2
+
+
+def test_get_products_by_codes_runs_one_statement(session):
+    codes = [f"P{index:03d}" for index in range(0, 30, 3)] + ['INCONNU']
+    session.expunge_all()
+    with recorder.span('test.get_products_by_codes') as span:
+        products = get_products_by_codes(session, codes)
+    assert sorted(products) == sorted(codes[:-1])
+    assert span.queries == 1
+
+
+def test_get_products_by_codes_without_codes_runs_no_statement(session):
+    with recorder.span('test.get_products_by_codes') as span:
+        assert get_products_by_codes(session, []) == {}
+    assert span.queries == 0
+
+
+# البحث بالاسم: الرموز ثم FTS ثم السلع، ووجود الفهرس لا يعاد فحصه في كل بحث
+def test_search_products_by_name_runs_three_statements(session):
+    search_products(session, 'Produit')
+    with recorder.span('test.search_products') as span:
+        products = search_products(session, 'Produit 2')
+    assert products[0].name == 'Produit 2'
+    assert span.queries == 3